@@ -1,63 +1,180 @@
+import time
+_import_started = time.perf_counter()  # Untuk laporan waktu startup
+import hmac
 import logging
+import threading
 from fastapi import FastAPI, Form, Response, Request
+from fastapi.responses import JSONResponse
 from twilio.twiml.messaging_response import MessagingResponse
-from a2a_sdk.client import A2AClient
-from a2a_sdk.server import A2AServer
-from a2a_sdk.models import AgentCard
-from langgraph.graph import StateGraph  # Sudah ada di graph.py
 
 # Import dari file lain
-from config import twilio_client, rate_limits, TWILIO_WHATSAPP_NUMBER
+from config import twilio_client, snap, cipher_suite, WARMUP_ON_STARTUP, MESSAGE_DEBOUNCE_SECONDS, REPLY_MODE, ADMIN_TOKEN
 from database import init_db
-from graph import compiled_graph
-from tools import llm, product_tool, order_tool, faq_tool, user_preferences, full_histories, used_follow_ups, system_prompt_id, system_prompt_en, variasi_templates, negative_keywords_id, negative_keywords_en, follow_up_templates_id, follow_up_templates_en
-from utils import encrypt_text, decrypt_text, moderate_content, notify_agent, detect_negative_emotion, vary_response, add_emojis_and_formatting, choose_follow_up, download_twilio_image, send_whatsapp_message, pre_process_message  # Tambah import pre_process_message
+from models import close_async_db
+from prompts import overloaded_reply_id, system_prompt_id, system_prompt_en, variasi_templates, negative_keywords_id, negative_keywords_en, follow_up_templates_id, follow_up_templates_en
+from utils import moderate_content, notify_agent, detect_negative_emotion, vary_response, add_emojis_and_formatting, choose_follow_up, send_whatsapp_message, asend_whatsapp_text, pre_process_message  # Tambah import pre_process_message
+from async_clients import close_clients
+from fast_path import answer_fast_path, record_route
+from payment_outbox import start_payment_workers
+from faq_watcher import start_faq_watcher, reload_faq
+from media import prepare_twilio_image, media_cache
+from state_backend import user_state
+from coalescer import MessageCoalescer
+from reply_pool import create_reply_pool
+from reservations import start_reservation_sweeper, verify_midtrans_signature, handle_payment_notification
+from lazy import Lazy, record_timing, timed, warm_up, startup_report
+import metrics
 # Hapus langdetect
 # import langdetect 
-import time
-import openai
-from langchain_core.messages import HumanMessage
+import asyncio
 
 app = FastAPI()
 logging.basicConfig(level=logging.INFO)
 
-# Init DB sekali di awal
-init_db()
+def _load_compiled_graph():
+    from graph import compiled_graph  # langgraph + langchain (~0.4 detik) baru di-import saat graph dibutuhkan
+    return compiled_graph.get()
+
+compiled_graph = Lazy("graph", _load_compiled_graph)
+record_timing("import app", time.perf_counter() - _import_started)
+
+def warm_up_components():
+    """Bangun komponen lazy di background supaya request pertama tidak menunggu."""
+    warm_up(cipher_suite, twilio_client, snap, compiled_graph)
+    import graph, tools
+    report = warm_up(tools.llm, graph.llm_with_tools, tools.faq_retriever)
+    logging.info(f"Warm-up selesai (ms): {report}")
+
+@app.on_event("startup")
+async def start_background_jobs():
+    with timed("init_db"):
+        init_db()  # Init DB sekali saat startup, bukan saat import
+    start_reservation_sweeper()  # Lepas stok dari pesanan yang tidak dibayar
+    start_payment_workers()  # Buat link Midtrans di luar request webhook
+    start_faq_watcher()  # faq.txt diubah -> retriever di-reload tanpa restart
+    if WARMUP_ON_STARTUP:
+        threading.Thread(target=warm_up_components, daemon=True).start()
+    logging.info(f"Startup (ms): {startup_report()}")
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")  # Template route, bukan URL mentah (label tetap sedikit)
+        metrics.http_request_seconds.observe(time.perf_counter() - started, route=route.path if route else "unmatched",
+                                             method=request.method, status=status)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Metrik format teks Prometheus: latensi node/tool/DB/HTTP, panggilan dan token LLM."""
+    content = await asyncio.to_thread(metrics.render)  # Collector outbox query DB
+    return Response(content=content, media_type="text/plain; version=0.0.4")
+
+@app.get("/startup")
+async def startup_timings():
+    """Waktu inisialisasi per komponen (ms), untuk memantau cold start."""
+    return startup_report()
+
+@app.post("/admin/faq/reload")
+async def admin_reload_faq(request: Request):
+    """Reload faq.txt tanpa restart (worker ini saja; worker lain lewat watcher mtime).
+
+    Response berisi "vector_error" kalau index vektor gagal dibuat dan FAQ turun ke mode lexical.
+    """
+    if not ADMIN_TOKEN or not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        return Response(status_code=403)
+    try:
+        return await asyncio.to_thread(reload_faq)  # Embed chunk berubah di thread, event loop tetap melayani
+    except Exception as e:
+        logging.error(f"Reload FAQ gagal: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@app.on_event("shutdown")
+async def shutdown_clients():
+    if message_coalescer is not None:
+        await message_coalescer.drain()  # Jangan buang pesan yang masih ditahan
+    if reply_pool is not None:
+        await reply_pool.drain()
+    await close_clients()
+    await close_async_db()
+
+@app.post("/midtrans/notification")
+async def midtrans_notification(request: Request):
+    """Notifikasi status pembayaran dari Midtrans: lunas -> paid, gagal/kedaluwarsa -> stok dilepas."""
+    try:
+        notification = await request.json()
+    except ValueError:  # JSONDecodeError / body bukan UTF-8
+        return Response(status_code=400)
+    if not isinstance(notification, dict):
+        return Response(status_code=400)
+    if not verify_midtrans_signature(notification):
+        logging.warning(f"Signature notifikasi Midtrans tidak valid: {notification.get('order_id')}")
+        return Response(status_code=403)
+    status = await asyncio.to_thread(handle_payment_notification, notification)
+    logging.info(f"Notifikasi Midtrans {notification.get('order_id')}: {notification.get('transaction_status')} -> {status}")
+    return {"status": "ok"}
+
+async def reply_via_rest(user_number: str, user_message: str, media_url: str = None):
+    """Proses satu giliran lalu kirim balasannya lewat REST API Twilio (bukan TwiML)."""
+    response_text, _ = await handle_message(user_number, user_message, media_url)
+    await asend_whatsapp_text(user_number, response_text)
+
+async def reply_overloaded(user_number: str):
+    await asend_whatsapp_text(user_number, overloaded_reply_id)
+
+# Mode ack-then-reply (REPLY_MODE=async): giliran dikerjakan worker pool dengan batas paralel
+reply_pool = create_reply_pool(reply_via_rest, reply_overloaded) if REPLY_MODE == "async" else None
+
+async def submit_turn(user_number: str, user_message: str, media_url: str = None):
+    reply_pool.submit(user_number, user_message, media_url)
+
+# Mode debounce (MESSAGE_DEBOUNCE_SECONDS > 0): pesan beruntun digabung per nomor
+message_coalescer = (MessageCoalescer(submit_turn if reply_pool is not None else reply_via_rest)
+                     if MESSAGE_DEBOUNCE_SECONDS > 0 else None)
+
+def empty_twiml(served_by: str) -> Response:
+    """Ack tanpa isi: balasan menyusul lewat REST API Twilio."""
+    return Response(content=str(MessagingResponse()), media_type="application/xml", headers={"X-Served-By": served_by})
 
 @app.post("/whatsapp")
 async def whatsapp_webhook(request: Request, From: str = Form(...), Body: str = Form(None), MediaUrl0: str = Form(None)):
-    user_message = Body
-    user_number = From
-    logging.info(f"Pesan diterima dari {user_number}: '{user_message}'")
-    
+    logging.info(f"Pesan diterima dari {From}: '{Body}'")
+    if message_coalescer is not None:
+        # Dibalas lewat REST API setelah jendela debounce; gambar langsung diproses bersama teks yang ditahan
+        message_coalescer.add(From, Body, MediaUrl0)
+        return empty_twiml("coalesced")
+    if reply_pool is not None:
+        return empty_twiml("queued" if reply_pool.submit(From, Body, MediaUrl0) else "shed")
+
+    response_text, served_by = await handle_message(From, Body, MediaUrl0)
     messaging_response = MessagingResponse()
+    send_whatsapp_message(response_text, messaging_response)
+    return Response(content=str(messaging_response), media_type="application/xml", headers={"X-Served-By": served_by})
 
-    # Rate limiting & Moderasi (tidak berubah)
-    current_time = time.time()
-    if user_number not in rate_limits:
-        rate_limits[user_number] = {'count': 0, 'last_time': current_time}
-    if current_time - rate_limits[user_number]['last_time'] > 60:
-        rate_limits[user_number] = {'count': 0, 'last_time': current_time}
-    rate_limits[user_number]['count'] += 1
-    if rate_limits[user_number]['count'] > 5:
-        messaging_response.message("Maaf, terlalu banyak pesan dalam waktu singkat. Coba lagi nanti, Kak!")
-        return Response(content=str(messaging_response), media_type="application/xml")
+async def handle_message(user_number: str, user_message: str, media_url: str = None):
+    """Proses satu giliran pelanggan. Return (teks balasan, jalur yang melayani)."""
+    # Rate limiting + state pelanggan + ringkasan riwayat: satu kali baca backend, di thread (SQLite memblok)
+    turn = await asyncio.to_thread(user_state.load_turn, user_number)
+    if not turn.allowed:
+        return "Maaf, terlalu banyak pesan dalam waktu singkat. Coba lagi nanti, Kak!", "rate_limited"
     if moderate_content(user_message):
-        messaging_response.message("Maaf, pesan Anda tidak sesuai, Kak. Coba pesan lain ya!")
-        return Response(content=str(messaging_response), media_type="application/xml")
+        return "Maaf, pesan Anda tidak sesuai, Kak. Coba pesan lain ya!", "moderated"
 
     # --- PERBAIKAN 1: Hapus deteksi bahasa, asumsikan 'id' ---
     detected_lang = 'id'
     system_prompt = system_prompt_id
     # -----------------------------------------------------------
 
-    # Riwayat Chat & Preferensi Pengguna (termasuk last_product)
-    if user_number in full_histories and full_histories[user_number]:
-        history_summary = "\nRiwayat chat: " + ' '.join([f"Pelanggan: {decrypt_text(h[0])} | Respons: {decrypt_text(h[1])}" for h in full_histories[user_number][-3:]])
-        system_prompt += history_summary
-    if user_number not in user_preferences:
-        user_preferences[user_number] = {'name': None, 'favorites': [], 'last_product': None}
-    pref = user_preferences[user_number]
+    # Riwayat Chat & Preferensi Pengguna (termasuk last_product), sudah dimuat bersama rate limit
+    state = turn.state
+    if turn.history_summary:
+        system_prompt += "\nRiwayat chat: " + turn.history_summary
+    pref = state['preferences']
     if pref['name']:
         system_prompt += f"\nGunakan nama pelanggan '{pref['name']}' dalam sapaan, misalnya 'Halo Kak {pref['name']}'."
     if "nama saya" in user_message.lower():
@@ -77,23 +194,34 @@ async def whatsapp_webhook(request: Request, From: str = Form(...), Body: str =
             user_message = f"{pref['last_product']} {user_message}"
 
     response_text = ""
+    served_by = "graph"
     is_negative = detect_negative_emotion(user_message, detected_lang)
 
     # Penanganan Gambar (kode lengkap Anda dipertahankan)
-    if MediaUrl0:
-        logging.info(f"Memproses media dari: {MediaUrl0}")
-        base64_image = download_twilio_image(MediaUrl0)
-        if base64_image:
-            image_prompt = """
+    if media_url:
+        served_by = "vision"
+        logging.info(f"Memproses media dari: {media_url}")
+        image = await prepare_twilio_image(media_url)  # Streaming, dibatasi ukurannya, diperkecil, di-cache
+        if image:
+            base64_image = image['base64']
+            # Webhook yang di-retry / gambar yang sama tidak dianalisis ulang
+            cached_analysis = media_cache.get_analysis(image['sha256'], user_message or "")
+            if cached_analysis is not None:
+                response_text = cached_analysis
+            else:
+                image_prompt = """
 Anda adalah agen CS UrbanStyle ID yang ramah... (dst, prompt gambar Anda)
-            """.format(user_message=user_message)
-            system_message_with_image = { "role": "user", "content": [ ... ] } # Disingkat
-            try:
-                response = openai.chat.completions.create(...) # Disingkat
-                response_text = response.choices[0].message.content
-            except Exception as e:
-                logging.error(f"Error saat analisis gambar: {e}")
-                response_text = "Maaf, gambar tidak dapat dianalisis. Bisa jelaskan masalahnya, Kak?"
+                """.format(user_message=user_message)
+                system_message_with_image = { "role": "user", "content": [ ... ] } # Disingkat
+                try:
+                    import openai  # Jarang dipakai: jangan dibayar saat import app
+                    with metrics.llm_call("vision") as record:
+                        response = record(openai.chat.completions.create(...)) # Disingkat
+                    response_text = response.choices[0].message.content
+                    media_cache.set_analysis(image['sha256'], user_message or "", response_text)
+                except Exception as e:
+                    logging.error(f"Error saat analisis gambar: {e}")
+                    response_text = "Maaf, gambar tidak dapat dianalisis. Bisa jelaskan masalahnya, Kak?"
         else:
             response_text = "Maaf, gambar tidak dapat diproses, Kak."
     
@@ -102,20 +230,32 @@ Anda adalah agen CS UrbanStyle ID yang ramah... (dst, prompt gambar Anda)
         try:
             # Tambah pre-processing sebelum graph
             processed_message = pre_process_message(user_message)
-            graph_input = {"messages": [HumanMessage(content=processed_message)], "user_number": user_number, "is_ambiguous": False, "needs_reflection": False}  # Init flag
-            config = {"configurable": {"thread_id": user_number}}
-            graph_output = compiled_graph.invoke(graph_input, config=config)
+
+            # Fast path: stok/warna produk katalog dijawab langsung dari DB tanpa LLM
+            fast_answer = await answer_fast_path(processed_message)
+            if fast_answer is not None:
+                served_by = "fast_path"
+                raw_response, is_ambiguous = fast_answer, False
+            else:
+                if not compiled_graph.loaded:
+                    await asyncio.to_thread(compiled_graph.get)  # Import + build pertama jangan tahan event loop
+                from langchain_core.messages import HumanMessage
+                graph_input = {"messages": [HumanMessage(content=processed_message)], "user_number": user_number, "is_ambiguous": False, "needs_reflection": False}  # Init flag
+                config = {"configurable": {"thread_id": user_number}}
+                with metrics.track_request():  # Panggilan + token LLM per pesan
+                    graph_output = await compiled_graph.ainvoke(graph_input, config=config)  # Async: tidak memblok event loop
+                raw_response, is_ambiguous = graph_output["messages"][-1].content, graph_output.get('is_ambiguous', False)
             
             # Handle berdasarkan state (baru: kalau ambiguous, balas clarify langsung)
-            if graph_output.get('is_ambiguous', False):
-                response_text = graph_output["messages"][-1].content  # Dari clarify node
+            if is_ambiguous:
+                response_text = raw_response  # Dari clarify node
             else:
-                response_text = graph_output["messages"][-1].content
+                response_text = raw_response
                 response_text = vary_response(response_text, user_message)
                 response_text = add_emojis_and_formatting(response_text, is_negative)
                 
                 if not is_negative and "Coba" not in response_text and "yuk!" not in response_text:
-                    follow_up = choose_follow_up(detected_lang, user_message, response_text, user_number)
+                    follow_up = choose_follow_up(detected_lang, user_message, response_text, user_number, state['follow_ups'])
                     if follow_up:
                         response_text += f" {follow_up}"
                 
@@ -149,11 +289,10 @@ Anda adalah agen CS UrbanStyle ID yang ramah... (dst, prompt gambar Anda)
             pref['last_product'] = name
         except: pass
 
-    full_histories.setdefault(user_number, []).append((encrypt_text(user_message), encrypt_text(response_text)))
+    await asyncio.to_thread(user_state.save_turn, turn, user_message, response_text)  # State + riwayat: satu transaksi
     logging.info(f"Teks balasan final yang akan dikirim: {response_text}")
-    send_whatsapp_message(response_text, messaging_response)
-    
-    return Response(content=str(messaging_response), media_type="application/xml")
+    record_route(served_by, user_number)
+    return response_text, served_by
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,29 @@
+import httpx
+from config import TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN
+
+# Client dibuat sekali lalu dipakai ulang supaya koneksi di-pool
+_http_client = None
+_twilio_async_client = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """AsyncClient bersama untuk semua request HTTP keluar (media Twilio)."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=httpx.Timeout(15.0, connect=5.0), follow_redirects=True)
+    return _http_client
+
+def get_twilio_async_client():
+    """Client Twilio dengan http client async, dipakai untuk messages.create_async."""
+    global _twilio_async_client
+    if _twilio_async_client is None:
+        from twilio.rest import Client as TwilioClient  # Import di sini: twilio berat, belum tentu dipakai
+        from twilio.http.async_http_client import AsyncTwilioHttpClient
+        _twilio_async_client = TwilioClient(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, http_client=AsyncTwilioHttpClient())
+    return _twilio_async_client
+
+async def close_clients():
+    """Tutup koneksi yang di-pool (dipanggil saat shutdown app)."""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
@@ -0,0 +1,60 @@
+"""Microbenchmark rate limiter: 1 juta pengirim berbeda + pengirim aktif berulang.
+
+Jalankan dari root repo: python benchmarks/bench_rate_limiter.py [--senders 1000000]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import TokenBucketLimiter, SqliteRateLimiter  # noqa: E402
+
+def run(limiter, senders: int, spread_seconds: float):
+    """Pesan dari `senders` nomor berbeda tersebar selama spread_seconds (waktu simulasi)."""
+    start_sim = 1_000_000.0
+    step = spread_seconds / senders
+    started = time.perf_counter()
+    for i in range(senders):
+        limiter.allow(f"whatsapp:+62{i:010d}", now=start_sim + i * step)
+    return (time.perf_counter() - started) / senders * 1e9
+
+def bench_memory(senders: int, spread_seconds: float, max_entries: int):
+    limiter = TokenBucketLimiter(capacity=5, window_seconds=60, max_entries=max_entries)
+    ns_per_op = run(limiter, senders, spread_seconds)
+    # Ukur memori di run terpisah: tracemalloc memperlambat setiap alokasi
+    tracemalloc.start()
+    run(TokenBucketLimiter(capacity=5, window_seconds=60, max_entries=max_entries), senders, spread_seconds)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"memory  spread={spread_seconds:>7.0f}s max_entries={max_entries:>8}: {ns_per_op:8.0f} ns/op, "
+          f"entri tersisa {len(limiter):>8}, evicted {limiter.evicted:>8}, peak {peak / 2**20:7.1f} MiB")
+
+def bench_sqlite(senders: int, spread_seconds: float):
+    with tempfile.TemporaryDirectory() as tmp:
+        limiter = SqliteRateLimiter(os.path.join(tmp, "ratelimit.db"), capacity=5, window_seconds=60)
+        ns_per_op = run(limiter, senders, spread_seconds)
+        print(f"sqlite  spread={spread_seconds:>7.0f}s: {ns_per_op:8.0f} ns/op, baris tersisa {len(limiter)}")
+
+def bench_hot_sender(iterations: int):
+    limiter = TokenBucketLimiter(capacity=5, window_seconds=60)
+    started = time.perf_counter()
+    allowed = sum(limiter.allow("whatsapp:+6281", now=1_000_000.0 + i * 0.01) for i in range(iterations))
+    ns_per_op = (time.perf_counter() - started) / iterations * 1e9
+    print(f"memory  satu pengirim {iterations} pesan: {ns_per_op:8.0f} ns/op, diizinkan {allowed}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--senders", type=int, default=1_000_000)
+    parser.add_argument("--sqlite-senders", type=int, default=100_000)
+    args = parser.parse_args()
+
+    # 1 juta nomor dalam 1 jam: hanya pengirim 60 detik terakhir yang tersimpan
+    bench_memory(args.senders, 3600, max_entries=100_000)
+    # 1 juta nomor dalam 10 detik (spike): batas ukuran map yang bekerja
+    bench_memory(args.senders, 10, max_entries=100_000)
+    bench_hot_sender(100_000)
+    bench_sqlite(args.sqlite_senders, 360)
@@ -0,0 +1,418 @@
+"""Benchmark offline end-to-end: graph per jalur, index katalog, helper teks, webhook, dan DB.
+
+LLM, embeddings, Snap dan Twilio diganti fake deterministik (benchmarks/fakes.py),
+jadi yang diukur hanya overhead kode kita. Hasil disimpan per commit di
+benchmarks/results/<commit>.json dan dibandingkan dengan hasil commit leluhur
+terdekat yang punya file hasil.
+
+Jalankan dari root repo: python benchmarks/bench_suite.py [--quick] [--only graph,webhook] [--check]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import argparse
+import importlib.util
+import subprocess
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+sys.path.insert(0, REPO_ROOT)
+
+from fakes import configure_offline_env, ScriptedChatModel, fake_embeddings, FakeSnap, FakeTwilio  # noqa: E402
+
+GRAPH_PATHS = {
+    "greeting": "halo kak",
+    "stock": "stok kemeja flanel ada?",
+    "order": "mau pesan kemeja flanel 1",
+    "order_status": "status pesanan saya gimana?",
+    "faq": "cara bayar gimana?",
+}
+CATALOG_SIZES = (100, 1_000, 10_000)
+CATALOG_QUERIES = ("kemeja flanel stok", "kemaja flanel warna", "jaket parasut hijau stok", "produk yang tidak ada")
+SEARCH_SIZE = 50_000
+SEARCH_QUERIES = {"exact": "kemeja flanel", "typo": "kemaja flannel", "nya": "kemeja flanelnya", "common_token": "kemeja"}
+TEXT_MESSAGES = ("kemaja flannl ada ga?", "mau sepato ketz 1 deh", "Halo kak, warnaa kemeja apa aja?", "cara bayar gimana ya")
+TEXT_RESPONSES = ("Stok kemeja flanel ada 13 pcs.", "Maaf, stok celana chino habis saat ini.",
+                  "Pilihan warna untuk kemeja flanel: merah, biru.", "Pembayaran lewat Midtrans, Kak.")
+
+_CATEGORIES = ("kemeja", "kaos", "celana", "jaket", "sepatu", "topi", "rok", "hoodie", "sweater", "tas")
+_MATERIALS = ("flanel", "katun", "denim", "linen", "parasut", "kulit", "rajut", "fleece", "kanvas", "satin")
+_STYLES = ("slim", "oversize", "basic", "premium", "vintage", "sport", "casual", "formal", "crop", "panjang")
+_COLORS = ("hitam", "putih", "merah", "biru", "hijau", "krem", "abu", "navy", "coklat", "kuning")
+
+def measure(fn, iterations: int, warmup: int = 3) -> dict:
+    """Statistik latensi (mikrodetik) untuk `iterations` panggilan fn()."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    mean = sum(samples) / len(samples)
+    return {
+        "iterations": iterations,
+        "mean_us": round(mean * 1e6, 1),
+        "p50_us": round(samples[len(samples) // 2] * 1e6, 1),
+        "p95_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1e6, 1),
+        "ops_per_sec": round(1 / mean, 1) if mean else None,
+    }
+
+def catalog_records(size: int) -> list:
+    records = [{"id": 1, "name": "kemeja flanel", "stock": 15, "colors": ["merah", "biru"]}]
+    i = 0
+    while len(records) < size:
+        category, material = _CATEGORIES[i % 10], _MATERIALS[(i // 10) % 10]
+        style, color = _STYLES[(i // 100) % 10], _COLORS[(i // 1000) % 10]
+        name = f"{category} {material} {style} {color}" + (f" seri {i // 10000}" if i >= 10000 else "")
+        if name != "kemeja flanel":
+            records.append({"id": len(records) + 1, "name": name, "stock": i % 7, "colors": [color]})
+        i += 1
+    return records
+
+class Environment:
+    """Import modul repo dengan env offline lalu pasang semua fake."""
+
+    def __init__(self):
+        self.workdir = configure_offline_env()
+        os.chdir(REPO_ROOT)  # faq.txt dibaca relatif ke root repo
+        import models
+        import graph
+        import tools
+        import notifier
+        import payment_outbox
+        from lazy import Lazy
+        from faq_index import load_faq_vectorstore, CachedQueryEmbeddings, HybridFaqRetriever
+
+        models.create_schema()
+        db = models.SessionLocal()
+        db.add_all([models.Product(name="kemeja flanel", stock=10**9, colors=["merah", "biru"]),
+                    models.Product(name="celana chino", stock=0, colors=["hitam", "krem"]),
+                    models.Product(name="sepatu kets", stock=10**9, colors=["putih"])])
+        db.commit()
+        db.close()
+
+        self.llm = ScriptedChatModel()
+        graph.llm = graph.llm_with_tools = tools.llm = self.llm
+        embeddings = CachedQueryEmbeddings(fake_embeddings())
+        vectorstore, texts = load_faq_vectorstore(embeddings)
+        tools.faq_retriever = Lazy("faq_retriever", lambda: HybridFaqRetriever(texts, vectorstore, embeddings))
+        self.snap, self.twilio = FakeSnap(), FakeTwilio()
+        payment_outbox.snap = self.snap
+        payment_outbox.twilio_client = notifier.twilio_client = self.twilio
+        self.graph = graph
+        self.payment_outbox = payment_outbox
+        logging.disable(logging.INFO)  # Log INFO per request hanya bikin noise di terminal dan angka
+
+def bench_graph(env: Environment, iterations: int) -> dict:
+    compiled = env.graph.compiled_graph.get()
+    results = {}
+    for path, message in GRAPH_PATHS.items():
+        counter = iter(range(10**9))
+
+        def invoke():
+            # Thread baru tiap panggilan: ukur satu giliran, bukan riwayat yang terus memanjang
+            from langchain_core.messages import HumanMessage
+            compiled.invoke({"messages": [HumanMessage(content=message)], "user_number": "whatsapp:+628100000001",
+                             "is_ambiguous": False, "needs_reflection": False},
+                            config={"configurable": {"thread_id": f"bench-{path}-{next(counter)}"}})
+        results[f"graph.{path}"] = measure(invoke, iterations)
+
+    # Link pembayaran untuk pesanan dari jalur order dibuat worker outbox (Snap + Twilio palsu)
+    pending = env.payment_outbox.outbox_stats()["counts"].get("pending", 0)
+    started = time.perf_counter()
+    while env.payment_outbox.run_once(env.snap, lambda to, body: env.twilio.create(to=to, body=body)):
+        pass
+    if pending:
+        elapsed = time.perf_counter() - started
+        results["payment_outbox.drain"] = {"iterations": pending, "mean_us": round(elapsed / pending * 1e6, 1),
+                                           "ops_per_sec": round(pending / elapsed, 1) if elapsed else None}
+    return results
+
+def bench_catalog(env: Environment, iterations: int) -> dict:
+    import database
+    from catalog_index import CatalogIndex
+    original = database.get_catalog_index
+    results = {}
+    try:
+        for size in CATALOG_SIZES:
+            index = CatalogIndex(catalog_records(size))
+            database.get_catalog_index = lambda: index
+            queries = iter(CATALOG_QUERIES * (iterations + 10))
+            results[f"get_product_info.catalog_{size}"] = measure(lambda: database.get_product_info(next(queries)), iterations)
+        # Lookup index langsung per jenis query di katalog besar (dulu assert waktu di unit test)
+        index = CatalogIndex(catalog_records(SEARCH_SIZE))
+        for kind, query in SEARCH_QUERIES.items():
+            results[f"catalog_index.search_{SEARCH_SIZE}.{kind}"] = measure(lambda: index.search(query), iterations)
+    finally:
+        database.get_catalog_index = original
+    return results
+
+def bench_text(env: Environment, iterations: int) -> dict:
+    from utils import pre_process_message, vary_response
+    messages = iter(TEXT_MESSAGES * (iterations + 10))
+    pairs = iter(list(zip(TEXT_RESPONSES, TEXT_MESSAGES)) * (iterations + 10))
+    results = {
+        "pre_process_message": measure(lambda: pre_process_message(next(messages)), iterations),
+        "vary_response": measure(lambda: vary_response(*next(pairs)), iterations),
+    }
+    results["post_process"] = measure(lambda: post_process(*next(pairs)), iterations)
+    return results
+
+def post_process(response_text: str, user_message: str) -> str:
+    """Semua tahap teks yang dijalankan app.handle_message untuk satu pesan baru."""
+    from utils import moderate_content, detect_negative_emotion, vary_response, add_emojis_and_formatting, choose_follow_up
+    clear_text_caches()  # Tiap pesan asli teksnya baru: ukur tanpa cache
+    moderate_content(user_message)
+    is_negative = detect_negative_emotion(user_message, 'id')
+    text = add_emojis_and_formatting(vary_response(response_text, user_message), is_negative)
+    text += " " + choose_follow_up('id', user_message, text, "bench", {})
+    moderate_content(text)
+    return text
+
+def clear_text_caches():
+    try:
+        from keyword_engine import analyze
+    except ImportError:  # Commit lama tanpa keyword_engine
+        return
+    analyze.cache_clear()
+
+def bench_webhook(env: Environment, iterations: int) -> dict:
+    from fastapi.testclient import TestClient
+    import app
+    results = {}
+    with TestClient(app.app) as client:
+        for path, message in (("fast_path", "stok kemeja flanel ada?"), ("graph", "halo kak")):
+            def post():
+                response = client.post("/whatsapp", data={"From": "whatsapp:+628100000002", "Body": message})
+                assert response.status_code == 200
+            results[f"webhook.{path}"] = measure(post, iterations)
+    return results
+
+DB_READERS, DB_WRITERS = 8, 2
+
+def bench_db(env: Environment, duration_ms: int) -> dict:
+    """Throughput baca stok selagi order terus ditulis: engine default lama (journal rollback),
+    engine dengan pragma WAL/busy_timeout/mmap + pool, dan engine yang sama lewat aiosqlite."""
+    import asyncio
+    from sqlalchemy import create_engine, select
+    from sqlalchemy.orm import sessionmaker
+    import database
+    import models
+    from lazy import Lazy
+    from catalog_index import CatalogIndex
+
+    catalog = CatalogIndex([{"id": 1, "name": "kemeja flanel", "stock": 10**9, "colors": ["merah"]}])
+    original = database.SessionLocal, database.AsyncSessionLocal, database.get_catalog_index
+    database.get_catalog_index = lambda: catalog
+
+    def seed(name):
+        url = f"sqlite:///{os.path.join(env.workdir, name)}"
+        engine = create_engine(url)
+        models.Base.metadata.create_all(bind=engine)
+        with sessionmaker(bind=engine)() as db:
+            db.add(models.Product(id=1, name="kemeja flanel", stock=10**9, colors=["merah"]))
+            db.commit()
+        engine.dispose()
+        return url
+
+    async def run(read, write) -> dict:
+        counts = {"reads": 0, "writes": 0}
+        deadline = time.perf_counter() + duration_ms / 1000
+
+        async def loop(kind, operation):
+            while time.perf_counter() < deadline:
+                await operation()
+                counts[kind] += 1
+        started = time.perf_counter()
+        await asyncio.gather(*[loop("reads", read) for _ in range(DB_READERS)],
+                             *[loop("writes", write) for _ in range(DB_WRITERS)])
+        elapsed = time.perf_counter() - started
+        return {kind: {"iterations": n, "mean_us": round(elapsed / n * 1e6, 1) if n else None,
+                       "ops_per_sec": round(n / elapsed, 1)} for kind, n in counts.items()}
+
+    results = {}
+    try:
+        # Query sync di asyncio.to_thread: create_engine default (sebelum) vs engine dengan pragma dan pool
+        for label, make_engine in (("thread_pool", create_engine), ("thread_pool_wal", models.create_db_engine)):
+            Session = sessionmaker(bind=make_engine(seed(f"{label}.db")))
+            database.SessionLocal = Session
+
+            def read_sync():
+                with Session() as db:
+                    return db.execute(select(models.Product.stock).where(models.Product.id == 1)).scalar()
+
+            async def sync_read():
+                await asyncio.to_thread(read_sync)
+
+            async def sync_write():
+                await asyncio.to_thread(database._insert_order, "kemeja flanel", 1, "whatsapp:+628100000003")
+            for kind, stats in asyncio.run(run(sync_read, sync_write)).items():
+                results[f"db.{label}.{kind}"] = stats
+
+        # Engine yang sama lewat aiosqlite (DB_ASYNC=true)
+        if importlib.util.find_spec("aiosqlite") is not None:
+            factory = models.create_async_session_factory(seed("tuned.db"))
+            database.AsyncSessionLocal = Lazy("async_db", lambda: factory)
+
+            async def tuned_read():
+                async with factory() as db:
+                    return (await db.execute(select(models.Product.stock).where(models.Product.id == 1))).scalar()
+
+            async def tuned_write():
+                await database._ainsert_order("kemeja flanel", 1, "whatsapp:+628100000003")
+
+            async def tuned():
+                try:
+                    return await run(tuned_read, tuned_write)
+                finally:
+                    await factory.kw["bind"].dispose()
+            for kind, stats in asyncio.run(tuned()).items():
+                results[f"db.aiosqlite_wal.{kind}"] = stats
+    finally:
+        database.SessionLocal, database.AsyncSessionLocal, database.get_catalog_index = original
+    return results
+
+def bench_catalog_import(env: Environment, skus: int) -> dict:
+    """Import katalog supplier (CSV) penuh ke DB kosong, import ulang dengan 1% SKU berubah,
+    dan sinkron index katalog dari changelog import ulang itu."""
+    from sqlalchemy.orm import sessionmaker
+    import models
+    import catalog_import
+    from catalog_index import CatalogIndex, sync_catalog_changes, _load_index
+
+    Session = sessionmaker(bind=models.create_db_engine(f"sqlite:///{os.path.join(env.workdir, 'catalog_import.db')}"))
+    models.Base.metadata.create_all(bind=Session.kw["bind"])
+
+    def write(name, changed_every=None):
+        path = os.path.join(env.workdir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("sku,name,stock,colors\n")
+            for i in range(skus):
+                stock = 7 if changed_every and i % changed_every == 0 else 10
+                f.write(f"SKU-{i},{_CATEGORIES[i % len(_CATEGORIES)]} model {i},{stock},hitam|putih\n")
+        return path
+
+    def run_import(path):
+        started = time.perf_counter()
+        diff = catalog_import.import_catalog(catalog_import.read_records(path), session_factory=Session)
+        elapsed = time.perf_counter() - started
+        return diff, {"iterations": skus, "mean_us": round(elapsed / skus * 1e6, 2), "ops_per_sec": round(skus / elapsed, 1)}
+
+    results = {}
+    _, results["catalog_import.full"] = run_import(write("full.csv"))
+    index = CatalogIndex()
+    with Session() as db:
+        _load_index(index, db)
+    diff, results["catalog_import.diff_1pct"] = run_import(write("diff.csv", changed_every=100))
+    started = time.perf_counter()
+    synced = sync_catalog_changes(index, Session)
+    elapsed = time.perf_counter() - started
+    assert synced == len(diff.changed)
+    results["catalog_import.index_sync"] = {"iterations": synced, "mean_us": round(elapsed / synced * 1e6, 2),
+                                            "ops_per_sec": round(synced / elapsed, 1)}
+    Session.kw["bind"].dispose()
+    return results
+
+BENCHES = {
+    "graph": (bench_graph, 50),
+    "catalog": (bench_catalog, 2000),
+    "text": (bench_text, 20000),
+    "webhook": (bench_webhook, 50),
+    "db": (bench_db, 2000),  # Durasi per konfigurasi (ms)
+    "catalog_import": (bench_catalog_import, 100_000),  # Jumlah SKU di file supplier
+}
+
+def git_commit() -> tuple:
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+    commit = git("rev-parse", "--short=12", "HEAD") or "unknown"
+    dirty = bool(git("status", "--porcelain", "--untracked-files=no"))
+    return commit, dirty
+
+def previous_results(commit: str):
+    """Hasil dari commit leluhur terdekat (termasuk HEAD bersih kalau yang sekarang dirty)."""
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    revisions = subprocess.run(["git", "rev-list", "--max-count=500", "--abbrev-commit", "--abbrev=12", "HEAD"],
+                               cwd=REPO_ROOT, capture_output=True, text=True).stdout.split()
+    for revision in revisions:
+        path = os.path.join(RESULTS_DIR, f"{revision}.json")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+    return None
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Cetak tabel p50/mean dan kembalikan nama benchmark yang melambat lebih dari threshold."""
+    regressions = []
+    print(f"\n{'benchmark':<40} {'p50/mean (us)':>14} {'baseline':>12} {'delta':>8}")
+    for name, stats in current["results"].items():
+        value = stats.get("p50_us", stats["mean_us"])
+        before = (baseline or {}).get("results", {}).get(name)
+        if before is None:
+            print(f"{name:<40} {value:>14.1f} {'-':>12} {'':>8}")
+            continue
+        old = before.get("p50_us", before["mean_us"])
+        delta = (value - old) / old if old else 0.0
+        flag = "  REGRESI" if delta > threshold else ""
+        print(f"{name:<40} {value:>14.1f} {old:>12.1f} {delta:>+7.0%}{flag}")
+        if delta > threshold:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", default=",".join(BENCHES), help="Daftar benchmark dipisah koma")
+    parser.add_argument("--quick", action="store_true", help="Iterasi 10x lebih sedikit")
+    parser.add_argument("--baseline", help="File JSON pembanding (default: commit leluhur terdekat)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Batas melambat sebelum ditandai regresi")
+    parser.add_argument("--check", action="store_true", help="Exit 1 kalau ada regresi")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    env = Environment()
+    results = {}
+    for name in args.only.split(","):
+        bench, iterations = BENCHES[name.strip()]
+        iterations = max(5, iterations // 10) if args.quick else iterations
+        started = time.perf_counter()
+        results.update(bench(env, iterations))
+        print(f"{name}: selesai dalam {time.perf_counter() - started:.1f} detik")
+
+    commit, dirty = git_commit()
+    current = {
+        "commit": commit,
+        "dirty": dirty,
+        "quick": args.quick,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} ({os.cpu_count()} cpu)",
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    else:
+        baseline = previous_results(commit)
+    if baseline is not None:
+        print(f"\nPembanding: commit {baseline['commit']}{' (dirty)' if baseline.get('dirty') else ''}")
+    regressions = compare(current, baseline, args.threshold)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{commit}{'-dirty' if dirty else ''}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+        print(f"\nHasil disimpan: {os.path.relpath(path, REPO_ROOT)}")
+    if regressions and args.check:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
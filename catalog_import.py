@@ -0,0 +1,218 @@
+import re
+import sys
+import csv
+import json
+import time
+import logging
+import argparse
+from sqlalchemy import select, insert, update, delete, bindparam, func
+from sqlalchemy.exc import SQLAlchemyError
+from models import SessionLocal, Product, CatalogChange, Order, create_schema
+from catalog_index import catalog_index, sync_catalog_changes, prune_catalog_changes
+from config import CATALOG_IMPORT_BATCH_SIZE
+
+# Import/sinkron katalog dari file supplier: CSV ber-header atau JSONL, kolom wajib sku dan
+# name, opsional stock dan colors. File dibaca per baris, diff dihitung terhadap DB per SKU,
+# lalu semua perubahan ditulis dalam satu transaksi (executemany per batch). Tiap perubahan
+# dicatat di catalog_changes, jadi index katalog di semua worker diperbarui per produk
+# (sync_catalog_changes), bukan reload penuh. Pencarian tetap jalan selama import (WAL).
+#
+#   python catalog_import.py supplier.csv [--keep-missing] [--dry-run] [--json]
+
+_COLOR_SPLIT_RE = re.compile(r"[|;,]")
+REPORT_SKU_LIMIT = 10
+
+class CatalogDiff:
+    """SKU per jenis perubahan hasil satu import."""
+
+    def __init__(self):
+        self.added = []
+        self.changed = []
+        self.removed = []
+        self.skipped = 0  # Baris tidak valid / duplikat
+
+    def summary(self) -> str:
+        return (f"{len(self.added)} ditambah, {len(self.changed)} berubah, {len(self.removed)} dihapus, "
+                f"{self.skipped} baris dilewati")
+
+    def report(self, limit: int = REPORT_SKU_LIMIT) -> str:
+        lines = []
+        for label, skus in (("Ditambah", self.added), ("Berubah", self.changed), ("Dihapus", self.removed)):
+            if skus:
+                more = f" (+{len(skus) - limit} lagi)" if len(skus) > limit else ""
+                lines.append(f"{label}: {', '.join(skus[:limit])}{more}")
+        return "\n".join(lines)
+
+    def as_dict(self) -> dict:
+        return {"added": self.added, "changed": self.changed, "removed": self.removed, "skipped": self.skipped}
+
+def read_records(path: str, fmt: str = None):
+    """Baca file supplier per baris (generator): (nomor baris, dict CSV / teks JSON)."""
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if fmt == "jsonl":
+            for line_no, line in enumerate(f, 1):
+                if line.strip():
+                    yield line_no, line  # Di-decode parse_record: satu baris rusak cukup dilewati
+            return
+        reader = csv.DictReader(f)
+        if "sku" not in (reader.fieldnames or ()):
+            raise ValueError(f"Kolom 'sku' wajib ada di header {path}")
+        for row in reader:
+            yield reader.line_num, row
+
+def parse_record(raw) -> dict:
+    """Normalisasi satu baris. Kolom stock/colors yang kosong tidak ikut (nilai di DB tidak diubah)."""
+    if isinstance(raw, str):
+        raw = json.loads(raw)
+    if not isinstance(raw, dict):
+        raise ValueError("baris bukan objek")
+    sku = str(raw.get("sku") or "").strip()
+    name = " ".join(str(raw.get("name") or "").split())
+    if not sku or not name:
+        raise ValueError("sku dan name wajib diisi")
+    record = {"sku": sku, "name": name}
+    stock = raw.get("stock")
+    if stock not in (None, ""):
+        record["stock"] = int(stock)
+        if record["stock"] < 0:
+            raise ValueError(f"stok negatif: {stock}")
+    colors = raw.get("colors")
+    if isinstance(colors, list):
+        record["colors"] = [str(color).strip() for color in colors if str(color).strip()]
+    elif colors is not None:
+        record["colors"] = [color.strip() for color in _COLOR_SPLIT_RE.split(str(colors)) if color.strip()]
+    return record
+
+def _differs(current, record: dict) -> bool:
+    return (record["name"] != current.name
+            or ("stock" in record and record["stock"] != current.stock)
+            or ("colors" in record and record["colors"] != list(current.colors or [])))
+
+def _chunks(rows: list, size: int):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+def _next_product_id(db) -> int:
+    """Id produk baru tidak memakai ulang id produk yang sudah dihapus (order lama masih menunjuk ke sana)."""
+    return 1 + max(db.scalar(select(func.max(column))) or 0
+                   for column in (Product.id, CatalogChange.product_id, Order.product_id))
+
+def import_catalog(records, remove_missing: bool = True, dry_run: bool = False,
+                   batch_size: int = CATALOG_IMPORT_BATCH_SIZE, session_factory=None, now: float = None) -> CatalogDiff:
+    """Sinkronkan tabel products dengan baris (nomor baris, raw) dari read_records. Return CatalogDiff.
+
+    Gagal di tengah (mis. nama bentrok dengan produk lain) = rollback, DB tidak berubah sama sekali.
+    """
+    now = time.time() if now is None else now
+    session_factory = session_factory or SessionLocal
+    diff = CatalogDiff()
+    db = session_factory()
+    try:
+        existing = {}  # sku -> baris produk di DB
+        unmanaged = {}  # nama -> id produk tanpa SKU (seed manual)
+        for row in db.execute(select(Product.id, Product.sku, Product.name, Product.stock, Product.colors)):
+            if row.sku is None:
+                unmanaged[row.name] = row.id
+            else:
+                existing[row.sku] = row
+        seen_skus, seen_names = set(), set()
+        inserts, updates = [], []
+        for line_no, raw in records:
+            try:
+                record = parse_record(raw)
+            except (ValueError, TypeError) as e:
+                diff.skipped += 1
+                logging.warning(f"Baris {line_no} dilewati: {e}")
+                continue
+            sku, name = record["sku"], record["name"]
+            if sku in seen_skus or name in seen_names:
+                diff.skipped += 1
+                logging.warning(f"Baris {line_no} dilewati: SKU atau nama duplikat ({sku}, {name})")
+                continue
+            seen_skus.add(sku)
+            seen_names.add(name)
+            current = existing.get(sku)
+            if current is None and name in unmanaged:
+                # Produk seed dengan nama sama jadi milik SKU ini: id (dan order lamanya) tetap
+                updates.append({"_id": unmanaged.pop(name), **record})
+                diff.changed.append(sku)
+            elif current is None:
+                inserts.append({"stock": 0, "colors": [], **record})
+                diff.added.append(sku)
+            elif _differs(current, record):
+                updates.append({"_id": current.id, **record})
+                diff.changed.append(sku)
+        removed_ids = []
+        if remove_missing:
+            for sku, row in existing.items():
+                if sku not in seen_skus:
+                    removed_ids.append(row.id)
+                    diff.removed.append(sku)
+        if dry_run:
+            db.rollback()
+            return diff
+
+        next_id = _next_product_id(db)
+        for offset, row in enumerate(inserts):
+            row["id"] = next_id + offset
+        changes = [{"product_id": product_id, "change": "removed", "created_at": now} for product_id in removed_ids]
+        # Hapus dulu, baru ubah dan tambah: nama produk yang dihapus boleh dipakai SKU baru
+        for chunk in _chunks(removed_ids, batch_size):
+            db.execute(delete(Product).where(Product.id.in_(chunk)).execution_options(synchronize_session=False))
+        # executemany butuh kolom yang seragam: kelompokkan per kolom yang diisi file
+        by_columns = {}
+        for row in updates:
+            by_columns.setdefault(tuple(sorted(row)), []).append(row)
+        products = Product.__table__
+        for rows in by_columns.values():
+            statement = update(products).where(products.c.id == bindparam("_id"))
+            for chunk in _chunks(rows, batch_size):
+                db.execute(statement, chunk)
+        changes += [{"product_id": row["_id"], "change": "changed", "created_at": now} for row in updates]
+        for chunk in _chunks(inserts, batch_size):
+            db.execute(insert(Product), chunk)
+        changes += [{"product_id": row["id"], "change": "added", "created_at": now} for row in inserts]
+        for chunk in _chunks(changes, batch_size):
+            db.execute(insert(CatalogChange), chunk)
+        # Worker yang tertinggal lebih dari masa simpan akan reload index penuh
+        prune_catalog_changes(db, now)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    if catalog_index.loaded_at:
+        sync_catalog_changes(catalog_index, session_factory)  # Import dari dalam proses app: index langsung ikut
+    return diff
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Import/sinkron katalog supplier (CSV/JSONL) ke DB produk.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="Default: dari ekstensi file")
+    parser.add_argument("--keep-missing", action="store_true", help="Jangan hapus SKU yang tidak ada di file")
+    parser.add_argument("--dry-run", action="store_true", help="Hitung diff saja, DB tidak diubah")
+    parser.add_argument("--batch-size", type=int, default=CATALOG_IMPORT_BATCH_SIZE)
+    parser.add_argument("--json", action="store_true", help="Cetak diff lengkap sebagai JSON")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    started = time.perf_counter()
+    try:
+        create_schema()  # Dijalankan di luar app: pastikan kolom sku dan tabel changelog ada
+        diff = import_catalog(read_records(args.path, args.format), remove_missing=not args.keep_missing,
+                              dry_run=args.dry_run, batch_size=args.batch_size)
+    except (OSError, ValueError, SQLAlchemyError) as e:
+        print(f"Import gagal, DB tidak diubah: {e}", file=sys.stderr)
+        return 1
+    if args.json:
+        print(json.dumps(diff.as_dict(), ensure_ascii=False, indent=2))
+    elif diff.report():
+        print(diff.report())
+    mode = "Dry run" if args.dry_run else "Import"
+    print(f"{mode} selesai dalam {time.perf_counter() - started:.1f} detik: {diff.summary()}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
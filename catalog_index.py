@@ -0,0 +1,342 @@
+import re
+import time
+import heapq
+import logging
+import threading
+from config import CATALOG_REFRESH_SECONDS, CATALOG_CHANGES_RETENTION_SECONDS
+
+# Index katalog di memori: dimuat sekali dari DB, diperbarui setiap ada write.
+# Write dari worker lain (import katalog, perubahan stok) diikuti lewat changelog catalog_changes.
+# Pengganti Product.name.ilike('%nama%') (full table scan + .first() acak).
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Akhiran santai yang sering ditempel ke nama produk ('flanelnya', 'chinonya')
+_SUFFIXES = ('nya',)
+MIN_SCORE = 0.5
+MAX_FUZZY_CANDIDATES = 20
+RARE_POSTING_LIMIT = 1000
+MAX_SCORED_CANDIDATES = 200
+
+def tokenize(text: str) -> list:
+    return _TOKEN_RE.findall(text.lower())
+
+def normalize_name(text: str) -> str:
+    return ' '.join(tokenize(text))
+
+def _trigrams(token: str) -> set:
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Levenshtein dengan batas; return max_distance + 1 kalau melewati batas."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j, char_b in enumerate(b, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b))
+            row_min = min(row_min, current[j])
+        if row_min > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+def _max_edits(token: str) -> int:
+    return 0 if len(token) <= 3 else 1 if len(token) <= 6 else 2
+
+class CatalogIndex:
+    """Inverted index token + trigram atas nama produk, dengan toleransi typo dan ranking."""
+
+    def __init__(self, records=None):
+        self._lock = threading.RLock()
+        self.products = {}  # id -> {'id', 'name', 'stock', 'colors'}
+        self.by_name = {}  # nama ternormalisasi -> id
+        self.name_tokens = {}  # id -> set token nama
+        self.token_index = {}  # token -> set(id)
+        self.trigram_index = {}  # trigram -> set(token), untuk cari kandidat typo
+        self.loaded_at = 0.0
+        self.change_id = 0  # Baris catalog_changes terakhir yang sudah diterapkan
+        # Versi (id catalog_changes) nilai stok per produk: nilai yang lebih lama tidak menimpa yang lebih baru
+        self.stock_versions = {}
+        self.base_version = 0  # Versi semua stok saat load penuh
+        if records:
+            self.load(records)
+
+    # --- Pemeliharaan index ---
+
+    def load(self, records, version: int = 0):
+        with self._lock:
+            self.products, self.by_name, self.name_tokens, self.token_index, self.trigram_index = {}, {}, {}, {}, {}
+            for record in records:
+                self._add(record)
+            self.stock_versions, self.base_version = {}, version
+            self.loaded_at = time.time()
+
+    def _add(self, record):
+        record = {'id': record['id'], 'name': record['name'], 'stock': record.get('stock') or 0, 'colors': list(record.get('colors') or [])}
+        self.products[record['id']] = record
+        self.by_name[normalize_name(record['name'])] = record['id']
+        self.name_tokens[record['id']] = set(tokenize(record['name']))
+        for token in self.name_tokens[record['id']]:
+            if token not in self.token_index:
+                self.token_index[token] = set()
+                for trigram in _trigrams(token):
+                    self.trigram_index.setdefault(trigram, set()).add(token)
+            self.token_index[token].add(record['id'])
+
+    def _is_stale(self, product_id, version) -> bool:
+        return version is not None and version < self.stock_versions.get(product_id, self.base_version)
+
+    def _remove(self, product_id):
+        record = self.products.pop(product_id, None)
+        if record is None:
+            return
+        if self.by_name.get(normalize_name(record['name'])) == product_id:
+            del self.by_name[normalize_name(record['name'])]
+        for token in self.name_tokens.pop(product_id, ()):
+            ids = self.token_index.get(token)
+            if ids is None:
+                continue
+            ids.discard(product_id)
+            if not ids:
+                del self.token_index[token]
+                for trigram in _trigrams(token):
+                    tokens = self.trigram_index.get(trigram)
+                    if tokens is not None:
+                        tokens.discard(token)
+                        if not tokens:
+                            del self.trigram_index[trigram]
+
+    def upsert(self, record):
+        with self._lock:
+            self._remove(record['id'])
+            self._add(record)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+
+    def apply_changes(self, records, removed_ids=(), chunk_size: int = 1000, version: int = None):
+        """Terapkan diff import per potongan: lock dilepas di sela potongan, pencarian tetap jalan.
+
+        Stok yang sudah diset dengan versi lebih baru dari `version` dipertahankan.
+        """
+        removed_ids = list(removed_ids)
+        for start in range(0, len(removed_ids), chunk_size):
+            with self._lock:
+                for product_id in removed_ids[start:start + chunk_size]:
+                    self._remove(product_id)
+                    self.stock_versions.pop(product_id, None)
+        for start in range(0, len(records), chunk_size):
+            with self._lock:
+                for record in records[start:start + chunk_size]:
+                    current = self.products.get(record['id'])
+                    if current is not None and self._is_stale(record['id'], version):
+                        record = {**record, 'stock': current['stock']}
+                    elif version is not None:
+                        self.stock_versions[record['id']] = version
+                    self._remove(record['id'])
+                    self._add(record)
+
+    def set_stock(self, product_id, stock: int, version: int = None):
+        """Set stok dari DB. version = id catalog_changes saat stok itu dibaca/ditulis; None = tanpa cek versi."""
+        with self._lock:
+            if product_id in self.products and not self._is_stale(product_id, version):
+                self.products[product_id]['stock'] = stock
+                if version is not None:
+                    self.stock_versions[product_id] = version
+
+    def adjust_stock(self, product_id, delta: int):
+        with self._lock:
+            if product_id in self.products:
+                self.products[product_id]['stock'] += delta
+
+    def __len__(self):
+        return len(self.products)
+
+    # --- Pencarian ---
+
+    def get_by_name(self, name: str):
+        """Produk dengan nama persis (setelah normalisasi), atau None."""
+        product_id = self.by_name.get(normalize_name(name))
+        return self.products.get(product_id) if product_id is not None else None
+
+    def _match_token(self, token: str) -> list:
+        """Token katalog yang cocok dengan token query: [(token_katalog, bobot)]."""
+        if token in self.token_index:
+            return [(token, 1.0)]
+        for suffix in _SUFFIXES:
+            if token.endswith(suffix) and token[:-len(suffix)] in self.token_index:
+                return [(token[:-len(suffix)], 1.0)]
+        max_edits = _max_edits(token)
+        if not max_edits:
+            return []
+        overlap = {}
+        for trigram in _trigrams(token):
+            for candidate in self.trigram_index.get(trigram, ()):
+                overlap[candidate] = overlap.get(candidate, 0) + 1
+        matches = []
+        for candidate, _ in sorted(overlap.items(), key=lambda item: item[1], reverse=True)[:MAX_FUZZY_CANDIDATES]:
+            distance = edit_distance(token, candidate, max_edits)
+            if distance <= max_edits:
+                matches.append((candidate, 1.0 - 0.2 * distance))
+        return matches
+
+    def search(self, query: str, limit: int = 5) -> list:
+        """Cari produk, return [(skor, record)] terurut (skor 0..1, F1 token nama)."""
+        with self._lock:
+            exact = self.get_by_name(query)
+            if exact is not None:
+                return [(1.0, dict(exact))]
+            query_tokens = list(dict.fromkeys(tokenize(query)))
+            if not query_tokens:
+                return []
+            token_matches = [self._match_token(token) for token in query_tokens]
+            postings = [self.token_index[matches[0][0]] if len(matches) == 1 else set().union(*(self.token_index[t] for t, _ in matches))
+                        for matches in token_matches if matches]
+            if not postings:
+                return []
+            # Utamakan produk yang memuat semua token query (irisan dari posting terkecil)
+            postings.sort(key=len)
+            candidates = postings[0]
+            for posting in postings[1:]:
+                candidates = candidates & posting
+                if not candidates:
+                    break
+            if not candidates:
+                # Tidak ada yang memuat semua token: pakai posting yang jarang saja,
+                # token umum ('kemeja') tidak boleh menarik ribuan kandidat
+                rare = [posting for posting in postings if len(posting) <= RARE_POSTING_LIMIT] or postings[:1]
+                candidates = set().union(*rare)
+            if len(candidates) > MAX_SCORED_CANDIDATES:
+                # F1 turun seiring panjang nama, jadi kandidat dengan nama terpendek yang diskor
+                candidates = heapq.nsmallest(MAX_SCORED_CANDIDATES, candidates, key=lambda pid: len(self.name_tokens[pid]))
+
+            results = []
+            for product_id in candidates:
+                record = self.products[product_id]
+                name_tokens = self.name_tokens[product_id]
+                weight = sum(max((w for t, w in matches if t in name_tokens), default=0.0) for matches in token_matches)
+                if not weight:
+                    continue
+                precision = weight / len(name_tokens)
+                recall = weight / len(query_tokens)
+                score = 2 * precision * recall / (precision + recall)
+                results.append((score, record['stock'] > 0, -len(record['name']), -product_id, record))
+            results.sort(key=lambda item: item[:4], reverse=True)
+            return [(score, dict(record)) for score, _, _, _, record in results[:limit]]
+
+    def best_match(self, query: str, min_score: float = MIN_SCORE):
+        results = self.search(query, limit=1)
+        if results and results[0][0] >= min_score:
+            return results[0][1]
+        return None
+
+# --- Index global, dimuat malas dari database ---
+
+catalog_index = CatalogIndex()
+_load_lock = threading.Lock()
+_refresher_started = False
+
+def _product_records(db, *where) -> list:
+    from models import Product
+    rows = db.query(Product.id, Product.name, Product.stock, Product.colors).filter(*where).all()
+    return [{'id': p.id, 'name': p.name, 'stock': p.stock, 'colors': p.colors} for p in rows if p.name]
+
+def _latest_change_id(db) -> int:
+    from sqlalchemy import func
+    from models import CatalogChange
+    return db.query(func.max(CatalogChange.id)).scalar() or 0
+
+def _load_index(index: CatalogIndex, db):
+    change_id = _latest_change_id(db)  # Dibaca sebelum produk: perubahan sesudahnya diterapkan ulang (idempoten)
+    index.load(_product_records(db), version=change_id)
+    index.change_id = change_id
+
+def record_stock_change(db, product_id: int) -> int:
+    """Catat perubahan stok (order/reservasi/pembayaran) di transaksi yang sama. Return versinya (id changelog)."""
+    from sqlalchemy import insert
+    from models import CatalogChange
+    return db.execute(insert(CatalogChange).values(product_id=product_id, change="stock", created_at=time.time())
+                      .returning(CatalogChange.id)).scalar_one()
+
+async def arecord_stock_change(db, product_id: int) -> int:
+    """record_stock_change untuk AsyncSession."""
+    from sqlalchemy import insert
+    from models import CatalogChange
+    return (await db.execute(insert(CatalogChange).values(product_id=product_id, change="stock", created_at=time.time())
+                             .returning(CatalogChange.id))).scalar_one()
+
+def prune_catalog_changes(db, now: float = None):
+    """Buang changelog lewat masa simpan (worker yang tertinggal sejauh itu reload penuh). Commit oleh pemanggil."""
+    from sqlalchemy import delete
+    from models import CatalogChange
+    now = time.time() if now is None else now
+    db.execute(delete(CatalogChange).where(CatalogChange.created_at < now - CATALOG_CHANGES_RETENTION_SECONDS))
+
+def sync_catalog_changes(index: CatalogIndex = catalog_index, session_factory=None) -> int:
+    """Terapkan changelog ke index: hanya produk yang berubah dibaca ulang. Return jumlah produk.
+
+    Perubahan 'stock' (order, reservasi, pembayaran) cukup membaca kolom stok; perubahan
+    catalog_import membaca ulang record produk.
+    """
+    from sqlalchemy import func, select
+    from models import SessionLocal, Product, CatalogChange
+    db = (session_factory or SessionLocal)()
+    try:
+        oldest, latest = db.query(func.min(CatalogChange.id), func.max(CatalogChange.id)).one()
+        if latest is None or latest <= index.change_id:
+            return 0
+        if oldest > index.change_id + 1:
+            # Changelog yang belum diterapkan sudah dipangkas: reload penuh
+            _load_index(index, db)
+            return len(index)
+        pending = (CatalogChange.id > index.change_id, CatalogChange.id <= latest)
+        changed = select(CatalogChange.product_id).where(*pending, CatalogChange.change != "stock")
+        restocked = select(CatalogChange.product_id).where(*pending, CatalogChange.change == "stock")
+        # Dibaca setelah `latest`: nilainya minimal sebaru versi itu
+        product_ids = set(db.scalars(changed))
+        records = _product_records(db, Product.id.in_(changed)) if product_ids else []
+        stocks = db.execute(select(Product.id, Product.stock).where(Product.id.in_(restocked))).all()
+    finally:
+        db.close()
+    index.apply_changes(records, product_ids - {record['id'] for record in records}, version=latest)
+    for product_id, stock in stocks:
+        if product_id not in product_ids:
+            index.set_stock(product_id, stock or 0, version=latest)
+    index.change_id = latest
+    synced = len(product_ids | {product_id for product_id, _ in stocks})
+    logging.info(f"Index katalog disinkronkan dari changelog: {synced} produk.")
+    return synced
+
+def refresh_stock():
+    """Sinkronkan index dengan write dari worker lain: hanya produk di changelog sejak sync terakhir."""
+    return sync_catalog_changes()
+
+def _refresh_loop():
+    while True:
+        time.sleep(CATALOG_REFRESH_SECONDS)
+        try:
+            refresh_stock()
+        except Exception as e:
+            logging.error(f"Gagal refresh index katalog: {e}")
+
+def get_catalog_index() -> CatalogIndex:
+    """Index katalog global; dimuat dari DB saat pertama dipakai."""
+    global _refresher_started
+    if not catalog_index.loaded_at:
+        with _load_lock:
+            if not catalog_index.loaded_at:
+                from models import SessionLocal
+                db = SessionLocal()
+                try:
+                    _load_index(catalog_index, db)
+                finally:
+                    db.close()
+                logging.info(f"Index katalog dimuat: {len(catalog_index)} produk.")
+                if CATALOG_REFRESH_SECONDS > 0 and not _refresher_started:
+                    threading.Thread(target=_refresh_loop, name="catalog-refresh", daemon=True).start()
+                    _refresher_started = True
+    return catalog_index
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from config import MESSAGE_DEBOUNCE_SECONDS, MESSAGE_DEBOUNCE_MAX_WAIT_SECONDS, MESSAGE_DEBOUNCE_MAX_MESSAGES
+
+# Debounce pesan beruntun dari nomor yang sama ("halo", "kak", "kemeja flanel",
+# "ada?"). Pesan ditahan sebentar per nomor lalu digabung jadi satu giliran,
+# jadi graph (dan LLM) cuma jalan sekali. Giliran per nomor dijalankan berurutan
+# supaya tidak ada dua run paralel di thread_id yang sama. Pesan bergambar tidak
+# ditahan: teks yang masih di buffer ikut giliran gambar itu dan langsung diproses,
+# lewat lock per nomor yang sama supaya urutannya tetap.
+
+def merge_messages(messages: list) -> str:
+    return " ".join(m.strip() for m in messages if m and m.strip())
+
+class _Buffer:
+    __slots__ = ("messages", "first_at", "timer", "media_url")
+
+    def __init__(self, first_at: float):
+        self.messages = []
+        self.first_at = first_at
+        self.timer = None
+        self.media_url = None
+
+class MessageCoalescer:
+    """Kumpulkan pesan per nomor; handler(user_number, text, media_url) dipanggil sekali per burst."""
+
+    def __init__(self, handler, window_seconds: float = MESSAGE_DEBOUNCE_SECONDS,
+                 max_wait_seconds: float = MESSAGE_DEBOUNCE_MAX_WAIT_SECONDS, max_messages: int = MESSAGE_DEBOUNCE_MAX_MESSAGES):
+        self.handler = handler
+        self.window_seconds = window_seconds
+        self.max_wait_seconds = max(max_wait_seconds, window_seconds)
+        self.max_messages = max_messages
+        self._buffers = {}  # user_number -> _Buffer yang belum diproses
+        self._locks = {}  # user_number -> [asyncio.Lock, jumlah giliran aktif/menunggu]
+        self._tasks = set()
+        self.received_messages = 0
+        self.turns = 0
+
+    def add(self, user_number: str, text: str, media_url: str = None):
+        """Dipanggil dari webhook (di event loop). Tidak menunggu apa pun.
+
+        Pesan dengan media_url menutup burst: digabung dengan teks yang masih ditahan lalu langsung diproses.
+        """
+        loop = asyncio.get_running_loop()
+        buffer = self._buffers.get(user_number)
+        if buffer is None:
+            buffer = self._buffers[user_number] = _Buffer(loop.time())
+        else:
+            buffer.timer.cancel()  # Pesan baru: tunggu lagi dari awal jendela
+        buffer.messages.append(text)
+        self.received_messages += 1
+        if media_url:
+            buffer.media_url = media_url
+            self._flush(user_number)
+            return
+        # Jangan menunda tanpa batas kalau user terus mengetik
+        delay = min(self.window_seconds, max(0.0, buffer.first_at + self.max_wait_seconds - loop.time()))
+        if len(buffer.messages) >= self.max_messages:
+            delay = 0.0
+        buffer.timer = loop.call_later(delay, self._flush, user_number)
+
+    def pending(self) -> int:
+        return len(self._buffers)
+
+    def _flush(self, user_number: str):
+        buffer = self._buffers.pop(user_number, None)
+        if buffer is None:
+            return
+        text = merge_messages(buffer.messages)
+        if len(buffer.messages) > 1:
+            logging.info(f"{len(buffer.messages)} pesan dari {user_number} digabung: '{text}'")
+        task = asyncio.get_running_loop().create_task(self._run(user_number, text, buffer.media_url))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, user_number: str, text: str, media_url: str = None):
+        entry = self._locks.setdefault(user_number, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:  # Giliran sebelumnya untuk nomor ini selesai dulu
+                self.turns += 1
+                await self.handler(user_number, text, media_url)
+        except Exception as e:
+            logging.error(f"Gagal memproses pesan gabungan dari {user_number}: {e}")
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(user_number, None)
+
+    async def drain(self):
+        """Proses semua buffer sekarang dan tunggu sampai selesai (shutdown/test)."""
+        for user_number, buffer in list(self._buffers.items()):
+            buffer.timer.cancel()
+            self._flush(user_number)
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
@@ -1,8 +1,6 @@
 import os
 from dotenv import load_dotenv
-from twilio.rest import Client as TwilioClient
-import midtransclient
-from cryptography.fernet import Fernet
+from lazy import Lazy
 
 load_dotenv()
 
@@ -15,15 +13,152 @@ AGENT_WHATSAPP_NUMBER = os.getenv("AGENT_WHATSAPP_NUMBER")
 MIDTRANS_SERVER_KEY = os.getenv("MIDTRANS_SERVER_KEY")
 MIDTRANS_CLIENT_KEY = os.getenv("MIDTRANS_CLIENT_KEY")
 ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # Header X-Admin-Token untuk endpoint /admin/*; kosong = endpoint mati
 
-# Inisialisasi Client
-twilio_client = TwilioClient(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-snap = midtransclient.Snap(
-    is_production=False,
-    server_key=MIDTRANS_SERVER_KEY,
-    client_key=MIDTRANS_CLIENT_KEY
-)
-cipher_suite = Fernet(ENCRYPTION_KEY.encode())
-
-# Global vars lain kalau perlu, misal rate_limits (inisialisasi kosong, diisi di app)
-rate_limits = {}
\ No newline at end of file
+# File FAQ dan folder cache index FAISS-nya
+FAQ_PATH = os.getenv("FAQ_PATH", "faq.txt")
+FAQ_INDEX_DIR = os.getenv("FAQ_INDEX_DIR", ".faq_index")
+FAQ_WATCH_INTERVAL = float(os.getenv("FAQ_WATCH_INTERVAL", "10"))  # Detik antar cek mtime faq.txt untuk hot reload, 0 = mati
+# Mode retriever FAQ: 'hybrid' (BM25 + FAISS), 'lexical' (offline penuh), atau 'vector'
+FAQ_RETRIEVER_MODE = os.getenv("FAQ_RETRIEVER_MODE", "hybrid")
+FAQ_QUERY_CACHE_SIZE = int(os.getenv("FAQ_QUERY_CACHE_SIZE", "1024"))
+FAQ_VECTOR_TIMEOUT = float(os.getenv("FAQ_VECTOR_TIMEOUT", "2.0"))  # Detik, lewat ini fallback ke BM25
+
+# Fast path stok/warna tanpa LLM
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+
+# Pipeline gambar masuk (media.py)
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", str(10 * 1024 * 1024)))  # Lebih besar dari ini ditolak
+MEDIA_MAX_DIMENSION = int(os.getenv("MEDIA_MAX_DIMENSION", "1024"))  # Sisi terpanjang setelah diperkecil (px)
+MEDIA_JPEG_QUALITY = int(os.getenv("MEDIA_JPEG_QUALITY", "80"))
+MEDIA_CACHE_SIZE = int(os.getenv("MEDIA_CACHE_SIZE", "64"))  # Gambar siap kirim yang disimpan (per jenis cache)
+MEDIA_CACHE_TTL_SECONDS = float(os.getenv("MEDIA_CACHE_TTL_SECONDS", "3600"))
+
+# Database produk/order (SQLAlchemy). Pragma SQLite dipasang di tiap koneksi baru
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///products.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))  # Koneksi yang disimpan di pool
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "8"))  # Koneksi tambahan saat ramai
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "30000"))  # Tunggu lock writer lain, bukan langsung 'database is locked'
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))  # Baca halaman lewat mmap
+# Order lewat engine async (aiosqlite) alih-alih thread pool. Di benchmark db lebih lambat (overhead
+# per query), tapi menunggu lock SQLite tidak menghabiskan thread pool saat banyak webhook paralel
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() == "true"
+
+# Index katalog di memori: interval sinkron stok dari DB (write dari worker lain)
+CATALOG_REFRESH_SECONDS = float(os.getenv("CATALOG_REFRESH_SECONDS", "30"))
+# Import katalog supplier (catalog_import.py): baris per executemany dan umur changelog untuk sinkron index
+CATALOG_IMPORT_BATCH_SIZE = int(os.getenv("CATALOG_IMPORT_BATCH_SIZE", "5000"))
+CATALOG_CHANGES_RETENTION_SECONDS = float(os.getenv("CATALOG_CHANGES_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+# Reservasi stok pesanan: stok dipotong saat order dibuat, dilepas lagi kalau tidak dibayar
+RESERVATION_TTL_SECONDS = int(os.getenv("RESERVATION_TTL_SECONDS", "3600"))  # Juga jadi masa berlaku link Snap
+RESERVATION_SWEEP_INTERVAL = float(os.getenv("RESERVATION_SWEEP_INTERVAL", "60"))  # Detik antar sweep, 0 = mati
+RESERVATION_SWEEP_BATCH = int(os.getenv("RESERVATION_SWEEP_BATCH", "500"))
+
+# Outbox link pembayaran: dibuat worker di background, dikirim susulan via WhatsApp
+PAYMENT_OUTBOX_WORKERS = int(os.getenv("PAYMENT_OUTBOX_WORKERS", "2"))  # 0 = worker tidak dijalankan
+PAYMENT_OUTBOX_MAX_ATTEMPTS = int(os.getenv("PAYMENT_OUTBOX_MAX_ATTEMPTS", "5"))
+PAYMENT_OUTBOX_LEASE_SECONDS = float(os.getenv("PAYMENT_OUTBOX_LEASE_SECONDS", "60"))  # Worker mati -> diklaim ulang
+PAYMENT_OUTBOX_POLL_SECONDS = float(os.getenv("PAYMENT_OUTBOX_POLL_SECONDS", "2"))
+# Timeout HTTP ke Midtrans; harus jauh di bawah lease supaya worker lambat tidak melewati lease-nya
+MIDTRANS_TIMEOUT_SECONDS = float(os.getenv("MIDTRANS_TIMEOUT_SECONDS", "15"))
+
+# Tool status pesanan: jumlah order per halaman dan cache jawaban per nomor
+ORDER_STATUS_PAGE_SIZE = int(os.getenv("ORDER_STATUS_PAGE_SIZE", "3"))
+ORDER_STATUS_CACHE_TTL_SECONDS = float(os.getenv("ORDER_STATUS_CACHE_TTL_SECONDS", "30"))  # Batas basi dari worker lain, 0 = tanpa cache
+ORDER_STATUS_CACHE_MAX_USERS = int(os.getenv("ORDER_STATUS_CACHE_MAX_USERS", "10000"))
+
+# Backend state pelanggan (preferensi, follow-up, riwayat chat, bucket rate limit):
+# 'memory' (satu worker) atau 'sqlite' (dibagi semua worker uvicorn, satu file STATE_DB_PATH)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "state.db")  # Backend sqlite: tabel user_state, history, rate_buckets
+STATE_MAX_USERS = int(os.getenv("STATE_MAX_USERS", "100000"))  # Batas LRU backend memory
+STATE_TTL_SECONDS = float(os.getenv("STATE_TTL_SECONDS", str(30 * 24 * 3600)))  # User idle dihapus (sqlite)
+
+# Rate limit pesan masuk per nomor (token bucket)
+RATE_LIMIT_MESSAGES = int(os.getenv("RATE_LIMIT_MESSAGES", "5"))  # Maks burst pesan
+RATE_LIMIT_WINDOW_SECONDS = float(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "60"))  # Waktu isi ulang penuh
+RATE_LIMIT_MAX_ENTRIES = int(os.getenv("RATE_LIMIT_MAX_ENTRIES", "100000"))  # Batas nomor yang dilacak di memori
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", "ratelimit.db")  # SqliteRateLimiter mandiri (backend sqlite pakai STATE_DB_PATH)
+
+# Daftar kata terlarang tambahan untuk moderasi (file teks, satu kata/frasa per baris)
+MODERATION_WORDS_PATH = os.getenv("MODERATION_WORDS_PATH", "")
+
+# Debounce pesan beruntun per nomor: digabung jadi satu giliran, dibalas lewat REST API Twilio
+MESSAGE_DEBOUNCE_SECONDS = float(os.getenv("MESSAGE_DEBOUNCE_SECONDS", "0"))  # Jeda tunggu pesan berikutnya, 0 = mati
+MESSAGE_DEBOUNCE_MAX_WAIT_SECONDS = float(os.getenv("MESSAGE_DEBOUNCE_MAX_WAIT_SECONDS", "6"))  # Batas tunggu sejak pesan pertama
+MESSAGE_DEBOUNCE_MAX_MESSAGES = int(os.getenv("MESSAGE_DEBOUNCE_MAX_MESSAGES", "10"))  # Lewat ini langsung diproses
+
+# Mode balasan: 'inline' (TwiML setelah graph selesai) atau 'async' (webhook langsung ack,
+# giliran dikerjakan worker pool lalu dibalas lewat REST API Twilio)
+REPLY_MODE = os.getenv("REPLY_MODE", "inline")
+REPLY_WORKERS = int(os.getenv("REPLY_WORKERS", "8"))  # Batas giliran (panggilan LLM) paralel
+REPLY_MAX_QUEUE = int(os.getenv("REPLY_MAX_QUEUE", "200"))  # Lewat ini pesan baru dijawab "sebentar ya, Kak"
+
+# Antrian notifikasi eskalasi ke agen: digabung per jendela waktu jadi satu pesan
+NOTIFY_DIGEST_WINDOW_SECONDS = float(os.getenv("NOTIFY_DIGEST_WINDOW_SECONDS", "10"))
+NOTIFY_MAX_BATCH = int(os.getenv("NOTIFY_MAX_BATCH", "20"))  # Maks pesan per digest
+NOTIFY_MAX_QUEUE = int(os.getenv("NOTIFY_MAX_QUEUE", "1000"))  # Lewat ini pesan tertua dibuang
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+
+# Topologi graph: kapan reflect dijalankan dan budget per invocation
+GRAPH_REFLECT_MODE = os.getenv("GRAPH_REFLECT_MODE", "on_error")  # 'always', 'on_error', 'never'
+GRAPH_DETERMINISTIC_TOOLS = [t.strip() for t in os.getenv("GRAPH_DETERMINISTIC_TOOLS", "get_product_info,get_order_status").split(",") if t.strip()]
+GRAPH_MAX_LLM_CALLS = int(os.getenv("GRAPH_MAX_LLM_CALLS", "4"))
+GRAPH_MAX_SECONDS = float(os.getenv("GRAPH_MAX_SECONDS", "30"))
+
+# Checkpointer SQLite untuk riwayat graph per thread
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH", "checkpoints.db")
+CHECKPOINT_TTL_SECONDS = float(os.getenv("CHECKPOINT_TTL_SECONDS", str(3 * 24 * 3600)))  # Thread idle > 3 hari dihapus
+CHECKPOINT_MAX_PER_THREAD = int(os.getenv("CHECKPOINT_MAX_PER_THREAD", "3"))
+CHECKPOINT_PRUNE_INTERVAL = float(os.getenv("CHECKPOINT_PRUNE_INTERVAL", "600"))  # Detik antar pruning otomatis
+
+# Riwayat chat per pelanggan (terenkripsi)
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "20"))  # Giliran yang disimpan per user
+HISTORY_MAX_USERS = int(os.getenv("HISTORY_MAX_USERS", "10000"))  # User aktif di memori (LRU)
+HISTORY_SUMMARY_TTL_SECONDS = float(os.getenv("HISTORY_SUMMARY_TTL_SECONDS", "300"))  # Umur cache teks polos
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "history.db")  # Backend memory; kosongkan untuk simpan di memori saja
+HISTORY_TTL_SECONDS = float(os.getenv("HISTORY_TTL_SECONDS", str(30 * 24 * 3600)))
+HISTORY_SHARED = os.getenv("HISTORY_SHARED", str(STATE_BACKEND == "sqlite")).lower() == "true"  # Baca dari disk tiap request (multi-worker)
+
+# Jendela konteks yang dikirim ke LLM per giliran
+CONTEXT_MAX_TURNS = int(os.getenv("CONTEXT_MAX_TURNS", "6"))
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+CONTEXT_KEEP_TURNS_AFTER_FOLD = int(os.getenv("CONTEXT_KEEP_TURNS_AFTER_FOLD", "3"))  # Sisa giliran utuh setelah dilipat
+CONTEXT_TOKEN_MODEL = os.getenv("CONTEXT_TOKEN_MODEL", "gpt-4o")
+
+# Startup: komponen berat dibuat lazy; 'true' = dipanaskan di background saat startup
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+
+# Inisialisasi Client (lazy: dibuat saat pertama dipakai, bukan saat import)
+def _create_twilio_client():
+    from twilio.rest import Client as TwilioClient
+    return TwilioClient(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+
+class _TimeoutRequests:
+    """Pengganti modul requests di HttpClient midtransclient, yang memanggil requests tanpa timeout."""
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+
+    def request(self, *args, **kwargs):
+        import requests
+        kwargs.setdefault("timeout", self.timeout)
+        return requests.request(*args, **kwargs)
+
+def _create_snap():
+    import midtransclient
+    client = midtransclient.Snap(
+        is_production=False,
+        server_key=MIDTRANS_SERVER_KEY,
+        client_key=MIDTRANS_CLIENT_KEY
+    )
+    client.http_client.http_client = _TimeoutRequests(MIDTRANS_TIMEOUT_SECONDS)
+    return client
+
+def _create_cipher_suite():
+    from cryptography.fernet import Fernet
+    return Fernet(ENCRYPTION_KEY.encode())
+
+twilio_client = Lazy("twilio_client", _create_twilio_client)
+snap = Lazy("snap", _create_snap)
+cipher_suite = Lazy("cipher_suite", _create_cipher_suite)
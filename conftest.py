@@ -0,0 +1,33 @@
+# conftest.py
+import os
+import atexit
+import shutil
+import tempfile
+import pytest
+
+# Dijalankan pytest sebelum modul test di-import (config dibaca saat import): semua file
+# DB/index diarahkan ke folder sementara supaya test tidak menulis products.db (di-commit)
+# atau meninggalkan file *.db/-wal/-shm di repo.
+_workdir = tempfile.mkdtemp(prefix="pytest-db-")
+atexit.register(shutil.rmtree, _workdir, ignore_errors=True)
+_repo_db = os.path.join(os.path.dirname(os.path.abspath(__file__)), "products.db")
+if os.path.exists(_repo_db):
+    shutil.copy(_repo_db, _workdir)  # Salinan data seed (test_bot_responses), yang asli tidak ditulis
+
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_workdir, 'products.db')}",
+    "CHECKPOINT_DB_PATH": os.path.join(_workdir, "checkpoints.db"),
+    "HISTORY_DB_PATH": os.path.join(_workdir, "history.db"),
+    "STATE_DB_PATH": os.path.join(_workdir, "state.db"),
+    "RATE_LIMIT_DB_PATH": os.path.join(_workdir, "ratelimit.db"),
+    "FAQ_INDEX_DIR": os.path.join(_workdir, "faq_index"),
+})
+if not os.getenv("ENCRYPTION_KEY"):
+    from cryptography.fernet import Fernet
+    os.environ["ENCRYPTION_KEY"] = Fernet.generate_key().decode()
+
+@pytest.fixture(scope="session", autouse=True)
+def _app_db():
+    """Seperti startup app: tabel dibuat/dimigrasi di DB sementara sebelum test memakai DB global."""
+    from database import init_db
+    init_db()
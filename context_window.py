@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from functools import lru_cache
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from metrics import llm_call
+from config import CONTEXT_MAX_TURNS, CONTEXT_MAX_TOKENS, CONTEXT_KEEP_TURNS_AFTER_FOLD, CONTEXT_TOKEN_MODEL
+
+# Jendela konteks untuk call_model_node: N giliran terakhir dikirim utuh (dalam
+# budget token), giliran yang lebih lama dilipat ke ringkasan bergulir.
+
+SUMMARY_PROMPT = (
+    "Ringkas percakapan CS UrbanStyle ID berikut dalam maksimal 5 kalimat bahasa Indonesia. "
+    "Simpan nama pelanggan, produk yang ditanyakan, pesanan (produk, jumlah, status), dan masalah yang belum selesai."
+)
+SUMMARY_FALLBACK_CHARS = 1500
+
+_encoding = None
+_encoding_failed = False
+
+def _get_encoding():
+    """Encoder tiktoken untuk model chat; None kalau file encoding tidak tersedia offline."""
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            import tiktoken
+            _encoding = tiktoken.encoding_for_model(CONTEXT_TOKEN_MODEL)
+        except Exception as e:
+            _encoding_failed = True
+            logging.warning(f"tiktoken tidak tersedia, hitung token pakai estimasi: {e}")
+    return _encoding
+
+@lru_cache(maxsize=4096)
+def count_text_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def count_message_tokens(message) -> int:
+    tokens = 4 + count_text_tokens(str(message.content))  # +4 overhead format chat per pesan
+    tool_calls = getattr(message, 'tool_calls', None)
+    if tool_calls:
+        tokens += count_text_tokens(str(tool_calls))
+    return tokens
+
+def split_turns(messages: list) -> list:
+    """Kelompokkan pesan per giliran; tiap giliran diawali HumanMessage.
+
+    Karena batas giliran hanya di HumanMessage, pasangan AIMessage(tool_calls) dan
+    ToolMessage-nya selalu berada di giliran yang sama.
+    """
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+def _fits(turns: list, max_turns: int, max_tokens: int) -> bool:
+    return len(turns) <= max_turns and sum(count_message_tokens(m) for turn in turns for m in turn) <= max_tokens
+
+def plan_window(messages: list, summary_upto: int = 0, max_turns: int = CONTEXT_MAX_TURNS,
+                max_tokens: int = CONTEXT_MAX_TOKENS, keep_after_fold: int = CONTEXT_KEEP_TURNS_AFTER_FOLD):
+    """Tentukan pesan yang dikirim utuh dan pesan yang perlu dilipat ke ringkasan.
+
+    Return (new_summary_upto, kept_messages, to_fold). Batas lipatan hanya maju
+    kalau jendela sudah penuh, lalu langsung dimundurkan ke keep_after_fold giliran
+    supaya ringkasan tidak perlu dibuat ulang setiap giliran.
+    """
+    summary_upto = min(summary_upto, len(messages))
+    turns = split_turns(messages[summary_upto:])
+    if _fits(turns, max_turns, max_tokens):
+        return summary_upto, messages[summary_upto:], []
+
+    # Ambil giliran terbaru selama muat; giliran terakhir selalu dipertahankan
+    kept_turns = [turns[-1]]
+    budget = sum(count_message_tokens(m) for m in turns[-1])
+    for turn in reversed(turns[:-1]):
+        turn_tokens = sum(count_message_tokens(m) for m in turn)
+        if len(kept_turns) >= max(1, keep_after_fold) or budget + turn_tokens > max_tokens:
+            break
+        kept_turns.insert(0, turn)
+        budget += turn_tokens
+    kept = [m for turn in kept_turns for m in turn]
+    new_upto = len(messages) - len(kept)
+    return new_upto, kept, messages[summary_upto:new_upto]
+
+def render_transcript(messages: list) -> str:
+    lines = []
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            lines.append(f"Pelanggan: {message.content}")
+        elif isinstance(message, ToolMessage):
+            lines.append(f"Hasil {message.name}: {message.content}")
+        elif isinstance(message, AIMessage):
+            if message.content:
+                lines.append(f"CS: {message.content}")
+            for call in message.tool_calls or []:
+                lines.append(f"CS memanggil {call['name']}: {call.get('args')}")
+    return "\n".join(lines)
+
+def _summary_request(previous_summary: str, to_fold: list) -> list:
+    content = f"{SUMMARY_PROMPT}\n\nRingkasan sebelumnya: {previous_summary or '-'}\n\nPercakapan:\n{render_transcript(to_fold)}"
+    return [HumanMessage(content=content)]
+
+def fallback_summary(previous_summary: str, to_fold: list) -> str:
+    """Ringkasan tanpa LLM (potong transkrip) kalau LLM gagal."""
+    text = f"{previous_summary}\n{render_transcript(to_fold)}".strip()
+    return text[-SUMMARY_FALLBACK_CHARS:]
+
+def _timeout_kwargs(timeout) -> dict:
+    return {} if timeout is None else {"timeout": timeout}  # Diteruskan ke request OpenAI
+
+def summarize(llm, previous_summary: str, to_fold: list, timeout: float = None) -> str:
+    try:
+        with llm_call("summarize") as record:
+            return record(llm.invoke(_summary_request(previous_summary, to_fold), **_timeout_kwargs(timeout))).content
+    except Exception as e:
+        logging.error(f"Gagal membuat ringkasan percakapan: {e}")
+        return fallback_summary(previous_summary, to_fold)
+
+async def asummarize(llm, previous_summary: str, to_fold: list, timeout: float = None) -> str:
+    try:
+        with llm_call("summarize") as record:
+            request = llm.ainvoke(_summary_request(previous_summary, to_fold), **_timeout_kwargs(timeout))
+            return record(await asyncio.wait_for(request, timeout=timeout)).content
+    except Exception as e:
+        logging.error(f"Gagal membuat ringkasan percakapan: {e}")
+        return fallback_summary(previous_summary, to_fold)
+
+def build_context(summary: str, kept: list) -> list:
+    if not summary:
+        return kept
+    return [SystemMessage(content=f"Ringkasan percakapan sebelumnya dengan pelanggan ini: {summary}")] + kept
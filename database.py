@@ -1,9 +1,16 @@
+import asyncio
 import logging
 import random
-from models import SessionLocal, Product, Order
-from config import snap
+from sqlalchemy import insert
+from models import SessionLocal, AsyncSessionLocal, ASYNC_DB_ENABLED, Product, Order, create_schema
+from config import RESERVATION_TTL_SECONDS
+from catalog_index import get_catalog_index
+from reservations import reserve_stock, areserve_stock, reservation_deadline
+from payment_outbox import enqueue_payment_link, notify_new_work
+from order_status import order_status_cache
 
 def init_db():
+    create_schema()  # Tabel + migrasi kolom/index di sini, bukan saat models di-import
     db = SessionLocal()
     try:
         if db.query(Product).count() == 0:
@@ -12,9 +19,7 @@ def init_db():
                 {"name": "celana chino", "stock": 0, "colors": ["hitam", "krem"]},
                 {"name": "sepatu kets", "stock": 5, "colors": ["putih"]}
             ]
-            for data in products_data:
-                product = Product(name=data["name"], stock=data["stock"], colors=data["colors"])
-                db.add(product)
+            db.execute(insert(Product), products_data)  # Satu executemany; katalog besar lewat catalog_import.py
             db.commit()
             logging.info("Data stok berhasil diinisialisasi.")
         else:
@@ -41,110 +46,213 @@ def get_product_info(input_str: str) -> str:
     if info_type == 'colors' and clean_parts and clean_parts[-1] in ['apa', 'apaan']:
         clean_parts = clean_parts[:-1]
     
-    clean_name = ' '.join(clean_parts).replace("flannel", "flanel").replace("flanelnya", "flanel").replace("chinonya", "chino").strip()
-    logging.info(f"Query DB dengan nama: {clean_name}, type: {info_type}")
+    clean_name = ' '.join(clean_parts).strip()
+    logging.info(f"Cari di index katalog: {clean_name}, type: {info_type}")
     
-    db = SessionLocal()
     try:
-        product = db.query(Product).filter(Product.name.ilike(f"%{clean_name}%")).first()
+        # Index di memori (toleran typo, hasil diranking), tanpa query ke DB
+        product = get_catalog_index().best_match(clean_name)
         if product:
-            colors = ', '.join(product.colors) if product.colors else 'tidak ada'
+            colors = ', '.join(product['colors']) if product['colors'] else 'tidak ada'
             if info_type == 'stock':
-                if product.stock == 0:
-                    return f"Maaf, stok {product.name} habis saat ini."
-                return f"Stok {product.name} ada {product.stock} pcs."
+                if product['stock'] == 0:
+                    return f"Maaf, stok {product['name']} habis saat ini."
+                return f"Stok {product['name']} ada {product['stock']} pcs."
             elif info_type == 'colors':
-                if product.stock == 0:
-                    return f"Pilihan warna untuk {product.name}: {colors}. Maaf, stok habis saat ini."
-                return f"Pilihan warna untuk {product.name}: {colors}."
+                if product['stock'] == 0:
+                    return f"Pilihan warna untuk {product['name']}: {colors}. Maaf, stok habis saat ini."
+                return f"Pilihan warna untuk {product['name']}: {colors}."
             else:
-                if product.stock == 0:
-                    return f"Stok {product.name} 0 pcs. Warna: {colors}. Maaf, stok habis saat ini."
-                return f"Stok {product.name} ada {product.stock} pcs. Warna: {colors}."
+                if product['stock'] == 0:
+                    return f"Stok {product['name']} 0 pcs. Warna: {colors}. Maaf, stok habis saat ini."
+                return f"Stok {product['name']} ada {product['stock']} pcs. Warna: {colors}."
         return "Produk tidak ditemukan."
     except Exception as e:
         logging.error(f"Error query DB: {e}")
         return "Error akses database."
-    finally:
-        db.close()
 
-def create_order(input_str: str, user_number: str) -> str:
+_ORDER_QUANTITY_PROMPTS = [
+    "Mau berapa, Kak?",
+    "Berapa jumlahnya, Kak?",
+    "Mau pesan berapa unit, Kak?",
+    "Jumlah pesanannya berapa, Kak?"
+]
+
+def _parse_order_input(input_str: str):
+    """Pecah input 'nama produk jumlah' jadi (product_name, quantity, error_message)."""
     parts = input_str.lower().strip().split()
     if len(parts) < 2:
         logging.warning(f"Input pesanan tidak valid: {input_str}")
-        return random.choice([
-            "Mau berapa, Kak?",
-            "Berapa jumlahnya, Kak?",
-            "Mau pesan berapa unit, Kak?",
-            "Jumlah pesanannya berapa, Kak?"
-        ])
+        return None, None, random.choice(_ORDER_QUANTITY_PROMPTS)
     if parts[0] in ["pesan", "order", "mau", "beli"]:  # Tambah keyword santai
         parts = parts[1:]
     if len(parts) < 2:
         logging.warning(f"Input pesanan tidak lengkap setelah hapus 'pesan': {input_str}")
-        return random.choice([
-            "Mau berapa, Kak?",
-            "Berapa jumlahnya, Kak?",
-            "Mau pesan berapa unit, Kak?",
-            "Jumlah pesanannya berapa, Kak?"
-        ])
-    product_name = ' '.join(parts[:-1]).replace("flannel", "flanel").replace("flanelnya", "flanel").replace("chinonya", "chino")
+        return None, None, random.choice(_ORDER_QUANTITY_PROMPTS)
+    product_name = ' '.join(parts[:-1])
     try:
         quantity = int(parts[-1])
         if quantity <= 0:
             raise ValueError("Jumlah harus lebih dari 0")
     except ValueError:
         logging.warning(f"Jumlah tidak valid: {parts[-1]}")
-        return random.choice([
+        return None, None, random.choice([
             "Mau berapa, Kak?",
             "Jumlahnya harus angka, Kak!",
             "Masukkan jumlah dalam angka, Kak!",
             "Berapa jumlahnya, Kak?"
         ])
-    logging.info(f"Membuat pesanan: {product_name}, jumlah: {quantity}, user: {user_number}")
+    return product_name, quantity, None
+
+def _match_product(product_name: str):
+    """Cari produk pesanan di index katalog. Return (catalog, match, error_message)."""
+    try:
+        catalog = get_catalog_index()
+        match = catalog.best_match(product_name)
+    except Exception as e:
+        logging.error(f"Error membuat pesanan: {str(e)}")
+        return None, None, "Maaf, gagal membuat pesanan. Coba lagi nanti, Kak."
+    if not match:
+        logging.warning(f"Produk tidak ditemukan: {product_name}")
+        return None, None, "Produk tidak ditemukan, Kak."
+    return catalog, match, None
+
+def _stock_shortage(catalog, product, product_name: str, quantity: int) -> str:
+    """Pesan untuk reservasi yang gagal; index ikut disinkronkan dengan stok DB."""
+    if not product:
+        logging.warning(f"Produk tidak ditemukan: {product_name}")
+        return "Produk tidak ditemukan, Kak."
+    logging.warning(f"Stok tidak cukup: {product.name}, stok: {product.stock}, diminta: {quantity}")
+    catalog.set_stock(product.id, product.stock)
+    return f"Maaf, stok {product.name} hanya {product.stock} pcs."
+
+def _new_order(match: dict, quantity: int, user_number: str) -> Order:
+    return Order(user_number=user_number, product_id=match['id'], product_name=match['name'], quantity=quantity,
+                 status="pending", reserved_until=reservation_deadline())
+
+def _order_created(catalog, match: dict, order: Order, remaining: tuple):
+    notify_new_work()
+    order_status_cache.invalidate(order.user_number)  # Jawaban "pesanan saya" nomor ini sudah basi
+    catalog.set_stock(match['id'], *remaining)  # Index tetap sinkron dengan DB (sisa stok, versi)
+    logging.info(f"Order dibuat di DB: order-{order.id}, stok direservasi sampai {order.reserved_until:.0f}")
+
+def _insert_order(product_name: str, quantity: int, user_number: str):
+    """Reservasi stok, simpan Order + antrian link pembayaran. Return (order_id, nama_produk, error_message)."""
+    catalog, match, error = _match_product(product_name)
+    if error:
+        return None, None, error
     db = SessionLocal()
     try:
-        product = db.query(Product).filter(Product.name.ilike(f"%{product_name}%")).first()
-        if not product:
-            logging.warning(f"Produk tidak ditemukan: {product_name}")
-            return "Produk tidak ditemukan, Kak."
-        if product.stock < quantity:
-            logging.warning(f"Stok tidak cukup: {product_name}, stok: {product.stock}, diminta: {quantity}")
-            return f"Maaf, stok {product_name} hanya {product.stock} pcs."
-        product.stock -= quantity
-        order = Order(user_number=user_number, product_name=product_name, quantity=quantity)
+        # Cek dan potong stok dalam satu UPDATE bersyarat: order paralel tidak bisa oversell
+        remaining = reserve_stock(db, match['id'], quantity)
+        if remaining is None:
+            db.rollback()
+            return None, None, _stock_shortage(catalog, db.get(Product, match['id']), product_name, quantity)
+        order = _new_order(match, quantity, user_number)
         db.add(order)
+        db.flush()  # Butuh order.id untuk payload Snap
+        payload, error = _snap_payload(order.id, match['name'], quantity, user_number)
+        if error:
+            db.rollback()  # Reservasi stok ikut dibatalkan
+            return None, None, error
+        # Link dibuat worker outbox; baris outbox di-commit bersama order (tidak bisa hilang)
+        enqueue_payment_link(db, order.id, user_number, payload)
         db.commit()
-        logging.info(f"Order dibuat di DB: order-{order.id}")
-        try:
-            phone = user_number.replace('whatsapp:', '')
-            logging.debug(f"Phone extracted for Midtrans: {phone}")  # Tambah debug phone
-            if not phone or not phone.startswith('+'):
-                logging.error("Phone invalid for Midtrans: {phone}")
-                return "Maaf, nomor telepon tidak valid untuk pembayaran. Coba konfirmasi nomor Anda, Kak."
-            transaction = snap.create_transaction({
-                'transaction_details': {
-                    'order_id': f'order-{order.id}',
-                    'gross_amount': quantity * 50000
-                },
-                'item_details': [{
-                    'id': product_name,
-                    'price': 50000,
-                    'quantity': quantity,
-                    'name': product_name
-                }],
-                'customer_details': {
-                    'phone': phone
-                }
-            })
-            payment_link = transaction['redirect_url']
-            logging.info(f"Pesanan dibuat: order-{order.id}, link: {payment_link}")
-            return f"Pesanan {quantity} {product_name} berhasil! Link pembayaran: {payment_link}"
-        except Exception as e:
-            logging.error(f"Error Midtrans API: {str(e)}")  # Detail error
-            return "Maaf, gagal membuat link pembayaran. Cek koneksi atau coba lagi nanti, Kak."
+        _order_created(catalog, match, order, remaining)
+        return order.id, match['name'], None
     except Exception as e:
+        db.rollback()
         logging.error(f"Error membuat pesanan: {str(e)}")
-        return "Maaf, gagal membuat pesanan. Coba lagi nanti, Kak."
+        return None, None, "Maaf, gagal membuat pesanan. Coba lagi nanti, Kak."
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def _ainsert_order(product_name: str, quantity: int, user_number: str):
+    """_insert_order lewat engine aiosqlite: menunggu lock SQLite tidak memakan thread pool."""
+    catalog, match, error = _match_product(product_name)
+    if error:
+        return None, None, error
+    async with AsyncSessionLocal.get()() as db:
+        try:
+            remaining = await areserve_stock(db, match['id'], quantity)
+            if remaining is None:
+                await db.rollback()
+                return None, None, _stock_shortage(catalog, await db.get(Product, match['id']), product_name, quantity)
+            order = _new_order(match, quantity, user_number)
+            db.add(order)
+            await db.flush()
+            payload, error = _snap_payload(order.id, match['name'], quantity, user_number)
+            if error:
+                await db.rollback()
+                return None, None, error
+            enqueue_payment_link(db, order.id, user_number, payload)
+            await db.commit()
+            _order_created(catalog, match, order, remaining)
+            return order.id, match['name'], None
+        except Exception as e:
+            await db.rollback()
+            logging.error(f"Error membuat pesanan: {str(e)}")
+            return None, None, "Maaf, gagal membuat pesanan. Coba lagi nanti, Kak."
+
+def _snap_payload(order_id: int, product_name: str, quantity: int, user_number: str):
+    """Susun payload Snap. Return (payload, error_message) kalau nomor tidak valid."""
+    phone = user_number.replace('whatsapp:', '')
+    logging.debug(f"Phone extracted for Midtrans: {phone}")  # Tambah debug phone
+    if not phone or not phone.startswith('+'):
+        logging.error(f"Phone invalid for Midtrans: {phone}")
+        return None, "Maaf, nomor telepon tidak valid untuk pembayaran. Coba konfirmasi nomor Anda, Kak."
+    return {
+        'transaction_details': {
+            'order_id': f'order-{order_id}',
+            'gross_amount': quantity * 50000
+        },
+        'item_details': [{
+            'id': product_name,
+            'price': 50000,
+            'quantity': quantity,
+            'name': product_name
+        }],
+        'customer_details': {
+            'phone': phone
+        },
+        # Link Snap kedaluwarsa bersamaan dengan reservasi stok
+        'expiry': {
+            'unit': 'minutes',
+            'duration': max(1, RESERVATION_TTL_SECONDS // 60)
+        }
+    }, None
+
+def _order_confirmation(order_id: int, product_name: str, quantity: int) -> str:
+    return f"Pesanan {quantity} {product_name} berhasil dicatat (order-{order_id})! Link pembayaran menyusul lewat WhatsApp sebentar lagi ya, Kak."
+
+def create_order(input_str: str, user_number: str) -> str:
+    product_name, quantity, error = _parse_order_input(input_str)
+    if error:
+        return error
+    logging.info(f"Membuat pesanan: {product_name}, jumlah: {quantity}, user: {user_number}")
+    order_id, product_name, error = _insert_order(product_name, quantity, user_number)
+    if error:
+        return error
+    return _order_confirmation(order_id, product_name, quantity)
+
+# --- Versi async untuk webhook (tidak memblok event loop) ---
+# Order ditulis lewat engine aiosqlite (ASYNC_DB_ENABLED); tanpa itu query sync
+# dijalankan di thread pool. Link Midtrans dibuat worker outbox (payment_outbox.py), bukan di request.
+
+async def aget_product_info(input_str: str) -> str:
+    if get_catalog_index().loaded_at:
+        return get_product_info(input_str)  # Index sudah di memori, tidak ada I/O
+    return await asyncio.to_thread(get_product_info, input_str)  # Muat index sekali (dikunci antar thread)
+
+async def acreate_order(input_str: str, user_number: str) -> str:
+    product_name, quantity, error = _parse_order_input(input_str)
+    if error:
+        return error
+    logging.info(f"Membuat pesanan: {product_name}, jumlah: {quantity}, user: {user_number}")
+    if ASYNC_DB_ENABLED:
+        order_id, product_name, error = await _ainsert_order(product_name, quantity, user_number)
+    else:
+        order_id, product_name, error = await asyncio.to_thread(_insert_order, product_name, quantity, user_number)
+    if error:
+        return error
+    return _order_confirmation(order_id, product_name, quantity)
@@ -0,0 +1,376 @@
+import os
+import re
+import json
+import math
+import shutil
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores import FAISS
+from langchain.text_splitter import CharacterTextSplitter
+from config import FAQ_PATH, FAQ_INDEX_DIR, FAQ_RETRIEVER_MODE, FAQ_QUERY_CACHE_SIZE, FAQ_VECTOR_TIMEOUT
+
+# Setting splitter ikut menentukan cache key, jadi ubah di sini saja
+FAQ_SEPARATOR = "--------------------------------------"
+FAQ_CHUNK_SIZE = 1000
+FAQ_CHUNK_OVERLAP = 200
+# Subfolder FAQ_INDEX_DIR berisi vektor per chunk (ChunkEmbeddingCache)
+CHUNK_CACHE_DIR = "chunks"
+# Index per key yang disimpan (terbaru dipakai dulu). Worker yang belum reload masih
+# memuat key sebelumnya, jadi folder itu tidak boleh langsung dihapus.
+FAQ_INDEX_KEEP = 2
+
+def read_faq_text(path: str = None) -> str:
+    path = path or FAQ_PATH
+    if not os.path.exists(path):
+        raise FileNotFoundError("File faq.txt tidak ditemukan di direktori proyek.")
+    with open(path, "r", encoding="utf-8") as f:
+        faq_text = f.read()
+    if not faq_text.strip():
+        raise ValueError("File faq.txt kosong.")
+    return faq_text
+
+def split_faq_text(faq_text: str) -> list:
+    text_splitter = CharacterTextSplitter(
+        separator=FAQ_SEPARATOR,
+        chunk_size=FAQ_CHUNK_SIZE,
+        chunk_overlap=FAQ_CHUNK_OVERLAP,
+        length_function=len
+    )
+    return text_splitter.split_text(faq_text)
+
+def embedding_model_name(embeddings) -> str:
+    return getattr(embeddings, "model", None) or type(embeddings).__name__
+
+def faq_cache_key(faq_text: str, embeddings) -> str:
+    """Hash isi faq.txt + setting splitter + nama model embedding."""
+    key_data = {
+        "faq_sha256": hashlib.sha256(faq_text.encode("utf-8")).hexdigest(),
+        "separator": FAQ_SEPARATOR,
+        "chunk_size": FAQ_CHUNK_SIZE,
+        "chunk_overlap": FAQ_CHUNK_OVERLAP,
+        "embedding_model": embedding_model_name(embeddings),
+    }
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+def load_faq_vectorstore(embeddings, path: str = None, index_dir: str = None):
+    """Load index FAISS dari disk kalau key cocok, kalau tidak embed ulang lalu simpan.
+
+    Return (vectorstore, texts).
+    """
+    index_dir = index_dir or FAQ_INDEX_DIR
+    faq_text = read_faq_text(path)
+    texts = split_faq_text(faq_text)
+    key = faq_cache_key(faq_text, embeddings)
+    cache_path = os.path.join(index_dir, key)
+
+    if os.path.exists(os.path.join(cache_path, "index.faiss")):
+        try:
+            # File index dibuat sendiri oleh proses ini, jadi aman di-unpickle
+            vectorstore = FAISS.load_local(cache_path, embeddings, allow_dangerous_deserialization=True)
+            _touch(cache_path)  # Masih dipakai: jangan ikut dibersihkan worker lain
+            logging.info(f"FAQ index dimuat dari cache: {cache_path}")
+            return vectorstore, texts
+        except Exception as e:
+            logging.warning(f"Cache FAQ index rusak, build ulang: {e}")
+
+    # Hanya chunk baru/berubah yang di-embed; sisanya dari cache vektor per chunk
+    chunk_cache = ChunkEmbeddingCache(embeddings, index_dir)
+    vectorstore = FAISS.from_embeddings(list(zip(texts, chunk_cache.embed(texts))), embeddings)
+    _save_vectorstore(vectorstore, index_dir, key)
+    logging.info(f"FAQ index dibuat ulang ({len(texts)} chunk, {chunk_cache.embedded} di-embed) dan disimpan: {cache_path}")
+    return vectorstore, texts
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+class ChunkEmbeddingCache:
+    """Vektor embedding per chunk FAQ (key: hash isi chunk), disimpan di disk per model embedding.
+
+    Mengubah satu entri FAQ cukup meng-embed chunk yang isinya berubah, bukan seluruh faq.txt.
+    """
+
+    def __init__(self, embeddings, index_dir: str = FAQ_INDEX_DIR):
+        self.embeddings = embeddings
+        model_key = hashlib.sha256(embedding_model_name(embeddings).encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(index_dir, CHUNK_CACHE_DIR, f"{model_key}.json")
+        self.embedded = 0  # Chunk yang di-embed pada panggilan embed() terakhir
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, vectors: dict):
+        tmp_path = f"{self.path}.tmp-{os.getpid()}"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(vectors, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Gagal menyimpan cache embedding chunk FAQ: {e}")
+
+    def embed(self, texts: list) -> list:
+        cached = self._load()
+        vectors = {chunk_hash(text): cached.get(chunk_hash(text)) for text in texts}
+        missing = [text for text in dict.fromkeys(texts) if vectors[chunk_hash(text)] is None]
+        if missing:
+            for text, vector in zip(missing, self.embeddings.embed_documents(missing)):
+                vectors[chunk_hash(text)] = list(vector)
+            self._save(vectors)  # Hanya chunk faq.txt sekarang: file tidak tumbuh terus
+        self.embedded = len(missing)
+        return [vectors[chunk_hash(text)] for text in texts]
+
+def _touch(path: str):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def _prune_indexes(index_dir: str, keep: int = None):
+    """Hapus folder index lama, sisakan `keep` yang terakhir dibuat/dipakai (mtime terbaru)."""
+    keep = FAQ_INDEX_KEEP if keep is None else keep
+    entries = []
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name)
+        if name == CHUNK_CACHE_DIR or ".tmp-" in name or not os.path.isdir(path):
+            continue
+        try:
+            entries.append((os.stat(path).st_mtime_ns, path))
+        except OSError:
+            continue  # Sudah dihapus worker lain
+    for _, path in sorted(entries, reverse=True)[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+def _save_vectorstore(vectorstore, index_dir: str, key: str):
+    """Simpan ke folder sementara lalu rename, supaya worker lain tidak baca index setengah jadi."""
+    cache_path = os.path.join(index_dir, key)
+    tmp_path = f"{cache_path}.tmp-{os.getpid()}"
+    try:
+        os.makedirs(index_dir, exist_ok=True)
+        vectorstore.save_local(tmp_path)
+        if os.path.exists(cache_path):
+            shutil.rmtree(tmp_path, ignore_errors=True)  # Worker lain sudah duluan
+            _touch(cache_path)
+        else:
+            os.replace(tmp_path, cache_path)
+        _prune_indexes(index_dir)
+    except Exception as e:
+        logging.warning(f"Gagal menyimpan cache FAQ index: {e}")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+# --- Retriever lexical/hybrid ---
+
+_TOKEN_RE = re.compile(r"\w+")
+_STOP_WORDS = {'apa', 'apakah', 'yang', 'dan', 'di', 'ke', 'dari', 'saya', 'untuk', 'dengan', 'ini', 'itu',
+               'bisa', 'kak', 'ya', 'ada', 'atau', 'p', 'j', 'faq', 'kami', 'anda', 'gimana', 'dong', 'sih'}
+_PARTICLES = ('lah', 'kah', 'nya')
+_SUFFIXES = ('kan', 'an')
+# (prefix, huruf yang luluh kalau kata dasar diawali vokal)
+_PREFIXES = (('meng', 'k'), ('peng', 'k'), ('meny', 's'), ('peny', 's'), ('mem', 'p'), ('pem', 'p'),
+             ('men', 't'), ('pen', 't'), ('ber', ''), ('ter', ''), ('me', ''), ('pe', ''), ('di', ''), ('ke', ''))
+
+def normalize_query(text: str) -> str:
+    return ' '.join(_TOKEN_RE.findall(text.lower()))
+
+def stem_id(word: str) -> str:
+    """Stemmer bahasa Indonesia sederhana: pembayaran -> bayar, pengiriman -> kirim."""
+    for particle in _PARTICLES:
+        if word.endswith(particle) and len(word) - len(particle) >= 4:
+            word = word[:-len(particle)]
+            break
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            word = word[:-len(suffix)]
+            break
+    for prefix, lebur in _PREFIXES:
+        if word.startswith(prefix) and len(word) - len(prefix) >= 3:
+            rest = word[len(prefix):]
+            if lebur and rest[0] in 'aeiou':
+                rest = lebur + rest
+            return rest
+    return word
+
+def tokenize(text: str) -> list:
+    return [stem_id(t) for t in _TOKEN_RE.findall(text.lower()) if t not in _STOP_WORDS]
+
+class BM25Index:
+    """Index BM25 lokal di atas chunk FAQ yang sama dengan FAISS (tanpa network)."""
+
+    def __init__(self, texts: list, k1: float = 1.5, b: float = 0.75):
+        self.texts = list(texts)
+        self.k1 = k1
+        self.b = b
+        doc_tokens = [tokenize(t) for t in self.texts]
+        self.doc_len = [len(tokens) for tokens in doc_tokens]
+        self.avg_len = (sum(self.doc_len) / len(self.doc_len)) if self.doc_len else 0.0
+        # Inverted index: term -> [(doc_idx, tf)]
+        self.postings = {}
+        for idx, tokens in enumerate(doc_tokens):
+            for term, tf in Counter(tokens).items():
+                self.postings.setdefault(term, []).append((idx, tf))
+        n_docs = len(self.texts)
+        self.idf = {term: math.log(1 + (n_docs - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self.postings.items()}
+
+    def score(self, query: str) -> dict:
+        """Return {doc_idx: skor} untuk dokumen yang mengandung minimal satu term query."""
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            for idx, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[idx] / self.avg_len)
+                scores[idx] = scores.get(idx, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query: str, k: int = 4) -> list:
+        """Return [(doc_idx, skor)] terurut dari skor tertinggi."""
+        scores = self.score(query)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+class CachedQueryEmbeddings(Embeddings):
+    """Bungkus model embedding dengan cache LRU untuk embed_query (key: query ternormalisasi)."""
+
+    def __init__(self, base: Embeddings, maxsize: int = FAQ_QUERY_CACHE_SIZE):
+        self.base = base
+        self.maxsize = maxsize
+        self.model = embedding_model_name(base)  # Supaya cache key index di disk tetap sama
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.documents_embedded = 0  # Chunk FAQ yang di-embed lewat objek ini (build dan reload index)
+
+    def _get(self, key):
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return vector
+
+    def _put(self, key, vector):
+        with self._lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def embed_documents(self, texts):
+        self.documents_embedded += len(texts)
+        return self.base.embed_documents(texts)
+
+    async def aembed_documents(self, texts):
+        self.documents_embedded += len(texts)
+        return await self.base.aembed_documents(texts)
+
+    def embed_query(self, text):
+        key = normalize_query(text)
+        vector = self._get(key)
+        if vector is None:
+            vector = self.base.embed_query(key)
+            self._put(key, vector)
+        return vector
+
+    async def aembed_query(self, text):
+        key = normalize_query(text)
+        vector = self._get(key)
+        if vector is None:
+            vector = await self.base.aembed_query(key)
+            self._put(key, vector)
+        return vector
+
+# Thread pool kecil untuk embedding sync supaya bisa diberi timeout
+_embed_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="faq-embed")
+
+class HybridFaqRetriever:
+    """Retriever FAQ dengan mode 'lexical', 'vector', atau 'hybrid'.
+
+    Mode hybrid menjawab langsung dari BM25 kalau hasilnya jelas unggul (tanpa
+    embedding sama sekali). Kalau tidak, skor BM25 digabung dengan skor FAISS.
+    Embedding yang lambat/gagal tidak menghentikan jawaban: fallback ke BM25.
+    """
+
+    def __init__(self, texts: list, vectorstore=None, embeddings=None, mode: str = FAQ_RETRIEVER_MODE,
+                 k: int = 4, alpha: float = 0.5, min_lexical_score: float = 2.0, lexical_margin: float = 1.15,
+                 vector_timeout: float = FAQ_VECTOR_TIMEOUT, vector_error: str = None):
+        self.texts = list(texts)
+        self._index_of = {text: i for i, text in enumerate(self.texts)}
+        self.lexical = BM25Index(self.texts)
+        self.vectorstore = vectorstore
+        self.embeddings = embeddings
+        self.mode = mode if vectorstore is not None else 'lexical'
+        self.vector_error = vector_error  # Alasan index vektor tidak tersedia (turun ke lexical)
+        self.k = k
+        self.alpha = alpha
+        self.min_lexical_score = min_lexical_score
+        self.lexical_margin = lexical_margin
+        self.vector_timeout = vector_timeout
+
+    def _lexical_is_confident(self, ranked: list) -> bool:
+        if not ranked or ranked[0][1] < self.min_lexical_score:
+            return False
+        return len(ranked) == 1 or ranked[0][1] >= self.lexical_margin * ranked[1][1]
+
+    def _vector_scores(self, vector) -> dict:
+        """Jarak L2 FAISS -> skor similarity per index chunk."""
+        scores = {}
+        for doc, distance in self.vectorstore.similarity_search_with_score_by_vector(vector, k=self.k):
+            idx = self._index_of.get(doc.page_content)
+            if idx is not None:
+                scores[idx] = 1.0 / (1.0 + float(distance))
+        return scores
+
+    def _merge(self, lexical_scores: dict, vector_scores: dict) -> list:
+        max_lex = max(lexical_scores.values(), default=0.0) or 1.0
+        max_vec = max(vector_scores.values(), default=0.0) or 1.0
+        combined = {}
+        for idx in set(lexical_scores) | set(vector_scores):
+            combined[idx] = (1 - self.alpha) * lexical_scores.get(idx, 0.0) / max_lex + self.alpha * vector_scores.get(idx, 0.0) / max_vec
+        ranked = sorted(combined.items(), key=lambda item: item[1], reverse=True)[:self.k]
+        return [self.texts[idx] for idx, _ in ranked]
+
+    def _lexical_plan(self, query: str):
+        """Return (hasil_final, skor_lexical). hasil_final != None berarti tidak perlu embedding."""
+        lexical_scores = self.lexical.score(query)
+        ranked = sorted(lexical_scores.items(), key=lambda item: item[1], reverse=True)
+        lexical_result = [self.texts[idx] for idx, _ in ranked[:self.k]]
+        if self.mode == 'lexical' or (self.mode == 'hybrid' and self._lexical_is_confident(ranked)):
+            return lexical_result, lexical_scores
+        return None, lexical_scores
+
+    def search(self, query: str) -> list:
+        result, lexical_scores = self._lexical_plan(query)
+        if result is not None:
+            return result
+        try:
+            future = _embed_executor.submit(self.embeddings.embed_query, query)
+            vector = future.result(timeout=self.vector_timeout)
+        except Exception as e:
+            logging.warning(f"Embedding FAQ lambat/gagal, pakai hasil lexical: {e!r}")
+            return self._merge(lexical_scores, {})
+        vector_scores = self._vector_scores(vector)
+        return self._merge({} if self.mode == 'vector' else lexical_scores, vector_scores)
+
+    async def asearch(self, query: str) -> list:
+        result, lexical_scores = self._lexical_plan(query)
+        if result is not None:
+            return result
+        try:
+            vector = await asyncio.wait_for(self.embeddings.aembed_query(query), timeout=self.vector_timeout)
+        except Exception as e:
+            logging.warning(f"Embedding FAQ lambat/gagal, pakai hasil lexical: {e!r}")
+            return self._merge(lexical_scores, {})
+        vector_scores = self._vector_scores(vector)
+        return self._merge({} if self.mode == 'vector' else lexical_scores, vector_scores)
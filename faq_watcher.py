@@ -0,0 +1,48 @@
+import os
+import logging
+import threading
+from config import FAQ_PATH, FAQ_WATCH_INTERVAL
+
+# Hot reload FAQ: thread kecil memantau mtime faq.txt dan me-reload retriever saat berubah
+# (tools.reload_faq_retriever). Tiap worker uvicorn menjalankan watcher sendiri, jadi
+# semua worker ikut; endpoint /admin/faq/reload hanya mengenai satu worker.
+
+def reload_faq() -> dict:
+    import tools  # langchain baru di-import saat benar-benar reload, bukan saat startup
+    return tools.reload_faq_retriever()
+
+def _mtime(path: str):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def watch_faq(path: str = FAQ_PATH, interval: float = FAQ_WATCH_INTERVAL, reload=reload_faq, stop: threading.Event = None):
+    """Loop watcher. Reload setelah mtime stabil satu interval (editor mungkin masih menulis file)."""
+    stop = stop or threading.Event()
+    loaded = seen = _mtime(path)
+    while not stop.wait(interval):
+        current = _mtime(path)
+        if current != seen:
+            seen = current
+            continue
+        if current is None or current == loaded:
+            continue
+        loaded = current
+        try:
+            reload()
+        except Exception as e:
+            logging.error(f"Reload FAQ gagal, retriever lama tetap dipakai: {e}")
+
+_watcher_started = False
+_watcher_lock = threading.Lock()
+
+def start_faq_watcher(path: str = FAQ_PATH, interval: float = FAQ_WATCH_INTERVAL):
+    """Jalankan watcher sekali per proses."""
+    global _watcher_started
+    if interval <= 0:
+        return
+    with _watcher_lock:
+        if not _watcher_started:
+            threading.Thread(target=watch_faq, args=(path, interval), name="faq-watcher", daemon=True).start()
+            _watcher_started = True
@@ -0,0 +1,79 @@
+import re
+import logging
+from database import aget_product_info
+from catalog_index import get_catalog_index
+from config import FAST_PATH_ENABLED
+from metrics import requests_served_total
+
+# Router berbasis aturan untuk pertanyaan stok/warna yang jawabannya sudah pasti
+# dari get_product_info, jadi tidak perlu lewat call_model_node -> ToolNode -> reflect_node.
+
+COLOR_WORDS = {'warna', 'warnanya', 'color', 'colors'}
+STOCK_WORDS = {'stok', 'stoknya', 'stock', 'ada', 'ready', 'tersedia', 'sisa'}
+# Kalau ada kata ini, intent-nya bukan sekadar cek stok/warna -> serahkan ke graph
+BLOCK_WORDS = {'pesan', 'beli', 'order', 'checkout', 'bayar', 'kirim', 'ongkir', 'refund', 'retur', 'tukar',
+               'kapan', 'kenapa', 'gimana', 'bagaimana', 'ukuran', 'size', 'harga', 'berapaan', 'diskon', 'promo'}
+# Kata yang boleh ada di sekitar nama produk tanpa mengubah intent
+FILLER_WORDS = {'apa', 'aja', 'saja', 'apaan', 'ga', 'gak', 'nggak', 'engga', 'kak', 'min', 'nih', 'ya', 'yg',
+                'yang', 'masih', 'berapa', 'untuk', 'buat', 'info', 'punya', 'jual', 'dong', 'sih', 'deh', 'kah',
+                'tidak', 'belum', 'pilihan', 'tersedianya', 'cek', 'lengkap', 'semua', 'nya', 'yah', 'kalo', 'kalau'}
+MAX_TOKENS = 10
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+route_stats = {"fast_path": 0, "graph": 0}
+
+def match_fast_path(message: str, catalog=None):
+    """Cocokkan pesan (hasil pre_process_message) ke intent stok/warna + satu produk katalog.
+
+    Return input untuk get_product_info (misal 'kemeja flanel warna'), atau None
+    kalau tidak yakin sehingga pesan harus diproses graph.
+    """
+    if not FAST_PATH_ENABLED:
+        return None
+    tokens = _TOKEN_RE.findall(message.lower())
+    if not tokens or len(tokens) > MAX_TOKENS:
+        return None
+    token_set = set(tokens)
+    if token_set & BLOCK_WORDS or any(t.isdigit() for t in tokens):
+        return None
+    if token_set & COLOR_WORDS:
+        info_type = 'warna'
+    elif token_set & STOCK_WORDS:
+        info_type = 'stok'
+    else:
+        return None
+
+    # Sisa kata setelah intent/filler dibuang harus persis nama satu produk katalog;
+    # kata asing berarti pertanyaannya lebih spesifik
+    name_tokens = [t for t in tokens if t not in COLOR_WORDS and t not in STOCK_WORDS and t not in FILLER_WORDS]
+    if not name_tokens:
+        return None
+    try:
+        product = (catalog if catalog is not None else get_catalog_index()).get_by_name(' '.join(name_tokens))
+    except Exception as e:
+        logging.error(f"Gagal membaca index katalog untuk fast path: {e}")
+        return None
+    if product is None:
+        return None
+    return f"{product['name']} {info_type}"
+
+# Jawaban seperti ini tetap diserahkan ke graph supaya LLM bisa kasih rekomendasi produk lain
+_HANDOFF_MARKERS = ("habis", "tidak ditemukan", "error")
+
+async def answer_fast_path(message: str):
+    """Jawab langsung dari database kalau pesan cocok fast path, selain itu None."""
+    tool_input = match_fast_path(message)
+    if tool_input is None:
+        return None
+    answer = await aget_product_info(tool_input)
+    if any(marker in answer.lower() for marker in _HANDOFF_MARKERS):
+        return None
+    return answer
+
+def record_route(path: str, user_number: str = None):
+    """Catat jalur yang melayani request (fast_path/graph) untuk memantau hit rate."""
+    route_stats[path] = route_stats.get(path, 0) + 1
+    requests_served_total.inc(path=path)
+    total = sum(route_stats.values())
+    logging.info(f"Dilayani oleh: {path} (user: {user_number}, fast path hit rate: {route_stats['fast_path'] / total:.1%} dari {total})")
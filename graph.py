@@ -1,16 +1,29 @@
+import time
+import asyncio
 import logging
 import operator
 from typing import TypedDict, Annotated, List
-from langchain_core.messages import BaseMessage, AIMessage, HumanMessage
+from langchain_core.messages import BaseMessage, AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
-from langgraph.checkpoint.memory import MemorySaver  # Untuk persistence
-from tools import order_tool, product_tool, faq_tool, llm, clarify_query  # Tambah clarify_query dari tools
+from langgraph.checkpoint.memory import MemorySaver
+from checkpointer import SqliteCheckpointSaver  # Untuk persistence
+from tools import order_tool, order_status_tool, product_tool, faq_tool, llm, clarify_query  # Tambah clarify_query dari tools
+from lazy import Lazy
+from metrics import timed, llm_call, graph_node_seconds, Gauge, register_collector
+from context_window import plan_window, build_context, summarize, asummarize, fallback_summary
+from config import GRAPH_REFLECT_MODE, GRAPH_DETERMINISTIC_TOOLS, GRAPH_MAX_LLM_CALLS, GRAPH_MAX_SECONDS
 
 # Gabungkan semua alat yang tersedia (tambah clarify kalau perlu)
-tools = [product_tool, order_tool, faq_tool, clarify_query]  # Tambah clarify tool
+tools = [product_tool, order_tool, order_status_tool, faq_tool, clarify_query]  # Tambah clarify tool
 # Ikat alat ke LLM
-llm_with_tools = llm.bind_tools(tools)
+llm_with_tools = Lazy("llm_with_tools", lambda: llm.get().bind_tools(tools))
+
+# Balasan kalau budget LLM/waktu habis dan tidak ada hasil tool yang bisa dipakai
+BUDGET_EXHAUSTED_MESSAGE = "Maaf, Kak, permintaannya butuh waktu lebih lama dari biasanya. Bisa diulang dengan lebih spesifik?"
+# Penanda output tool yang gagal/kosong (pemicu reflect di mode 'on_error')
+TOOL_ERROR_MARKERS = ("error", "gagal", "tidak ditemukan", "tidak tersedia")
 
 # State dengan tambahan flag untuk ambiguous/reflect
 class AgentState(TypedDict):
@@ -18,81 +31,249 @@ class AgentState(TypedDict):
     user_number: str
     is_ambiguous: bool  # Flag kalau query perlu clarify
     needs_reflection: bool  # Flag kalau output tool perlu review
+    llm_calls: int  # Jumlah panggilan LLM di invocation ini
+    deadline: float  # Batas waktu (epoch detik) invocation ini
+    max_llm_calls: int  # Jatah panggilan LLM invocation ini (termasuk ringkasan)
+    summary: str  # Ringkasan bergulir giliran lama (lihat context_window.py)
+    summary_upto: int  # Jumlah pesan awal yang sudah masuk ringkasan
 
-# Node utama yang memanggil LLM untuk reason
-def call_model_node(state: AgentState):
-    """Memanggil LLM untuk reason dan decide action."""
-    response = llm_with_tools.invoke(state['messages'])
+def _remaining_seconds(state: AgentState):
+    deadline = state.get('deadline')
+    return None if deadline is None else max(deadline - time.time(), 0.0)
+
+def _is_timeout(error: Exception) -> bool:
+    return isinstance(error, TimeoutError) or "timeout" in type(error).__name__.lower()  # openai.APITimeoutError
+
+def _invoke_llm(runnable, messages, state: AgentState, node: str):
+    """Panggil LLM dengan sisa waktu budget sebagai timeout request. None kalau waktu habis."""
+    remaining = _remaining_seconds(state)
+    if remaining is not None and remaining <= 0:
+        return None
+    try:
+        with llm_call(node) as record:
+            return record(runnable.invoke(messages, **({} if remaining is None else {"timeout": remaining})))
+    except Exception as e:
+        if not _is_timeout(e):
+            raise
+        logging.warning(f"LLM node {node} melewati batas waktu graph.")
+        return None
+
+async def _ainvoke_llm(runnable, messages, state: AgentState, node: str):
+    """Versi async _invoke_llm: wait_for memotong panggilan tepat di deadline."""
+    remaining = _remaining_seconds(state)
+    if remaining is not None and remaining <= 0:
+        return None
+    try:
+        with llm_call(node) as record:
+            request = runnable.ainvoke(messages, **({} if remaining is None else {"timeout": remaining}))
+            return record(await asyncio.wait_for(request, timeout=remaining))
+    except Exception as e:
+        if not _is_timeout(e):
+            raise
+        logging.warning(f"LLM node {node} melewati batas waktu graph.")
+        return None
+
+def _can_summarize(state: AgentState, llm_calls: int) -> bool:
+    """Ringkasan LLM hanya kalau jatahnya masih ada setelah panggilan agent ini."""
+    return llm_calls < state.get('max_llm_calls', float('inf')) and _remaining_seconds(state) != 0.0
+
+def _agent_update(response, llm_calls: int, summary: str, summary_upto: int) -> dict:
+    if response is None:
+        response = AIMessage(content=BUDGET_EXHAUSTED_MESSAGE)
     return {
         "messages": [response],
         "is_ambiguous": "ambiguous" in response.content.lower(),  # Detect kalau LLM bilang ambigu
-        "needs_reflection": False  # Default, set true kalau tool dipanggil
+        "needs_reflection": False,  # Default, set true kalau tool dipanggil
+        "llm_calls": llm_calls,
+        "summary": summary,
+        "summary_upto": summary_upto
     }
 
+# Node utama yang memanggil LLM untuk reason
+@timed(graph_node_seconds, node="agent")
+def call_model_node(state: AgentState):
+    """Memanggil LLM untuk reason dan decide action."""
+    # Kirim giliran terbaru saja; giliran lama dilipat ke ringkasan (di-cache di state)
+    summary_upto, kept, to_fold = plan_window(state['messages'], state.get('summary_upto', 0))
+    summary = state.get('summary', '')
+    llm_calls = state.get('llm_calls', 0) + 1
+    if to_fold and _can_summarize(state, llm_calls):
+        summary = summarize(llm, summary, to_fold, timeout=_remaining_seconds(state))
+        llm_calls += 1
+    elif to_fold:
+        summary = fallback_summary(summary, to_fold)  # Budget tidak cukup untuk panggilan ringkasan
+    response = _invoke_llm(llm_with_tools, build_context(summary, kept), state, "agent")
+    return _agent_update(response, llm_calls, summary, summary_upto)
+
+@timed(graph_node_seconds, node="agent")
+async def acall_model_node(state: AgentState):
+    """Versi async call_model_node (dipakai compiled_graph.ainvoke)."""
+    summary_upto, kept, to_fold = plan_window(state['messages'], state.get('summary_upto', 0))
+    summary = state.get('summary', '')
+    llm_calls = state.get('llm_calls', 0) + 1
+    if to_fold and _can_summarize(state, llm_calls):
+        summary = await asummarize(llm, summary, to_fold, timeout=_remaining_seconds(state))
+        llm_calls += 1
+    elif to_fold:
+        summary = fallback_summary(summary, to_fold)
+    response = await _ainvoke_llm(llm_with_tools, build_context(summary, kept), state, "agent")
+    return _agent_update(response, llm_calls, summary, summary_upto)
+
 # Node untuk jalankan tool
 tool_node = ToolNode(tools)
 
 # Node baru untuk clarify query ambigu
+CLARIFY_PROMPT = "Query user ambigu. Tanya klarifikasi santai atau rewrite ke format standard berdasarkan riwayat."
+REFLECT_PROMPT = "Review output tool terakhir. Kalau ambigu atau salah, decide next step (retry tool atau end)."
+
+def _clarify_update(state: AgentState, response) -> dict:
+    # Waktu habis: tanpa pesan, finalize yang menutup giliran
+    messages = [AIMessage(content=response.content)] if response is not None else []  # Balas tanya seperti "Produk mana nih, Kak?"
+    return {"messages": messages, "is_ambiguous": False, "llm_calls": state.get('llm_calls', 0) + 1}
+
+@timed(graph_node_seconds, node="clarify")
 def clarify_node(state: AgentState):
     """Handle query ambigu: LLM tanya klarifikasi atau rewrite."""
-    clarify_prompt = "Query user ambigu. Tanya klarifikasi santai atau rewrite ke format standard berdasarkan riwayat."
-    response = llm.invoke([HumanMessage(content=clarify_prompt)] + state['messages'][-3:])  # Pakai history terakhir
-    return {
-        "messages": [AIMessage(content=response.content)],  # Balas tanya seperti "Produk mana nih, Kak?"
-        "is_ambiguous": False  # Reset flag
-    }
+    response = _invoke_llm(llm, [HumanMessage(content=CLARIFY_PROMPT)] + state['messages'][-3:], state, "clarify")  # Pakai history terakhir
+    return _clarify_update(state, response)
+
+@timed(graph_node_seconds, node="clarify")
+async def aclarify_node(state: AgentState):
+    """Versi async clarify_node."""
+    response = await _ainvoke_llm(llm, [HumanMessage(content=CLARIFY_PROMPT)] + state['messages'][-3:], state, "clarify")
+    return _clarify_update(state, response)
+
+def _reflect_update(state: AgentState, response) -> dict:
+    # Waktu habis: hasil tool tetap pesan terakhir, jadi finalize bisa menjawab dari situ
+    messages = [AIMessage(content=response.content)] if response is not None else []
+    return {"messages": messages, "needs_reflection": False, "llm_calls": state.get('llm_calls', 0) + 1}
 
 # Node baru untuk self-reflection setelah tool
+@timed(graph_node_seconds, node="reflect")
 def reflect_node(state: AgentState):
     """Review output tool: LLM decide kalau perlu retry atau final."""
-    reflect_prompt = "Review output tool terakhir. Kalau ambigu atau salah, decide next step (retry tool atau end)."
-    response = llm.invoke([HumanMessage(content=reflect_prompt)] + state['messages'][-2:])  # Review tool result
-    return {
-        "messages": [AIMessage(content=response.content)],
-        "needs_reflection": False  # Reset
-    }
+    response = _invoke_llm(llm, [HumanMessage(content=REFLECT_PROMPT)] + state['messages'][-2:], state, "reflect")  # Review tool result
+    return _reflect_update(state, response)
+
+@timed(graph_node_seconds, node="reflect")
+async def areflect_node(state: AgentState):
+    """Versi async reflect_node."""
+    response = await _ainvoke_llm(llm, [HumanMessage(content=REFLECT_PROMPT)] + state['messages'][-2:], state, "reflect")
+    return _reflect_update(state, response)
+
+def _last_tool_messages(messages: List[BaseMessage]) -> List[ToolMessage]:
+    """ToolMessage hasil eksekusi terakhir (setelah AIMessage terakhir)."""
+    results = []
+    for message in reversed(messages):
+        if not isinstance(message, ToolMessage):
+            break
+        results.append(message)
+    return list(reversed(results))
+
+def tool_result_failed(message: ToolMessage) -> bool:
+    content = str(message.content).strip().lower()
+    return getattr(message, 'status', None) == 'error' or not content or any(marker in content for marker in TOOL_ERROR_MARKERS)
+
+# Node penutup kalau budget habis: jawab tanpa LLM
+@timed(graph_node_seconds, node="finalize")
+def finalize_node(state: AgentState):
+    """Susun jawaban akhir dari hasil tool terakhir, atau pesan fallback."""
+    tool_results = [m for m in _last_tool_messages(state['messages'])
+                    if m.name != faq_tool.name and not tool_result_failed(m)]
+    content = ' '.join(str(m.content) for m in tool_results) if tool_results else BUDGET_EXHAUSTED_MESSAGE
+    logging.info(f"Budget graph habis ({state.get('llm_calls', 0)} panggilan LLM), kirim jawaban final.")
+    return {"messages": [AIMessage(content=content)], "is_ambiguous": False, "needs_reflection": False}
+
+def build_graph(reflect_mode: str = GRAPH_REFLECT_MODE, deterministic_tools=GRAPH_DETERMINISTIC_TOOLS,
+                max_llm_calls: int = GRAPH_MAX_LLM_CALLS, max_seconds: float = GRAPH_MAX_SECONDS, checkpointer=None):
+    """Bangun dan compile graph agent.
+
+    reflect_mode: 'always' (reflect setiap habis tool), 'on_error' (hanya kalau tool
+    non-deterministik gagal/kosong), atau 'never'. max_llm_calls dan max_seconds
+    adalah budget per invocation; kalau habis, graph ditutup lewat finalize_node.
+    """
+    deterministic_tools = set(deterministic_tools)
+
+    def start_node(state: AgentState):
+        # Reset budget tiap invocation (state lain tetap dari checkpointer)
+        return {"llm_calls": 0, "deadline": time.time() + max_seconds, "max_llm_calls": max_llm_calls}
+
+    def budget_left(state: AgentState) -> bool:
+        return state.get('llm_calls', 0) < max_llm_calls and time.time() < state.get('deadline', float('inf'))
+
+    # Kondisional untuk decide alur
+    def should_continue_node(state: AgentState):
+        last_message = state['messages'][-1]
+        if state['is_ambiguous']:
+            # Ke clarify kalau ambigu; budget habis -> finalize (teks mentah 'ambiguous' jangan sampai ke pelanggan)
+            return "clarify" if budget_left(state) else "finalize"
+        if last_message.tool_calls:
+            return "action"  # Ke tool (tetap dijalankan supaya tool_call selalu punya hasil)
+        return "end"  # Selesai (reflect diputuskan setelah node action, lihat after_tool_node)
+
+    def needs_reflection(state: AgentState) -> bool:
+        if reflect_mode == 'always':
+            return True
+        if reflect_mode == 'never':
+            return False
+        return any(m.name not in deterministic_tools and tool_result_failed(m)
+                   for m in _last_tool_messages(state['messages']))
+
+    def after_tool_node(state: AgentState):
+        if not budget_left(state):
+            return "finalize"
+        return "reflect" if needs_reflection(state) else "agent"
+
+    def after_llm_node(state: AgentState):
+        return "agent" if budget_left(state) else "finalize"
+
+    # Membangun graph
+    graph = StateGraph(AgentState)
+
+    # Tambah node (sync untuk invoke, async untuk ainvoke)
+    graph.add_node("start", start_node)
+    graph.add_node("agent", RunnableLambda(call_model_node, afunc=acall_model_node))
+    graph.add_node("action", tool_node)
+    graph.add_node("clarify", RunnableLambda(clarify_node, afunc=aclarify_node))  # Node baru
+    graph.add_node("reflect", RunnableLambda(reflect_node, afunc=areflect_node))  # Node baru
+    graph.add_node("finalize", finalize_node)
+
+    # Entry point
+    graph.set_entry_point("start")
+    graph.add_edge("start", "agent")
+
+    # Conditional edges
+    graph.add_conditional_edges(
+        "agent",
+        should_continue_node,
+        {
+            "clarify": "clarify",
+            "action": "action",
+            "finalize": "finalize",
+            "end": END,
+        },
+    )
+    # Setelah tool: reflect hanya kalau perlu, selain itu langsung balik ke agent
+    graph.add_conditional_edges("action", after_tool_node, {"reflect": "reflect", "agent": "agent", "finalize": "finalize"})
+    graph.add_conditional_edges("clarify", after_llm_node, {"agent": "agent", "finalize": "finalize"})  # Loop kembali ke agent setelah clarify
+    graph.add_conditional_edges("reflect", after_llm_node, {"agent": "agent", "finalize": "finalize"})  # Loop kalau perlu retry dari reflect
+    graph.add_edge("finalize", END)
+
+    return graph.compile(checkpointer=checkpointer if checkpointer is not None else MemorySaver())
+
+# Compile dengan checkpointer SQLite (bertahan saat restart, dibagi antar worker).
+# Lazy: graph baru dibangun saat request pertama atau warm-up, bukan saat import.
+compiled_graph = Lazy("compiled_graph", lambda: build_graph(checkpointer=SqliteCheckpointSaver()))
+logging.basicConfig(level=logging.INFO)
+
+checkpointer_stats = Gauge("graph_checkpointer", "Baris dan ukuran file checkpointer graph (lihat SqliteCheckpointSaver.stats).", ("stat",))
+
+def _collect_metrics():
+    if not compiled_graph.loaded:
+        return  # Scrape /metrics tidak boleh membangun graph atau membuka DB checkpoint
+    checkpointer = compiled_graph.get().checkpointer
+    if hasattr(checkpointer, "stats"):
+        for stat, value in checkpointer.stats().items():
+            checkpointer_stats.set(value, stat=stat)
 
-# Kondisional untuk decide alur
-def should_continue_node(state: AgentState):
-    last_message = state['messages'][-1]
-    if state['is_ambiguous']:
-        return "clarify"  # Ke clarify kalau ambigu
-    if last_message.tool_calls:
-        return "action"  # Ke tool
-    if state['needs_reflection']:
-        return "reflect"  # Ke reflect setelah tool
-    return "end"  # Selesai
-
-# Membangun graph
-graph = StateGraph(AgentState)
-
-# Tambah node
-graph.add_node("agent", call_model_node)
-graph.add_node("action", tool_node)
-graph.add_node("clarify", clarify_node)  # Node baru
-graph.add_node("reflect", reflect_node)  # Node baru
-
-# Entry point
-graph.set_entry_point("agent")
-
-# Conditional edges
-graph.add_conditional_edges(
-    "agent",
-    should_continue_node,
-    {
-        "clarify": "clarify",
-        "action": "action",
-        "reflect": "reflect",
-        "end": END,
-    },
-)
-
-# Edges lain
-graph.add_edge("action", "reflect")  # Setelah tool, selalu reflect
-graph.add_edge("clarify", "agent")  # Loop kembali ke agent setelah clarify
-graph.add_edge("reflect", "agent")  # Loop kalau perlu retry dari reflect
-
-# Compile dengan MemorySaver
-memory_saver = MemorySaver()
-compiled_graph = graph.compile(checkpointer=memory_saver)
-logging.basicConfig(level=logging.INFO)
\ No newline at end of file
+register_collector(_collect_metrics)
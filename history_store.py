@@ -0,0 +1,207 @@
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict, deque
+from config import (cipher_suite, HISTORY_MAX_TURNS, HISTORY_MAX_USERS, HISTORY_SUMMARY_TTL_SECONDS, HISTORY_DB_PATH,
+                    HISTORY_TTL_SECONDS, HISTORY_SHARED)
+
+# Riwayat chat per pelanggan (pengganti dict full_histories yang tumbuh tanpa batas).
+# Di memori: deque terenkripsi berukuran tetap per user, LRU atas user. Teks polos
+# beberapa giliran terakhir di-cache sebentar supaya ringkasan tidak didekripsi
+# ulang tiap request. Opsional: disimpan terenkripsi di SQLite supaya tahan restart
+# dan user yang keluar dari LRU bisa dimuat lagi.
+#
+# Mode shared (beberapa worker uvicorn): riwayat selalu dibaca dari SQLite supaya
+# semua worker melihat data yang sama; dekripsi di-cache per ciphertext (ciphertext
+# tidak pernah berubah, jadi cache tidak bisa basi). State backend SQLite memakai
+# tabel yang sama di koneksinya sendiri (insert_turn/select_recent), supaya riwayat
+# ikut transaksi giliran.
+
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_number TEXT NOT NULL,
+    user_message BLOB NOT NULL,
+    response BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_history_user_number_id ON history (user_number, id);
+CREATE INDEX IF NOT EXISTS ix_history_created_at ON history (created_at);
+"""
+
+SUMMARY_TURNS = 3  # Giliran terakhir yang masuk ringkasan (sama seperti sebelumnya)
+DECRYPT_CACHE_SIZE = 4096  # Ciphertext -> teks polos, mode shared
+
+def format_summary(turns: list) -> str:
+    return ' '.join(f"Pelanggan: {u} | Respons: {r}" for u, r in turns)
+
+class HistoryStore:
+    """Riwayat chat terenkripsi: deque per user + LRU user + cache ringkasan + SQLite opsional."""
+
+    def __init__(self, path: str = HISTORY_DB_PATH, max_turns: int = HISTORY_MAX_TURNS, max_users: int = HISTORY_MAX_USERS,
+                 summary_ttl: float = HISTORY_SUMMARY_TTL_SECONDS, ttl_seconds: float = HISTORY_TTL_SECONDS,
+                 cipher=cipher_suite, prune_interval: float = 3600, shared: bool = HISTORY_SHARED):
+        self.max_turns = max_turns
+        self.max_users = max_users
+        self.summary_ttl = summary_ttl
+        self.ttl_seconds = ttl_seconds
+        self.cipher = cipher
+        self.prune_interval = prune_interval
+        self._last_prune = time.time()
+        self._users = OrderedDict()  # user -> deque[(user_message_enc, response_enc)]
+        self._plain = {}  # user -> (kedaluwarsa, [(user_message, response)]) giliran terakhir, teks polos
+        self._decrypted = OrderedDict()  # ciphertext -> (kedaluwarsa, teks polos), mode shared
+        self._lock = threading.Lock()  # Struktur di memori; tidak pernah dipegang selama I/O disk
+        self._db_lock = threading.Lock()  # Satu koneksi SQLite dipakai bersama thread
+        self.decryptions = 0
+        self.shared = shared and bool(path)
+        self.conn = None
+        if path:
+            self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("PRAGMA busy_timeout=30000")
+            with self._db_lock, self.conn:
+                self.conn.executescript(HISTORY_SCHEMA)
+
+    def _encrypt(self, text: str) -> bytes:
+        return self.cipher.encrypt(text.encode())
+
+    def _decrypt(self, token: bytes) -> str:
+        self.decryptions += 1
+        return self.cipher.decrypt(token).decode()
+
+    def _decrypt_cached(self, token: bytes, now: float) -> str:
+        cached = self._decrypted.get(token)
+        if cached is not None and cached[0] > now:
+            self._decrypted.move_to_end(token)
+            return cached[1]
+        text = self._decrypt(token)
+        self._decrypted[token] = (now + self.summary_ttl, text)
+        if len(self._decrypted) > DECRYPT_CACHE_SIZE:
+            self._decrypted.popitem(last=False)
+        return text
+
+    def _load(self, user_number: str, limit: int) -> list:
+        with self._db_lock:
+            return self.select_recent(self.conn, user_number, limit)
+
+    def select_recent(self, conn, user_number: str, limit: int = SUMMARY_TURNS) -> list:
+        """Giliran terenkripsi terakhir (lama -> baru) lewat koneksi pemanggil."""
+        rows = conn.execute(
+            "SELECT user_message, response FROM history WHERE user_number = ? ORDER BY id DESC LIMIT ?",
+            (user_number, limit)).fetchall()
+        return list(reversed(rows))
+
+    def insert_turn(self, conn, user_number: str, encrypted: tuple, now: float):
+        """INSERT satu giliran dan pangkas ke max_turns, di transaksi pemanggil (tanpa commit)."""
+        conn.execute("INSERT INTO history (user_number, user_message, response, created_at) VALUES (?, ?, ?, ?)",
+                     (user_number, encrypted[0], encrypted[1], now))
+        # Simpan paling banyak max_turns baris per user
+        conn.execute(
+            "DELETE FROM history WHERE user_number = ? AND id <= "
+            "(SELECT id FROM history WHERE user_number = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+            (user_number, user_number, self.max_turns))
+
+    def encrypt_turn(self, user_message: str, response: str, now: float) -> tuple:
+        """Enkripsi satu giliran; teks polosnya langsung masuk cache dekripsi (worker ini tidak mendekripsi ulang)."""
+        encrypted = (self._encrypt(user_message), self._encrypt(response))
+        with self._lock:
+            for token, text in zip(encrypted, (user_message, response)):
+                self._decrypted[token] = (now + self.summary_ttl, text)
+            while len(self._decrypted) > DECRYPT_CACHE_SIZE:
+                self._decrypted.popitem(last=False)
+        return encrypted
+
+    def summarize_rows(self, rows: list) -> str:
+        """Ringkasan dari baris hasil select_recent (dekripsi lewat cache per ciphertext)."""
+        now = time.time()
+        with self._lock:
+            return format_summary([(self._decrypt_cached(u, now), self._decrypt_cached(r, now)) for u, r in rows])
+
+    def _entries(self, user_number: str):
+        """Deque user di memori (ditandai paling baru di LRU), None kalau belum dimuat. Panggil di bawah _lock."""
+        entries = self._users.get(user_number)
+        if entries is not None:
+            self._users.move_to_end(user_number)
+        return entries
+
+    def _remember(self, user_number: str, loaded: list) -> deque:
+        """Pasang deque hasil muat disk, kecuali thread lain sudah memasangnya duluan. Panggil di bawah _lock."""
+        entries = self._entries(user_number)
+        if entries is None:
+            entries = self._users[user_number] = deque(loaded, maxlen=self.max_turns)
+            while len(self._users) > self.max_users:
+                evicted, _ = self._users.popitem(last=False)
+                self._plain.pop(evicted, None)
+        return entries
+
+    def _loaded_entries(self, user_number: str) -> deque:
+        """Deque user; dimuat dari disk di luar _lock kalau belum ada di memori."""
+        with self._lock:
+            entries = self._entries(user_number)
+        if entries is not None:
+            return entries
+        loaded = self._load(user_number, self.max_turns) if self.conn is not None else []
+        with self._lock:
+            return self._remember(user_number, loaded)
+
+    def append(self, user_number: str, user_message: str, response: str):
+        """Tulis satu giliran. Memblok (SQLite): dari event loop panggil lewat asyncio.to_thread."""
+        now = time.time()
+        if self.shared:
+            # Worker yang membaca bisa berbeda: cukup isi cache dekripsi per ciphertext
+            encrypted = self.encrypt_turn(user_message, response, now)
+        else:
+            encrypted = (self._encrypt(user_message), self._encrypt(response))
+            # Memori diperbarui sebelum disk: deque yang dimuat thread lain setelah INSERT tidak dipasang lagi
+            self._loaded_entries(user_number)
+            with self._lock:
+                self._remember(user_number, []).append(encrypted)
+                # Teks polos sudah di tangan: perbarui cache tanpa dekripsi
+                cached = self._plain.get(user_number)
+                if cached is not None and cached[0] > now:
+                    recent = (cached[1] + [(user_message, response)])[-SUMMARY_TURNS:]
+                    self._plain[user_number] = (now + self.summary_ttl, recent)
+        if self.conn is not None:
+            with self._db_lock:
+                with self.conn:
+                    self.insert_turn(self.conn, user_number, encrypted, now)
+                if now - self._last_prune > self.prune_interval:
+                    self._last_prune = now
+                    with self.conn:
+                        self.prune(self.conn, now - self.ttl_seconds)
+
+    def recent(self, user_number: str, turns: int = SUMMARY_TURNS) -> list:
+        """[(pesan_user, respons)] terakhir dalam teks polos. Bisa membaca SQLite: dari event loop lewat to_thread."""
+        now = time.time()
+        if self.shared:
+            rows = self._load(user_number, turns)
+            with self._lock:
+                return [(self._decrypt_cached(u, now), self._decrypt_cached(r, now)) for u, r in rows]
+        with self._lock:
+            cached = self._plain.get(user_number)
+            if cached is not None and cached[0] > now and turns <= SUMMARY_TURNS:
+                return cached[1][-turns:]
+        entries = self._loaded_entries(user_number)
+        with self._lock:
+            entries = list(entries)[-max(turns, SUMMARY_TURNS):]
+            if not entries:
+                return []
+            plain = [(self._decrypt(u), self._decrypt(r)) for u, r in entries]
+            self._plain[user_number] = (now + self.summary_ttl, plain[-SUMMARY_TURNS:])
+            return plain[-turns:]
+
+    def summary(self, user_number: str, turns: int = SUMMARY_TURNS) -> str:
+        return format_summary(self.recent(user_number, turns))
+
+    def prune(self, conn, cutoff: float) -> int:
+        """Hapus giliran yang lebih tua dari cutoff, di transaksi pemanggil."""
+        deleted = conn.execute("DELETE FROM history WHERE created_at < ?", (cutoff,)).rowcount
+        if deleted:
+            logging.info(f"Riwayat chat: {deleted} baris lama dihapus.")
+        return deleted
+
+    def __len__(self):
+        return len(self._users)
@@ -0,0 +1,221 @@
+import re
+import logging
+from collections import deque
+from functools import lru_cache
+from config import MODERATION_WORDS_PATH
+from prompts import negative_keywords_id, negative_keywords_en
+
+# Semua kamus kata untuk pipeline teks (moderasi, emosi negatif, typo, slang, intent)
+# dikompilasi sekali jadi satu matcher Aho-Corasick. Tiap teks cukup di-lowercase,
+# di-tokenize dan discan sekali oleh analyze(); biaya per pesan sebanding panjang
+# teks, bukan jumlah keyword, jadi daftar moderasi boleh berisi ribuan kata.
+
+bad_words = ['badword1', 'badword2']
+
+# Dict typo umum (tambah lebih banyak kalau perlu berdasarkan test)
+typo_dict = {
+    'kemaja': 'kemeja',
+    'flannl': 'flanel',
+    'flannel': 'flanel',
+    'flanelnya': 'flanel',
+    'chinno': 'chino',
+    'chinonya': 'chino',
+    'sepato': 'sepatu',
+    'ketz': 'kets',
+    'stok': 'stok',  # Tetap, tapi untuk konsistensi
+    'warnaa': 'warna',
+    'adah': 'ada',
+    'ga': 'ga',  # Handle "ga" sebagai negasi, tapi skip untuk sekarang
+}
+
+# Slang santai yang dibuang dari pesan: "deh", "aja", "sih", ...
+slang_fillers = ['deh', 'aja', 'sih', 'nih', 'dong', 'banget', 'emg', 'emang', 'emangnya']
+
+# Kata tanya/stop words yang dibuang saat menebak nama produk dari pesan user
+stop_words = ['ada', 'stok', 'warna', 'apa', 'aja', 'berapa', 'info', 'lengkap', 'untuk', 'nih', 'yuk', 'punya', 'jual', 'apaan', '?']
+
+# Grup keyword yang dicocokkan sebagai substring (sama seperti `kw in text` sebelumnya)
+keyword_groups = {
+    'bad': bad_words,
+    'negatif_id': negative_keywords_id,
+    'negatif_en': negative_keywords_en,
+    'tanya_warna': ['warna', 'color'],
+    'tanya_stok': ['stok', 'ada', 'punya', 'jual'],
+    'niat_pesan': ['mau', 'beli'],
+    'tidak_ditemukan': ['tidak ditemukan', 'tidak dapat menemukan'],
+    'stok_kosong': ['habis', 'tidak ada'],
+    'produk_kosong': ['tidak ditemukan', 'tidak memiliki', 'habis'],
+    'tanya_jumlah': ['mau berapa', 'jumlahnya'],
+    # Dicek satu per satu lewat TextAnalysis.has()
+    'respons': ['coba', 'yuk!', 'pilihan warna', 'pesanan', 'berhasil', 'stok', 'pcs', 'warna'],
+}
+
+_NO_HITS = (frozenset(), ())
+
+class KeywordMatcher:
+    """Aho-Corasick: temukan semua keyword yang muncul (sebagai substring) dalam satu kali jalan.
+
+    Teks dipotong per spasi dan automaton dijalankan per potongan; hasil per potongan
+    di-cache, jadi kata yang sering muncul (template balasan, kata umum) tidak discan
+    ulang. Keyword berisi spasi ("tidak ada") dicocokkan lintas potongan dengan aturan
+    yang sama dengan `kw in text`: potongan pertama berakhiran kata pertama, potongan
+    tengah sama persis, potongan terakhir berawalan kata terakhir.
+    """
+
+    def __init__(self, keywords, cache_size: int = 65536):
+        self._words = frozenset(k for k in keywords if " " not in k)
+        self._phrases = {}  # Kata pertama frasa -> [(frasa, potongan sisanya)]
+        for phrase in keywords:
+            if " " in phrase:
+                head, *rest = phrase.split(" ")
+                self._phrases.setdefault(head, []).append((phrase, tuple(rest)))
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        for keyword in self._words | self._phrases.keys():
+            self._add(keyword)
+        self._build_failure_links()
+        self._piece_cache = {}  # Potongan -> (keyword, frasa yang mungkin dimulai di sini)
+        self._plain_pieces = set()  # Potongan tanpa keyword sama sekali
+        self._cache_size = cache_size
+
+    def _add(self, keyword: str):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+        self._output[state] += (keyword,)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                # Keyword yang berakhir di state fallback juga cocok di sini ("stoknya" -> "nya")
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def _scan(self, piece: str):
+        """(keyword dalam potongan, frasa yang kata pertamanya jadi akhiran potongan)."""
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        state = 0
+        for char in piece:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        # Output state terakhir = semua keyword yang jadi akhiran potongan
+        phrases = tuple(p for head in output[state] if head in self._phrases for p in self._phrases[head])
+        return frozenset(found & self._words), phrases
+
+    def find(self, text: str) -> set:
+        pieces = text.split(" ")
+        found = set()
+        phrase_heads = []
+        # Potongan yang sudah diketahui tanpa keyword dibuang sekaligus (operasi set, bukan loop)
+        for piece in set(pieces).difference(self._plain_pieces):
+            scanned = self._piece_cache.get(piece) or self._scan_new(piece)
+            if scanned is _NO_HITS:
+                continue
+            words, phrases = scanned
+            found |= words
+            if phrases:
+                phrase_heads.append((piece, phrases))
+        for piece, phrases in phrase_heads:
+            for phrase, rest in phrases:
+                if phrase not in found and self._phrase_in(pieces, piece, rest):
+                    found.add(phrase)
+        return found
+
+    def _scan_new(self, piece: str):
+        if len(self._piece_cache) + len(self._plain_pieces) >= self._cache_size:
+            self._piece_cache.clear()  # Kosongkan saja; kata umum cepat masuk lagi
+            self._plain_pieces.clear()
+        words, phrases = self._scan(piece)
+        if not words and not phrases:
+            self._plain_pieces.add(piece)
+            return _NO_HITS
+        scanned = self._piece_cache[piece] = (words, phrases)
+        return scanned
+
+    @staticmethod
+    def _phrase_in(pieces: list, head_piece: str, rest: tuple) -> bool:
+        start = 0
+        while True:
+            try:
+                start = pieces.index(head_piece, start) + 1
+            except ValueError:
+                return False
+            end = start + len(rest)
+            if end <= len(pieces) and pieces[end - 1].startswith(rest[-1]) and all(
+                    pieces[start + j] == part for j, part in enumerate(rest[:-1])):
+                return True
+
+def _load_extra_bad_words(path: str) -> list:
+    """Daftar kata terlarang tambahan dari file (satu per baris, '#' = komentar)."""
+    if not path:
+        return []
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [line.strip().lower() for line in f if line.strip() and not line.startswith("#")]
+    except OSError as e:
+        logging.error(f"Gagal baca daftar moderasi {path}: {e}")
+        return []
+
+def _token_rewrites() -> dict:
+    """Token -> hasil koreksi typo, atau None kalau token dibuang (slang filler)."""
+    fillers = set(slang_fillers)
+    rewrites = {word: None for word in fillers}
+    for typo, correction in typo_dict.items():
+        rewrites[typo] = None if correction in fillers else correction
+    return rewrites
+
+keyword_groups['bad'] = bad_words + _load_extra_bad_words(MODERATION_WORDS_PATH)
+_group_sets = {group: frozenset(words) for group, words in keyword_groups.items()}
+_known_keywords = frozenset().union(*_group_sets.values())
+matcher = KeywordMatcher(sorted(_known_keywords))
+token_rewrites = _token_rewrites()
+stop_word_set = frozenset(stop_words)
+_DIGIT_RE = re.compile(r"\d")
+
+class TextAnalysis:
+    """Hasil scan satu teks: lowercase dan semua keyword yang ditemukan."""
+    __slots__ = ("lower", "hits")
+
+    def __init__(self, lower: str, hits: frozenset):
+        self.lower = lower
+        self.hits = hits
+
+    @property
+    def tokens(self) -> list:
+        return self.lower.split()
+
+    @property
+    def has_digit(self) -> bool:
+        return _DIGIT_RE.search(self.lower) is not None
+
+    def has(self, keyword: str) -> bool:
+        if keyword not in _known_keywords:
+            raise KeyError(f"Keyword '{keyword}' belum didaftarkan di keyword_groups")
+        return keyword in self.hits
+
+    def any_of(self, group: str) -> bool:
+        return not self.hits.isdisjoint(_group_sets[group])
+
+@lru_cache(maxsize=4096)
+def analyze(text: str) -> TextAnalysis:
+    """Scan teks sekali; hasilnya dipakai bersama oleh semua tahap di utils (di-cache per teks)."""
+    lower = (text or "").lower()
+    return TextAnalysis(lower, frozenset(matcher.find(lower)))
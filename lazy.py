@@ -0,0 +1,79 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Inisialisasi malas untuk dependency berat (client Twilio/Midtrans, Fernet, LLM,
+# index FAQ, graph). Import app.py tidak lagi membangun semuanya; tiap komponen
+# dibuat saat pertama dipakai (atau saat warm-up) dan waktunya dicatat.
+
+startup_timings = OrderedDict()  # nama komponen -> detik
+_timings_lock = threading.Lock()
+
+def record_timing(name: str, seconds: float):
+    with _timings_lock:
+        startup_timings[name] = seconds
+    logging.info(f"Init {name}: {seconds * 1000:.0f} ms")
+
+@contextmanager
+def timed(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - started)
+
+class Lazy:
+    """Proxy thread-safe: objek asli dibuat factory saat atribut pertama kali diakses."""
+
+    def __init__(self, name: str, factory):
+        # Atribut proxy diberi prefix supaya tidak menutupi atribut objek asli (mis. graph.name)
+        object.__setattr__(self, '_lazy_name', name)
+        object.__setattr__(self, '_lazy_factory', factory)
+        object.__setattr__(self, '_lazy_value', None)
+        object.__setattr__(self, '_lazy_ready', False)
+        object.__setattr__(self, '_lazy_lock', threading.Lock())
+
+    def get(self):
+        if not self._lazy_ready:
+            with self._lazy_lock:
+                if not self._lazy_ready:
+                    with timed(self._lazy_name):
+                        value = self._lazy_factory()
+                    object.__setattr__(self, '_lazy_value', value)
+                    object.__setattr__(self, '_lazy_ready', True)
+        return self._lazy_value
+
+    def set(self, value):
+        """Tukar objek asli secara atomik (mis. reload index); pemakai yang sudah pegang objek lama tidak terganggu."""
+        with self._lazy_lock:
+            object.__setattr__(self, '_lazy_value', value)
+            object.__setattr__(self, '_lazy_ready', True)
+
+    @property
+    def loaded(self) -> bool:
+        return self._lazy_ready
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self.get(), attr, value)
+
+    def __repr__(self):
+        state = repr(self._lazy_value) if self._lazy_ready else 'belum dibuat'
+        return f"<Lazy {self._lazy_name}: {state}>"
+
+def warm_up(*components):
+    """Buat komponen sekarang (mis. saat startup) supaya request pertama tidak menanggungnya."""
+    for component in components:
+        try:
+            component.get()
+        except Exception as e:
+            logging.error(f"Warm-up {component._lazy_name} gagal: {e}")
+    return startup_report()
+
+def startup_report() -> dict:
+    with _timings_lock:
+        return {name: round(seconds * 1000, 1) for name, seconds in startup_timings.items()}
@@ -0,0 +1,151 @@
+import io
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from async_clients import get_http_client
+from metrics import timed, outbound_request_seconds
+from config import (TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, MEDIA_MAX_BYTES, MEDIA_MAX_DIMENSION, MEDIA_JPEG_QUALITY,
+                    MEDIA_CACHE_SIZE, MEDIA_CACHE_TTL_SECONDS)
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow opsional: tanpa Pillow gambar dikirim apa adanya (tetap dibatasi ukurannya)
+    Image = None
+
+# Pipeline gambar dari Twilio untuk model vision: unduh streaming dengan batas
+# byte lewat client httpx bersama, perkecil + kompres ulang ke JPEG, lalu cache
+# per URL dan per hash konten supaya webhook yang di-retry tidak mengunduh atau
+# menganalisis gambar yang sama dua kali.
+
+class MediaTooLarge(Exception):
+    pass
+
+@timed(outbound_request_seconds, service="twilio_media")
+async def fetch_media(url: str, client=None, max_bytes: int = MEDIA_MAX_BYTES, auth=None):
+    """Unduh media secara streaming. Return (bytes, content_type); MediaTooLarge kalau melewati batas."""
+    client = client or get_http_client()
+    async with client.stream("GET", url, auth=auth) as response:
+        response.raise_for_status()
+        declared = response.headers.get("content-length")
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise MediaTooLarge(f"{declared} byte > batas {max_bytes}")  # Tolak sebelum body dibaca
+        chunks, total = [], 0
+        async for chunk in response.aiter_bytes():
+            total += len(chunk)
+            if total > max_bytes:
+                raise MediaTooLarge(f"lebih dari batas {max_bytes} byte")
+            chunks.append(chunk)
+        return b"".join(chunks), response.headers.get("content-type", "application/octet-stream")
+
+def downscale_image(data: bytes, max_dimension: int = MEDIA_MAX_DIMENSION, quality: int = MEDIA_JPEG_QUALITY):
+    """Perkecil sisi terpanjang ke max_dimension dan kompres ke JPEG. Return (bytes, mime_type)."""
+    if Image is None:
+        return data, None
+    with Image.open(io.BytesIO(data)) as image:
+        source_format = image.format
+        image.draft("RGB", (max_dimension, max_dimension))  # JPEG: decode langsung di resolusi kecil
+        image = ImageOps.exif_transpose(image)
+        small_enough = max(image.size) <= max_dimension
+        image.thumbnail((max_dimension, max_dimension))
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=quality, optimize=True)
+    compressed = output.getvalue()
+    if small_enough and source_format == "JPEG" and len(data) <= len(compressed):
+        return data, "image/jpeg"  # Sudah kecil, kompres ulang tidak menghemat
+    return compressed, "image/jpeg"
+
+class MediaCache:
+    """LRU + TTL: URL -> hash konten, hash -> gambar siap kirim, (hash, kunci) -> hasil analisis."""
+
+    def __init__(self, max_entries: int = MEDIA_CACHE_SIZE, ttl_seconds: float = MEDIA_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._maps = {"url": OrderedDict(), "image": OrderedDict(), "analysis": OrderedDict()}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, kind: str, key):
+        with self._lock:
+            entries = self._maps[kind]
+            entry = entries.get(key)
+            if entry is None or entry[0] < time.time():
+                entries.pop(key, None)
+                self.misses += 1
+                return None
+            entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _set(self, kind: str, key, value):
+        with self._lock:
+            entries = self._maps[kind]
+            entries[key] = (time.time() + self.ttl_seconds, value)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def get_image(self, url: str = None, sha256: str = None):
+        if sha256 is None and url is not None:
+            sha256 = self._get("url", url)
+        return self._get("image", sha256) if sha256 else None
+
+    def set_image(self, url: str, image: dict):
+        self._set("url", url, image["sha256"])
+        self._set("image", image["sha256"], image)
+
+    def get_analysis(self, sha256: str, key: str):
+        return self._get("analysis", (sha256, key))
+
+    def set_analysis(self, sha256: str, key: str, text: str):
+        self._set("analysis", (sha256, key), text)
+
+media_cache = MediaCache()
+
+async def prepare_image(url: str, client=None, auth=None, cache: MediaCache = None):
+    """Gambar siap untuk model vision: {'sha256', 'base64', 'mime_type', 'bytes', 'original_bytes'} atau None."""
+    cache = cache or media_cache
+    cached = cache.get_image(url=url)
+    if cached is not None:
+        return cached
+    try:
+        data, content_type = await fetch_media(url, client=client, auth=auth)
+    except MediaTooLarge as e:
+        logging.warning(f"Media ditolak, terlalu besar: {url} ({e})")
+        return None
+    except Exception as e:
+        logging.error(f"Error download image: {e}")
+        return None
+    sha256 = hashlib.sha256(data).hexdigest()
+    cached = cache.get_image(sha256=sha256)  # URL beda, gambar sama
+    if cached is None:
+        try:
+            # Decode/resize butuh CPU: jalankan di thread supaya event loop tidak tertahan
+            processed, mime_type = await asyncio.to_thread(downscale_image, data)
+        except Exception as e:
+            logging.error(f"Gagal memproses gambar: {e}")
+            return None
+        cached = {
+            "sha256": sha256,
+            "base64": base64.b64encode(processed).decode("utf-8"),
+            "mime_type": mime_type or content_type,
+            "bytes": len(processed),
+            "original_bytes": len(data),
+        }
+        logging.info(f"Gambar diproses: {len(data)} -> {len(processed)} byte.")
+    cache.set_image(url, cached)
+    return cached
+
+async def prepare_twilio_image(media_url: str):
+    return await prepare_image(media_url, auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN))
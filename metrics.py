@@ -0,0 +1,251 @@
+import time
+import bisect
+import asyncio
+import logging
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Metrik internal (histogram/counter/gauge) dengan output format teks Prometheus
+# untuk /metrics. Tanpa dependency: observe() cuma lock + bisect + tambah angka,
+# teks baru dirender saat ada yang scrape.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+_registry = []
+_collectors = []
+
+def _label_text(labelnames, values, extra=None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple([labels.get(name, "") for name in self.labelnames])
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value) -> list:
+        return [f"{self.name}{_label_text(self.labelnames, key)} {_number(value)}"]
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)  # Bucket 'le' pertama yang >= value
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def _render_value(self, key, state) -> list:
+        counts, total, count = state
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = 'le="' + _number(bound) + '"'
+            lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, le)} {cumulative}")
+        labels = _label_text(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_number(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+def register_collector(collect):
+    """collect() dipanggil tiap scrape untuk mengisi Gauge dari sumber lain (antrian, DB)."""
+    _collectors.append(collect)
+
+def render() -> str:
+    for collect in list(_collectors):
+        try:
+            collect()
+        except Exception as e:
+            logging.error(f"Collector metrik gagal: {e}")
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def timed(histogram: Histogram, **labels):
+    """Decorator: catat durasi fungsi (sync atau async) ke histogram."""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started, **labels)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, **labels)
+        return wrapper
+    return decorator
+
+# --- Metrik aplikasi ---
+
+http_request_seconds = Histogram("http_request_seconds", "Latensi request HTTP masuk.", ("route", "method", "status"))
+requests_served_total = Counter("requests_served_total", "Pesan WhatsApp per jalur yang melayani.", ("path",))
+graph_node_seconds = Histogram("graph_node_seconds", "Durasi tiap node graph LangGraph.", ("node",))
+tool_seconds = Histogram("tool_seconds", "Durasi eksekusi tool agent.", ("tool",))
+db_query_seconds = Histogram("db_query_seconds", "Durasi query SQLAlchemy ke database produk/order.", ("operation",))
+outbound_request_seconds = Histogram("outbound_request_seconds", "Durasi panggilan ke layanan luar.", ("service",))
+llm_calls_total = Counter("llm_calls_total", "Panggilan LLM per node.", ("node", "status"))
+llm_tokens_total = Counter("llm_tokens_total", "Token LLM per node.", ("node", "type"))
+llm_calls_per_request = Histogram("llm_calls_per_request", "Panggilan LLM per pesan yang lewat graph.", buckets=COUNT_BUCKETS)
+llm_tokens_per_request = Histogram("llm_tokens_per_request", "Total token LLM per pesan yang lewat graph.", buckets=TOKEN_BUCKETS)
+
+# Akumulator per request (pesan WhatsApp); None di luar track_request()
+_request_usage = contextvars.ContextVar("request_usage", default=None)
+
+def _token_usage(response):
+    """(input, output) dari AIMessage.usage_metadata atau response OpenAI mentah; None kalau tidak ada."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = getattr(response, "usage", None)
+    if usage is not None and hasattr(usage, "prompt_tokens"):
+        return usage.prompt_tokens, usage.completion_tokens
+    return None
+
+def record_llm_response(node: str, response):
+    llm_calls_total.inc(node=node, status="ok")
+    usage = _token_usage(response)
+    request = _request_usage.get()
+    if request is not None:
+        request["llm_calls"] += 1
+    if usage is None:
+        return
+    input_tokens, output_tokens = usage
+    llm_tokens_total.inc(input_tokens, node=node, type="input")
+    llm_tokens_total.inc(output_tokens, node=node, type="output")
+    if request is not None:
+        request["tokens"] += input_tokens + output_tokens
+
+@contextmanager
+def llm_call(node: str):
+    """Ukur satu panggilan LLM: `with llm_call("agent") as record: response = record(llm.invoke(...))`."""
+    def record(response):
+        record_llm_response(node, response)
+        return response
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException:
+        llm_calls_total.inc(node=node, status="error")
+        raise
+    finally:
+        outbound_request_seconds.observe(time.perf_counter() - started, service="openai")
+
+@contextmanager
+def track_request():
+    """Kumpulkan panggilan dan token LLM selama satu pesan diproses graph."""
+    usage = {"llm_calls": 0, "tokens": 0}
+    token = _request_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _request_usage.reset(token)
+        llm_calls_per_request.observe(usage["llm_calls"])
+        llm_tokens_per_request.observe(usage["tokens"])
+
+def instrument_engine(engine):
+    """Catat durasi tiap query SQLAlchemy dengan label jenis statement (SELECT/UPDATE/...)."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        db_query_seconds.observe(time.perf_counter() - started, operation=operation)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # Query gagal tidak memanggil after_cursor_execute: buang timestamp-nya
+        stack = context.connection.info.get("query_started") if context.connection is not None else None
+        if stack:
+            stack.pop()
@@ -1,17 +1,84 @@
-from sqlalchemy import create_engine, Column, Integer, String, JSON
+import logging
+import importlib.util
+from sqlalchemy import create_engine, event, inspect, text, make_url, Column, Integer, String, JSON, Float, Index
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
+from config import DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_BUSY_TIMEOUT_MS, DB_MMAP_SIZE, DB_ASYNC
+from metrics import instrument_engine
+from lazy import Lazy
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record=None):
+    """WAL: pembaca tidak menunggu writer order; busy_timeout: writer antre, bukan langsung 'database is locked'."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")  # Aman dengan WAL, fsync cuma saat checkpoint
+    cursor.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    cursor.close()
+
+def _is_memory_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+def _engine_options(url) -> dict:
+    if _is_memory_sqlite(url):
+        return {}  # SQLite memori pakai StaticPool (satu koneksi), tidak ada ukuran pool
+    return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW}
+
+def configure_engine(engine):
+    """Pasang pragma SQLite di tiap koneksi baru dan histogram db_query_seconds per jenis statement."""
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", apply_sqlite_pragmas)
+    instrument_engine(engine)
+    return engine
+
+def create_db_engine(url: str = DATABASE_URL):
+    url = make_url(url)
+    return configure_engine(create_engine(url, **_engine_options(url)))
 
 Base = declarative_base()
-engine = create_engine('sqlite:///products.db')
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Engine async (aiosqlite) untuk tool di webhook: query tidak perlu thread pool.
+# Aktif dengan DB_ASYNC=true dan aiosqlite terpasang; selain itu versi async pakai asyncio.to_thread.
+_url = make_url(DATABASE_URL)
+ASYNC_DB_ENABLED = (DB_ASYNC and _url.get_backend_name() == "sqlite" and _url.get_driver_name() == "pysqlite"
+                    and not _is_memory_sqlite(_url) and importlib.util.find_spec("aiosqlite") is not None)
+
+def create_async_session_factory(url: str = DATABASE_URL):
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    url = make_url(url).set(drivername="sqlite+aiosqlite")
+    async_engine = create_async_engine(url, **_engine_options(url))
+    configure_engine(async_engine.sync_engine)  # Event connect/cursor tetap lewat engine sync di baliknya
+    return async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+AsyncSessionLocal = Lazy("async_db", create_async_session_factory)
+
+async def close_async_db():
+    """Tutup koneksi aiosqlite (thread per koneksi) saat shutdown."""
+    if AsyncSessionLocal.loaded:
+        await AsyncSessionLocal.get().kw["bind"].dispose()
+
 class Product(Base):
     __tablename__ = 'products'
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True)
     stock = Column(Integer)
     colors = Column(JSON)
+    sku = Column(String)  # Kode supplier; produk tanpa SKU (seed manual) tidak disentuh catalog_import
+
+    __table_args__ = (Index('ix_products_sku', 'sku', unique=True),)
+
+class CatalogChange(Base):
+    """Changelog katalog (import dan perubahan stok): tiap worker menerapkan ke index katalognya per produk, bukan reload penuh."""
+    __tablename__ = 'catalog_changes'
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer)
+    change = Column(String)  # added / changed / removed (catalog_import), stock (order/reservasi/pembayaran)
+    created_at = Column(Float)  # Epoch detik; dipangkas import berikutnya setelah masa simpan
+
+    # AUTOINCREMENT: id tidak pernah dipakai ulang walau changelog lama dipangkas habis
+    __table_args__ = (Index('ix_catalog_changes_created_at', 'created_at'), {'sqlite_autoincrement': True})
 
 class Order(Base):
     __tablename__ = 'orders'
@@ -19,6 +86,50 @@ class Order(Base):
     user_number = Column(String)
     product_name = Column(String)
     quantity = Column(Integer)
-    status = Column(String, default="pending")
+    status = Column(String, default="pending")  # pending -> paid / expired / cancelled
+    product_id = Column(Integer)  # Produk yang stoknya di-reservasi
+    reserved_until = Column(Float)  # Epoch detik; lewat ini reservasi pending dilepas sweeper
+
+    # Sweeper cari pending yang kedaluwarsa tanpa scan seluruh tabel; tool status pesanan
+    # ambil order terbaru per nomor (opsional per status) langsung dari index, urut id
+    __table_args__ = (
+        Index('ix_orders_status_reserved_until', 'status', 'reserved_until'),
+        Index('ix_orders_user_number_id', 'user_number', 'id'),
+        Index('ix_orders_user_number_status_id', 'user_number', 'status', 'id'),
+    )
+
+class PaymentOutbox(Base):
+    """Antrian pembuatan link pembayaran; ditulis dalam transaksi yang sama dengan Order."""
+    __tablename__ = 'payment_outbox'
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, unique=True)  # Satu link per order (idempotensi order-{id})
+    user_number = Column(String)
+    payload = Column(JSON)  # Payload Snap
+    status = Column(String, default="pending")  # pending -> processing -> sent / failed
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(Float)  # Epoch detik; untuk 'processing' = batas lease worker
+    payment_url = Column(String)
+    last_error = Column(String)
+
+    __table_args__ = (Index('ix_payment_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),)
+
+def migrate_schema(bind=engine):
+    """Tambah kolom/index baru ke tabel lama (create_all tidak mengubah tabel yang sudah ada)."""
+    inspector = inspect(bind)
+    tables = [table for table in Base.metadata.sorted_tables if inspector.has_table(table.name)]
+    with bind.begin() as conn:
+        for table in tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=bind.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                    logging.info(f"Migrasi: kolom {table.name}.{column.name} ditambahkan.")
+    for table in tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
 
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+def create_schema(bind=engine):
+    """Buat tabel baru dan migrasi tabel lama. Dipanggil init_db saat startup, bukan saat import."""
+    Base.metadata.create_all(bind=bind)
+    migrate_schema(bind)
@@ -0,0 +1,150 @@
+import time
+import random
+import logging
+import threading
+from collections import deque
+from metrics import Gauge, register_collector, outbound_request_seconds
+from config import (twilio_client, AGENT_WHATSAPP_NUMBER, TWILIO_WHATSAPP_NUMBER, NOTIFY_DIGEST_WINDOW_SECONDS,
+                    NOTIFY_MAX_BATCH, NOTIFY_MAX_QUEUE, NOTIFY_MAX_ATTEMPTS)
+
+# Antrian notifikasi eskalasi ke agen manusia. Webhook hanya menaruh pesan ke
+# antrian (tidak pernah menunggu Twilio); thread di background menggabungkan
+# pesan dalam satu jendela waktu jadi digest lalu mengirimnya dengan retry.
+
+MAX_BODY_CHARS = 1500  # Batas body WhatsApp Twilio 1600 karakter
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+DEPTH_WARNING = 100
+
+def send_to_agent(body: str):
+    with outbound_request_seconds.time(service="twilio"):
+        twilio_client.messages.create(from_=TWILIO_WHATSAPP_NUMBER, body=body, to=AGENT_WHATSAPP_NUMBER)
+
+def format_digests(messages: list, max_chars: int = MAX_BODY_CHARS) -> list:
+    """Satu pesan -> 'Escalation: ...'; beberapa -> digest bernomor, dipecah kalau terlalu panjang."""
+    if len(messages) == 1:
+        return [f"Escalation: {messages[0]}"[:max_chars]]
+    lines = [f"{i}. {message}"[:max_chars - 40] for i, message in enumerate(messages, 1)]
+    digests, current = [], []
+    for line in lines:
+        if current and sum(len(l) + 1 for l in current) + len(line) > max_chars - 40:
+            digests.append(current)
+            current = []
+        current.append(line)
+    digests.append(current)
+    return [f"Escalation ({len(messages)} pesan, bagian {part}/{len(digests)}):\n" + "\n".join(chunk) if len(digests) > 1
+            else f"Escalation ({len(messages)} pesan):\n" + "\n".join(chunk)
+            for part, chunk in enumerate(digests, 1)]
+
+class AgentNotifier:
+    """Antrian non-blocking + satu thread pengirim digest."""
+
+    def __init__(self, send=send_to_agent, window_seconds: float = NOTIFY_DIGEST_WINDOW_SECONDS,
+                 max_batch: int = NOTIFY_MAX_BATCH, max_queue: int = NOTIFY_MAX_QUEUE,
+                 max_attempts: int = NOTIFY_MAX_ATTEMPTS, sleep=time.sleep, autostart: bool = True):
+        self.send = send
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self.sleep = sleep
+        self.autostart = autostart  # False: tanpa thread, flush() dipanggil manual
+        self._queue = deque(maxlen=max_queue)  # (waktu_enqueue, pesan); penuh -> pesan tertua dibuang
+        self._cond = threading.Condition()
+        self._thread = None
+        self.sent_messages = 0
+        self.sent_digests = 0
+        self.failed_messages = 0
+        self.dropped_messages = 0
+        self.last_latency = 0.0  # Detik dari enqueue pesan tertua sampai digest terkirim
+        self.max_latency = 0.0
+
+    def enqueue(self, message: str):
+        """Taruh pesan ke antrian; hanya memegang lock sebentar, tidak ada I/O."""
+        with self._cond:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped_messages += 1
+            self._queue.append((time.time(), message))
+            depth = len(self._queue)
+            self._cond.notify()
+        if depth == DEPTH_WARNING:
+            logging.warning(f"Antrian notifikasi agen menumpuk: {depth} pesan.")
+        if self.autostart:
+            self._ensure_started()
+
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth(),
+            "sent_messages": self.sent_messages,
+            "sent_digests": self.sent_digests,
+            "failed_messages": self.failed_messages,
+            "dropped_messages": self.dropped_messages,
+            "last_latency_seconds": self.last_latency,
+            "max_latency_seconds": self.max_latency,
+        }
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._cond:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="agent-notifier", daemon=True)
+                    self._thread.start()
+
+    def _take_batch(self) -> list:
+        with self._cond:
+            return [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+
+    def flush(self) -> int:
+        """Kirim satu digest dari isi antrian sekarang. Return jumlah pesan yang diambil."""
+        batch = self._take_batch()
+        if not batch:
+            return 0
+        digests = format_digests([message for _, message in batch])
+        sent = 0
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                while sent < len(digests):
+                    self.send(digests[sent])
+                    sent += 1
+                break
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    self.failed_messages += len(batch)
+                    logging.error(f"Gagal kirim notifikasi agen ({len(batch)} pesan) setelah {attempt} percobaan: {e}")
+                    return len(batch)
+                delay = min(BACKOFF_BASE_SECONDS * 2 ** (attempt - 1), BACKOFF_MAX_SECONDS) * random.uniform(0.8, 1.2)
+                logging.warning(f"Gagal kirim notifikasi agen (percobaan {attempt}), retry {delay:.1f} detik: {e}")
+                self.sleep(delay)
+        self.sent_messages += len(batch)
+        self.sent_digests += len(digests)
+        self.last_latency = time.time() - batch[0][0]
+        self.max_latency = max(self.max_latency, self.last_latency)
+        logging.info(f"Notifikasi agen terkirim: {len(batch)} pesan, latency {self.last_latency:.1f} detik, antrian {self.depth()}.")
+        return len(batch)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                # Tunggu jendela digest sejak pesan tertua, kecuali batch sudah penuh
+                wait = self._queue[0][0] + self.window_seconds - time.time()
+                if wait > 0 and len(self._queue) < self.max_batch:
+                    self._cond.wait(wait)
+                    continue
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Notifier agen error: {e}")
+
+agent_notifier = AgentNotifier()
+
+notifier_stats = Gauge("agent_notifier", "Statistik antrian eskalasi ke agen (lihat AgentNotifier.stats).", ("stat",))
+
+def _collect_metrics():
+    for stat, value in agent_notifier.stats().items():
+        notifier_stats.set(value or 0, stat=stat)
+
+register_collector(_collect_metrics)
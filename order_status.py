@@ -0,0 +1,185 @@
+import re
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from sqlalchemy import select
+from models import SessionLocal, AsyncSessionLocal, ASYNC_DB_ENABLED, Order, PaymentOutbox
+from config import ORDER_STATUS_PAGE_SIZE, ORDER_STATUS_CACHE_TTL_SECONDS, ORDER_STATUS_CACHE_MAX_USERS
+
+# Status pesanan untuk tool get_order_status. Tiap query cuma menyentuh index
+# (user_number, id) / (user_number, status, id) plus LIMIT kecil, dan halaman
+# berikutnya pakai keyset (id < order terakhir yang ditampilkan), bukan OFFSET,
+# jadi biayanya tetap walau tabel orders berisi jutaan baris.
+
+STATUS_LABELS = {
+    'pending': "menunggu pembayaran",
+    'paid': "lunas, sedang diproses",
+    'expired': "kedaluwarsa (tidak dibayar sampai batas waktu)",
+    'cancelled': "dibatalkan",
+    'paid_no_stock': "lunas, tapi stok habis - tim kami akan menghubungi Kakak",
+}
+
+# Kata di input tool -> filter status. 'pending' dicek dulu: "belum dibayar" juga berisi "dibayar"
+STATUS_KEYWORDS = (
+    ('pending', ('belum bayar', 'belum dibayar', 'menunggu', 'pending', 'unpaid')),
+    ('paid', ('lunas', 'sudah bayar', 'sudah dibayar', 'paid')),
+    ('expired', ('kedaluwarsa', 'expired', 'hangus')),
+    ('cancelled', ('batal', 'cancel')),
+)
+
+_BEFORE_RE = re.compile(r"(?:sebelum|before)\s+(?:order-?|#)?\s*(\d+)")
+_ORDER_RE = re.compile(r"(?:order-?|#)\s*(\d+)")
+
+def parse_status_query(input_str: str):
+    """Input bebas dari LLM -> (order_id, status, before_id). Semua None = order terbaru."""
+    text = (input_str or "").lower()
+    before = _BEFORE_RE.search(text)
+    if before:
+        text = text[:before.start()] + text[before.end():]
+    order = _ORDER_RE.search(text)
+    status = next((status for status, words in STATUS_KEYWORDS if any(w in text for w in words)), None)
+    return (int(order.group(1)) if order else None), status, (int(before.group(1)) if before else None)
+
+def _orders_statement(user_number: str, order_id: int = None, status: str = None, before_id: int = None,
+                      limit: int = ORDER_STATUS_PAGE_SIZE):
+    # Outbox di-join lewat index unik order_id: link pembayaran ikut terambil dalam query yang sama
+    stmt = (
+        select(Order.id, Order.product_name, Order.quantity, Order.status, PaymentOutbox.payment_url)
+        .outerjoin(PaymentOutbox, PaymentOutbox.order_id == Order.id)
+        .where(Order.user_number == user_number)
+    )
+    if order_id is not None:
+        return stmt.where(Order.id == order_id)  # Selalu dicek pemiliknya: order nomor lain tidak bocor
+    if status is not None:
+        stmt = stmt.where(Order.status == status)
+    if before_id is not None:
+        stmt = stmt.where(Order.id < before_id)
+    return stmt.order_by(Order.id.desc()).limit(limit + 1)  # +1: tahu masih ada halaman berikutnya
+
+def _format_order(row) -> str:
+    line = f"- order-{row.id}: {row.quantity} {row.product_name}, {STATUS_LABELS.get(row.status, row.status)}"
+    if row.status == 'pending':
+        line += f". Link pembayaran: {row.payment_url}" if row.payment_url else ". Link pembayaran sedang dikirim"
+    return line
+
+def format_order_status(rows, order_id: int = None, status: str = None, before_id: int = None,
+                        limit: int = ORDER_STATUS_PAGE_SIZE) -> str:
+    if not rows:
+        if order_id is not None:
+            return f"order-{order_id} tidak ditemukan untuk nomor ini, Kak."
+        if before_id is not None:
+            return "Tidak ada pesanan yang lebih lama, Kak."
+        if status is not None:
+            return f"Tidak ada pesanan yang {STATUS_LABELS[status]}, Kak."
+        return "Belum ada pesanan dari nomor ini, Kak."
+    page = rows[:limit]
+    lines = ["Pesanan Kakak (terbaru dulu):"] + [_format_order(row) for row in page]
+    if len(rows) > limit:
+        lines.append(f"Masih ada pesanan lebih lama (input 'sebelum order-{page[-1].id}' untuk halaman berikutnya).")
+    return "\n".join(lines)
+
+class OrderStatusCache:
+    """LRU per nomor berisi jawaban tool status pesanan, dibuang saat order nomor itu ditulis.
+
+    Invalidasi hanya terlihat di worker yang menulis; TTL membatasi basi untuk tulisan
+    dari worker lain (notifikasi Midtrans, sweeper).
+    """
+
+    def __init__(self, max_users: int = ORDER_STATUS_CACHE_MAX_USERS, ttl_seconds: float = ORDER_STATUS_CACHE_TTL_SECONDS,
+                 max_queries_per_user: int = 8):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self.max_queries_per_user = max_queries_per_user
+        self._entries = OrderedDict()  # user_number -> {query: (expires_at, jawaban)}
+        self._lock = threading.Lock()
+        self._version = 0  # Naik tiap invalidasi; jawaban yang dibaca sebelum tulisan tidak disimpan
+        self.hits = 0
+        self.misses = 0
+
+    def version(self) -> int:
+        return self._version
+
+    def get(self, user_number: str, query: tuple):
+        if self.ttl_seconds <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(user_number, {}).get(query)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_number)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_number: str, query: tuple, answer: str, version: int):
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            if version != self._version:
+                return
+            queries = self._entries.setdefault(user_number, {})
+            if len(queries) >= self.max_queries_per_user:
+                queries.clear()
+            queries[query] = (time.monotonic() + self.ttl_seconds, answer)
+            self._entries.move_to_end(user_number)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *user_numbers):
+        with self._lock:
+            self._version += 1
+            for user_number in user_numbers:
+                self._entries.pop(user_number, None)
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+order_status_cache = OrderStatusCache()
+
+def _query_orders(user_number: str, order_id: int, status: str, before_id: int) -> list:
+    db = SessionLocal()
+    try:
+        return db.execute(_orders_statement(user_number, order_id, status, before_id)).all()
+    finally:
+        db.close()
+
+async def _aquery_orders(user_number: str, order_id: int, status: str, before_id: int) -> list:
+    async with AsyncSessionLocal.get()() as db:
+        return (await db.execute(_orders_statement(user_number, order_id, status, before_id))).all()
+
+def get_order_status(input_str: str, user_number: str) -> str:
+    query = parse_status_query(input_str)
+    cached = order_status_cache.get(user_number, query)
+    if cached is not None:
+        return cached
+    version = order_status_cache.version()
+    try:
+        rows = _query_orders(user_number, *query)
+    except Exception as e:
+        logging.error(f"Error cek status pesanan {user_number}: {e}")
+        return "Maaf, gagal cek status pesanan. Coba lagi nanti, Kak."
+    answer = format_order_status(rows, *query)
+    order_status_cache.put(user_number, query, answer, version)
+    return answer
+
+async def aget_order_status(input_str: str, user_number: str) -> str:
+    query = parse_status_query(input_str)
+    cached = order_status_cache.get(user_number, query)
+    if cached is not None:
+        return cached  # Tanpa I/O
+    version = order_status_cache.version()
+    try:
+        if ASYNC_DB_ENABLED:
+            rows = await _aquery_orders(user_number, *query)
+        else:
+            rows = await asyncio.to_thread(_query_orders, user_number, *query)
+    except Exception as e:
+        logging.error(f"Error cek status pesanan {user_number}: {e}")
+        return "Maaf, gagal cek status pesanan. Coba lagi nanti, Kak."
+    answer = format_order_status(rows, *query)
+    order_status_cache.put(user_number, query, answer, version)
+    return answer
@@ -0,0 +1,240 @@
+import time
+import random
+import logging
+import threading
+from sqlalchemy import update, select, func
+from models import SessionLocal, PaymentOutbox
+from reservations import cancel_order, PAID_STATUSES
+from order_status import order_status_cache
+from metrics import Gauge, register_collector, outbound_request_seconds
+from config import (snap, twilio_client, TWILIO_WHATSAPP_NUMBER, PAYMENT_OUTBOX_WORKERS, PAYMENT_OUTBOX_MAX_ATTEMPTS,
+                    PAYMENT_OUTBOX_LEASE_SECONDS, PAYMENT_OUTBOX_POLL_SECONDS)
+
+# Outbox link pembayaran. Order dan baris outbox di-commit dalam satu transaksi,
+# jadi webhook langsung membalas tanpa menunggu Midtrans. Worker di background
+# mengklaim baris (lease), membuat transaksi Snap dengan retry, lalu mengirim
+# link ke pelanggan sebagai pesan WhatsApp susulan.
+
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 300.0
+CLAIM_BATCH = 10
+# Snap menolak order_id yang sudah pernah dipakai: transaksinya sudah ada, link-nya yang dicari
+DUPLICATE_ORDER_MARKERS = ("already been taken", "sudah digunakan", "already used")
+
+_wakeup = threading.Event()
+
+def enqueue_payment_link(db, order_id: int, user_number: str, payload: dict):
+    """Tambah baris outbox ke session yang sama dengan Order (di-commit bersama)."""
+    db.add(PaymentOutbox(order_id=order_id, user_number=user_number, payload=payload,
+                         status="pending", attempts=0, next_attempt_at=time.time()))
+
+def notify_new_work():
+    """Bangunkan worker di proses ini (worker di proses lain tetap polling)."""
+    _wakeup.set()
+
+def backoff_seconds(attempts: int) -> float:
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** max(attempts - 1, 0), BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)  # Jitter supaya retry tidak serempak
+
+def payment_link_message(order_id: int, payment_url: str) -> str:
+    return f"Link pembayaran untuk order-{order_id}: {payment_url} Segera dibayar ya, Kak, stoknya kami simpan sementara."
+
+def payment_failed_message(order_id: int) -> str:
+    return f"Maaf, Kak, link pembayaran untuk order-{order_id} gagal dibuat dan pesanan dibatalkan. Silakan pesan ulang ya."
+
+def payment_link_delayed_message(order_id: int) -> str:
+    return (f"Maaf, Kak, link pembayaran untuk order-{order_id} belum bisa kami kirim. Pesanannya tetap kami simpan, "
+            f"silakan balas chat ini kalau ingin dibantu admin.")
+
+def send_whatsapp_text(to: str, body: str):
+    with outbound_request_seconds.time(service="twilio"):
+        twilio_client.messages.create(from_=TWILIO_WHATSAPP_NUMBER, body=body, to=to)
+
+def claim_batch(limit: int = CLAIM_BATCH, lease_seconds: float = PAYMENT_OUTBOX_LEASE_SECONDS, now: float = None) -> list:
+    """Klaim baris yang jatuh tempo (termasuk lease yang kedaluwarsa) dalam satu UPDATE atomik."""
+    now = time.time() if now is None else now
+    due = (PaymentOutbox.status.in_(("pending", "processing")), PaymentOutbox.next_attempt_at <= now)
+    due_ids = select(PaymentOutbox.id).where(*due).order_by(PaymentOutbox.next_attempt_at).limit(limit).scalar_subquery()
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            update(PaymentOutbox)
+            .where(PaymentOutbox.id.in_(due_ids), *due)
+            .values(status="processing", attempts=PaymentOutbox.attempts + 1, next_attempt_at=now + lease_seconds)
+            .returning(PaymentOutbox.id, PaymentOutbox.order_id, PaymentOutbox.user_number, PaymentOutbox.payload,
+                       PaymentOutbox.attempts, PaymentOutbox.payment_url)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.commit()
+        return [row._asdict() for row in rows]
+    finally:
+        db.close()
+
+def _update(entry: dict, **values) -> bool:
+    """Tulis hasil hanya selama lease masih dipegang. False = baris sudah diklaim ulang worker lain."""
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            update(PaymentOutbox)
+            .where(PaymentOutbox.id == entry['id'], PaymentOutbox.status == "processing",
+                   PaymentOutbox.attempts == entry['attempts'])
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount == 1
+    finally:
+        db.close()
+
+def _save_payment_url(entry: dict, payment_url: str) -> bool:
+    """Simpan link transaksi Snap. Return True kalau lease masih dipegang.
+
+    Tidak bergantung lease: order-{id} cuma punya satu transaksi Snap, jadi link dari worker
+    yang lease-nya lewat tetap disimpan dan dikirim oleh pemegang lease berikutnya.
+    """
+    db = SessionLocal()
+    try:
+        row = db.execute(
+            update(PaymentOutbox)
+            .where(PaymentOutbox.id == entry['id'], PaymentOutbox.payment_url.is_(None))
+            .values(payment_url=payment_url)
+            .returning(PaymentOutbox.status, PaymentOutbox.attempts)
+            .execution_options(synchronize_session=False)
+        ).first()
+        db.commit()
+    finally:
+        db.close()
+    order_status_cache.invalidate(entry['user_number'])  # Status pesanan sekarang menampilkan link
+    return row is not None and row.status == "processing" and row.attempts == entry['attempts']
+
+def _stored_payment_url(entry_id: int):
+    db = SessionLocal()
+    try:
+        return db.scalar(select(PaymentOutbox.payment_url).where(PaymentOutbox.id == entry_id))
+    finally:
+        db.close()
+
+class ExistingTransactionError(Exception):
+    """Transaksi order-{id} sudah ada di Snap tapi link-nya belum tersimpan (mis. worker lain masih jalan)."""
+
+def _is_duplicate(error: Exception) -> bool:
+    return any(marker in str(error).lower() for marker in DUPLICATE_ORDER_MARKERS)
+
+def existing_payment_url(entry: dict, snap_client):
+    """Link transaksi yang sudah dibuat sebelumnya. None = sudah dibayar, tidak perlu link lagi."""
+    payment_url = _stored_payment_url(entry['id'])
+    if payment_url:
+        return payment_url
+    order_ref = entry['payload']['transaction_details']['order_id']
+    try:
+        with outbound_request_seconds.time(service="midtrans"):
+            transaction = snap_client.transactions.status(order_ref)
+    except Exception as e:
+        transaction = {}  # 404: pelanggan belum memilih metode bayar, atau Midtrans tidak terjangkau
+        logging.info(f"Status transaksi {order_ref} tidak tersedia: {e}")
+    if transaction.get('transaction_status') in PAID_STATUSES + ('capture',):
+        return None  # Notifikasi Midtrans yang menandai order lunas
+    # Redirect URL Snap tidak bisa diminta ulang: tunggu link tersimpan oleh worker yang membuatnya
+    raise ExistingTransactionError(f"Transaksi {order_ref} sudah ada di Midtrans, link belum tersimpan")
+
+def process_entry(entry: dict, snap_client=None, send_message=None, max_attempts: int = PAYMENT_OUTBOX_MAX_ATTEMPTS) -> str:
+    """Buat link (kalau belum ada) dan kirim ke pelanggan. Return status baru baris outbox ('stale' = lease hilang)."""
+    snap_client = snap_client or snap
+    send_message = send_message or send_whatsapp_text
+    order_id = entry['order_id']
+    try:
+        payment_url = entry['payment_url']
+        if not payment_url:
+            try:
+                with outbound_request_seconds.time(service="midtrans"):
+                    payment_url = snap_client.create_transaction(entry['payload'])['redirect_url']
+            except Exception as e:
+                if not _is_duplicate(e):
+                    raise
+                # Transaksi sudah dibuat percobaan sebelumnya (timeout, gagal simpan, lease lewat): kirim link itu
+                payment_url = existing_payment_url(entry, snap_client)
+                if payment_url is None:
+                    return "sent" if _update(entry, status="sent", last_error=None) else "stale"
+            else:
+                # Simpan dulu: kalau kirim pesan gagal, retry tidak membuat transaksi Snap baru
+                if not _save_payment_url(entry, payment_url):
+                    logging.warning(f"Lease order-{order_id} sudah diklaim ulang; link diserahkan ke worker lain.")
+                    return "stale"
+        send_message(entry['user_number'], payment_link_message(order_id, payment_url))
+        if not _update(entry, status="sent", last_error=None):
+            return "stale"
+        logging.info(f"Link pembayaran order-{order_id} terkirim (percobaan {entry['attempts']}).")
+        return "sent"
+    except Exception as e:
+        error = str(e)[:500]
+        if entry['attempts'] < max_attempts:
+            delay = backoff_seconds(entry['attempts'])
+            logging.warning(f"Gagal membuat/kirim link order-{order_id} (percobaan {entry['attempts']}), retry {delay:.0f} detik: {error}")
+            return "pending" if _update(entry, status="pending", next_attempt_at=time.time() + delay, last_error=error) else "stale"
+        logging.error(f"Link pembayaran order-{order_id} gagal permanen: {error}")
+        if not _update(entry, status="failed", last_error=error):
+            return "stale"
+        if isinstance(e, ExistingTransactionError):
+            # Transaksinya hidup di Midtrans: order tidak dibatalkan, dibereskan notifikasi/sweeper reservasi
+            message = payment_link_delayed_message(order_id)
+        else:
+            cancel_order(order_id)  # Lepas reservasi stok
+            message = payment_failed_message(order_id)
+        try:
+            send_message(entry['user_number'], message)
+        except Exception as send_error:
+            logging.error(f"Gagal kirim pemberitahuan order-{order_id}: {send_error}")
+        return "failed"
+
+def run_once(snap_client=None, send_message=None, limit: int = CLAIM_BATCH) -> int:
+    """Proses satu batch. Return jumlah baris yang diklaim."""
+    entries = claim_batch(limit)
+    for entry in entries:
+        process_entry(entry, snap_client, send_message)
+    return len(entries)
+
+def outbox_stats() -> dict:
+    """Jumlah baris per status dan umur antrian tertua yang belum terkirim (detik)."""
+    db = SessionLocal()
+    try:
+        counts = dict(db.query(PaymentOutbox.status, func.count()).group_by(PaymentOutbox.status).all())
+        oldest = db.query(func.min(PaymentOutbox.next_attempt_at)).filter(PaymentOutbox.status == "pending").scalar()
+    finally:
+        db.close()
+    return {"counts": counts, "oldest_pending_seconds": max(time.time() - oldest, 0.0) if oldest else 0.0}
+
+outbox_entries = Gauge("payment_outbox_entries", "Baris outbox link pembayaran per status.", ("status",))
+outbox_oldest_pending = Gauge("payment_outbox_oldest_pending_seconds", "Umur baris pending tertua di outbox.")
+
+def _collect_metrics():
+    stats = outbox_stats()
+    for status in ("pending", "processing", "sent", "failed"):
+        outbox_entries.set(stats["counts"].get(status, 0), status=status)
+    outbox_oldest_pending.set(stats["oldest_pending_seconds"])
+
+register_collector(_collect_metrics)
+
+# --- Worker pool di background thread ---
+
+_workers_started = False
+_workers_lock = threading.Lock()
+
+def _worker_loop():
+    while True:
+        try:
+            if run_once():
+                continue  # Masih ada antrian, langsung klaim batch berikutnya
+        except Exception as e:
+            logging.error(f"Worker outbox pembayaran error: {e}")
+        _wakeup.wait(PAYMENT_OUTBOX_POLL_SECONDS)
+        _wakeup.clear()
+
+def start_payment_workers(count: int = PAYMENT_OUTBOX_WORKERS):
+    """Jalankan worker sekali per proses; klaim atomik membuat aman dijalankan di banyak worker/proses."""
+    global _workers_started
+    with _workers_lock:
+        if _workers_started or count <= 0:
+            return
+        for i in range(count):
+            threading.Thread(target=_worker_loop, name=f"payment-outbox-{i}", daemon=True).start()
+        _workers_started = True
@@ -0,0 +1,127 @@
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from config import RATE_LIMIT_MESSAGES, RATE_LIMIT_WINDOW_SECONDS, RATE_LIMIT_MAX_ENTRIES, RATE_LIMIT_DB_PATH
+
+# Rate limiter token bucket per nomor pengirim: kapasitas RATE_LIMIT_MESSAGES,
+# terisi ulang merata selama RATE_LIMIT_WINDOW_SECONDS (tidak reset mendadak
+# seperti jendela tetap). Kerja per request O(1).
+#
+# Bucket yang idle >= waktu isi penuh sudah pasti penuh lagi, jadi aman dihapus
+# tanpa mengubah hasil: map hanya berisi pengirim yang aktif baru-baru ini.
+# Webhook memakai limiter lewat state backend (state_backend.py): bucket diambil
+# bersama load state pelanggan dalam satu kali baca.
+
+class TokenBucketLimiter:
+    """Limiter di memori proses; OrderedDict urut aktivitas terakhir untuk eviksi O(1)."""
+
+    def __init__(self, capacity: int = RATE_LIMIT_MESSAGES, window_seconds: float = RATE_LIMIT_WINDOW_SECONDS,
+                 max_entries: int = RATE_LIMIT_MAX_ENTRIES):
+        self.capacity = float(capacity)
+        self.rate = capacity / window_seconds  # Token per detik
+        self.idle_seconds = window_seconds  # Waktu isi dari kosong sampai penuh
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()  # key -> (tokens, last_seen)
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def allow(self, key: str, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        with self._lock:
+            bucket = self._buckets.pop(key, None)
+            if bucket is None:
+                tokens = self.capacity
+            else:
+                tokens = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            self._buckets[key] = (tokens, now)  # Pindah ke ujung (paling baru)
+            self._evict(now)
+            return allowed
+
+    async def aallow(self, key: str) -> bool:
+        return self.allow(key)  # Cuma memori, O(1): tidak perlu pindah thread
+
+    def _evict(self, now: float):
+        buckets = self._buckets
+        # Paling banyak beberapa entri per request (amortized O(1)); berhenti di entri yang masih aktif
+        for _ in range(2):
+            oldest_key = next(iter(buckets))
+            if now - buckets[oldest_key][1] < self.idle_seconds:
+                break
+            del buckets[oldest_key]
+        while len(buckets) > self.max_entries:
+            buckets.popitem(last=False)
+            self.evicted += 1
+
+    def __len__(self):
+        return len(self._buckets)
+
+RATE_BUCKETS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_rate_buckets_updated_at ON rate_buckets (updated_at);
+"""
+
+# Isi ulang + ambil token dalam satu upsert atomik; kalau token kurang, WHERE gagal
+# dan RETURNING kosong (baris tidak berubah).
+TAKE_TOKEN_SQL = """
+INSERT INTO rate_buckets (key, tokens, updated_at) VALUES (:key, :capacity - 1, :now)
+ON CONFLICT (key) DO UPDATE SET
+    tokens = min(:capacity, tokens + (:now - updated_at) * :rate) - 1,
+    updated_at = :now
+WHERE min(:capacity, tokens + (:now - updated_at) * :rate) >= 1
+RETURNING tokens
+"""
+PRUNE_BUCKETS_SQL = "DELETE FROM rate_buckets WHERE updated_at <= ?"
+
+class SqliteRateLimiter:
+    """Limiter di file SQLite (WAL), satu limit untuk semua worker uvicorn di mesin yang sama."""
+
+    def __init__(self, path: str = RATE_LIMIT_DB_PATH, capacity: int = RATE_LIMIT_MESSAGES,
+                 window_seconds: float = RATE_LIMIT_WINDOW_SECONDS, prune_interval: float = 60.0):
+        self.capacity = float(capacity)
+        self.rate = capacity / window_seconds
+        self.idle_seconds = window_seconds
+        self.prune_interval = prune_interval
+        self._last_prune = None
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        with self._lock:
+            self.conn.executescript(RATE_BUCKETS_SCHEMA)
+
+    def allow(self, key: str, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        params = {"key": key, "capacity": self.capacity, "rate": self.rate, "now": now}
+        with self._lock:
+            allowed = self.conn.execute(TAKE_TOKEN_SQL, params).fetchone() is not None
+            if self._last_prune is None or now - self._last_prune > self.prune_interval:
+                self._last_prune = now
+                self.prune(now)
+        return allowed
+
+    async def aallow(self, key: str) -> bool:
+        """allow untuk handler async: upsert (dan prune) SQLite jalan di thread, bukan di event loop."""
+        return await asyncio.to_thread(self.allow, key)
+
+    def prune(self, now: float = None) -> int:
+        """Hapus bucket yang sudah penuh lagi (idle >= satu jendela)."""
+        now = time.time() if now is None else now
+        deleted = self.conn.execute(PRUNE_BUCKETS_SQL, (now - self.idle_seconds,)).rowcount
+        if deleted:
+            logging.info(f"Rate limiter: {deleted} bucket idle dihapus.")
+        return deleted
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM rate_buckets").fetchone()[0]
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+from collections import deque
+from config import REPLY_WORKERS, REPLY_MAX_QUEUE
+from metrics import Gauge, register_collector
+
+# Mode ack-then-reply: webhook langsung balas TwiML kosong (Twilio tidak timeout/retry),
+# giliran masuk antrian dan dikerjakan sejumlah worker tetap. Jumlah worker = batas
+# giliran (panggilan gpt-4o) paralel. Satu nomor paling banyak dipegang satu worker,
+# jadi urutan pesan per nomor terjaga dan tidak ada run paralel di thread_id yang sama.
+
+class ReplyWorkerPool:
+    """handler(user_number, text, media_url) dikerjakan worker; shed_handler(user_number) saat antrian penuh."""
+
+    def __init__(self, handler, shed_handler, workers: int = REPLY_WORKERS, max_queue: int = REPLY_MAX_QUEUE):
+        self.handler = handler
+        self.shed_handler = shed_handler
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self._pending = {}  # user_number -> deque giliran yang belum jalan
+        self._ready = None  # asyncio.Queue nomor yang siap diambil worker (tiap nomor maks sekali)
+        self._workers = []
+        self._shed_tasks = set()
+        self._idle = None
+        self.depth = 0  # Giliran yang antri + sedang jalan
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.shed = 0
+
+    def _start(self):
+        # Dibuat di event loop yang sedang jalan (bukan saat import)
+        self._ready = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        loop = asyncio.get_running_loop()
+        self._workers = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, user_number: str, text: str, media_url: str = None) -> bool:
+        """Taruh giliran ke antrian. False kalau antrian penuh (pelanggan dapat balasan 'sebentar ya')."""
+        if self._ready is None:
+            self._start()
+        if self.depth >= self.max_queue:
+            self.shed += 1
+            logging.warning(f"Antrian balasan penuh ({self.depth}), pesan dari {user_number} ditolak")
+            task = asyncio.get_running_loop().create_task(self._send_shed(user_number))
+            self._shed_tasks.add(task)
+            task.add_done_callback(self._shed_tasks.discard)
+            return False
+        self.depth += 1
+        self._idle.clear()
+        queue = self._pending.get(user_number)
+        if queue is None:
+            # Nomor belum ada di antrian/worker: jadwalkan
+            self._pending[user_number] = deque([(text, media_url)])
+            self._ready.put_nowait(user_number)
+        else:
+            queue.append((text, media_url))  # Diambil worker yang sama setelah giliran sebelumnya
+        return True
+
+    async def _send_shed(self, user_number: str):
+        try:
+            await self.shed_handler(user_number)
+        except Exception as e:
+            logging.error(f"Gagal kirim balasan antrian penuh ke {user_number}: {e}")
+
+    async def _worker(self):
+        while True:
+            user_number = await self._ready.get()
+            queue = self._pending[user_number]
+            text, media_url = queue.popleft()
+            self.running += 1
+            try:
+                await self.handler(user_number, text, media_url)
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"Gagal memproses giliran {user_number}: {e}")
+            finally:
+                self.running -= 1
+                self.depth -= 1
+                if queue:
+                    self._ready.put_nowait(user_number)  # Ke belakang antrian: nomor lain tetap kebagian
+                else:
+                    del self._pending[user_number]
+                if self.depth == 0:
+                    self._idle.set()
+
+    def stats(self) -> dict:
+        return {"depth": self.depth, "running": self.running, "completed": self.completed,
+                "failed": self.failed, "shed": self.shed}
+
+    async def drain(self):
+        """Tunggu semua giliran selesai lalu hentikan worker (shutdown/test)."""
+        if self._ready is None:
+            return
+        await self._idle.wait()
+        if self._shed_tasks:
+            await asyncio.gather(*list(self._shed_tasks), return_exceptions=True)
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._ready = None
+        self._workers = []
+
+reply_pool_stats = Gauge("reply_pool", "Statistik worker pool balasan (lihat ReplyWorkerPool.stats).", ("stat",))
+reply_pool = None  # Diisi app lewat create_reply_pool() kalau REPLY_MODE=async
+
+def create_reply_pool(handler, shed_handler) -> ReplyWorkerPool:
+    global reply_pool
+    reply_pool = ReplyWorkerPool(handler, shed_handler)
+    return reply_pool
+
+def _collect_metrics():
+    if reply_pool is None:
+        return
+    for stat, value in reply_pool.stats().items():
+        reply_pool_stats.set(value, stat=stat)
+
+register_collector(_collect_metrics)
@@ -0,0 +1,208 @@
+import hmac
+import time
+import hashlib
+import logging
+import threading
+from sqlalchemy import update, select
+from models import SessionLocal, Product, Order
+from catalog_index import catalog_index, record_stock_change, arecord_stock_change, prune_catalog_changes
+from order_status import order_status_cache
+from config import MIDTRANS_SERVER_KEY, RESERVATION_TTL_SECONDS, RESERVATION_SWEEP_INTERVAL, RESERVATION_SWEEP_BATCH
+
+# Reservasi stok pesanan. Stok dipotong dengan satu UPDATE bersyarat (cek dan tulis
+# atomik di DB, tanpa baca-cek-tulis di Python), disimpan di Order sampai
+# reserved_until, lalu dilepas sweeper kalau tidak dibayar. Tiap perubahan stok dicatat
+# di catalog_changes (transaksi yang sama) supaya index katalog worker lain ikut per produk.
+
+PAID_STATUSES = ('settlement',)
+FAILED_STATUSES = ('cancel', 'deny', 'expire', 'failure')
+
+def _reserve_statement(product_id: int, quantity: int):
+    return (
+        update(Product)
+        .where(Product.id == product_id, Product.stock >= quantity)
+        .values(stock=Product.stock - quantity)
+        .returning(Product.stock)
+        .execution_options(synchronize_session=False)
+    )
+
+def reserve_stock(db, product_id: int, quantity: int):
+    """Potong stok kalau cukup. Return (sisa stok, versi), atau None kalau stok kurang (tidak ada yang diubah)."""
+    row = db.execute(_reserve_statement(product_id, quantity)).first()
+    return None if row is None else (row[0], record_stock_change(db, product_id))
+
+async def areserve_stock(db, product_id: int, quantity: int):
+    """reserve_stock untuk AsyncSession."""
+    row = (await db.execute(_reserve_statement(product_id, quantity))).first()
+    return None if row is None else (row[0], await arecord_stock_change(db, product_id))
+
+def release_stock(db, product_id: int, quantity: int):
+    """Kembalikan stok reservasi. Return (stok baru, versi), None kalau produk sudah dihapus."""
+    row = db.execute(
+        update(Product)
+        .where(Product.id == product_id)
+        .values(stock=Product.stock + quantity)
+        .returning(Product.stock)
+        .execution_options(synchronize_session=False)
+    ).first()
+    return None if row is None else (row[0], record_stock_change(db, product_id))
+
+def reservation_deadline(ttl_seconds: float = RESERVATION_TTL_SECONDS) -> float:
+    return time.time() + ttl_seconds
+
+def _transition(db, order_id: int, from_statuses, to_status: str):
+    """Ubah status order hanya kalau status sekarang cocok (aman dari sweeper/notifikasi yang balapan)."""
+    return db.execute(
+        update(Order)
+        .where(Order.id == order_id, Order.status.in_(from_statuses))
+        .values(status=to_status, reserved_until=None)
+        .returning(Order.product_id, Order.quantity, Order.user_number)
+        .execution_options(synchronize_session=False)
+    ).first()
+
+def release_expired_reservations(now: float = None, batch_size: int = RESERVATION_SWEEP_BATCH) -> int:
+    """Lepas reservasi pending yang kedaluwarsa, per batch. Return jumlah order yang dilepas."""
+    now = time.time() if now is None else now
+    released = 0
+    while True:
+        db = SessionLocal()
+        try:
+            # Satu statement per batch: klaim order lewat subquery berindex (status, reserved_until)
+            expired_ids = (
+                select(Order.id)
+                .where(Order.status == 'pending', Order.reserved_until < now)
+                .order_by(Order.reserved_until)
+                .limit(batch_size)
+                .scalar_subquery()
+            )
+            rows = db.execute(
+                update(Order)
+                .where(Order.id.in_(expired_ids), Order.status == 'pending')
+                .values(status='expired', reserved_until=None)
+                .returning(Order.product_id, Order.quantity, Order.user_number)
+                .execution_options(synchronize_session=False)
+            ).all()
+            restock = {}
+            for product_id, quantity, _ in rows:
+                if product_id is not None:
+                    restock[product_id] = restock.get(product_id, 0) + quantity
+            new_stock = {product_id: release_stock(db, product_id, quantity) for product_id, quantity in restock.items()}
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logging.error(f"Gagal melepas reservasi kedaluwarsa: {e}")
+            break
+        finally:
+            db.close()
+        order_status_cache.invalidate(*{row.user_number for row in rows})
+        for product_id, stock in new_stock.items():
+            if stock is not None:
+                catalog_index.set_stock(product_id, *stock)
+        released += len(rows)
+        if len(rows) < batch_size:
+            break
+    if released:
+        logging.info(f"Reservasi kedaluwarsa dilepas: {released} order.")
+    return released
+
+def cancel_order(order_id: int, status: str = 'cancelled') -> bool:
+    """Batalkan order pending dan kembalikan stoknya. Return False kalau order tidak pending."""
+    db = SessionLocal()
+    try:
+        row = _transition(db, order_id, ('pending',), status)
+        stock = release_stock(db, row[0], row[1]) if row and row[0] is not None else None
+        db.commit()
+    finally:
+        db.close()
+    if row is not None:
+        order_status_cache.invalidate(row.user_number)
+    if stock is not None:
+        catalog_index.set_stock(row[0], *stock)
+    return row is not None
+
+def confirm_payment(order_id: int):
+    """Tandai order lunas. Return status akhir order (None kalau order tidak ada).
+
+    Kalau pembayaran masuk setelah reservasi dilepas, stok direservasi ulang;
+    kalau stok sudah habis, order ditandai 'paid_no_stock' untuk ditangani manual.
+    """
+    db = SessionLocal()
+    stock = None
+    try:
+        row = _transition(db, order_id, ('pending',), 'paid')
+        if row:
+            db.commit()
+            order_status_cache.invalidate(row.user_number)
+            return 'paid'
+        row = _transition(db, order_id, ('expired', 'cancelled'), 'paid')
+        if row is None:
+            order = db.get(Order, order_id)
+            return order.status if order else None
+        product_id, quantity, user_number = row
+        if product_id is not None:
+            stock = reserve_stock(db, product_id, quantity)
+            if stock is None:
+                _transition(db, order_id, ('paid',), 'paid_no_stock')
+                logging.error(f"order-{order_id} dibayar setelah reservasi habis dan stok tidak cukup, perlu refund/manual.")
+        db.commit()
+        order_status_cache.invalidate(user_number)
+        if stock is not None:
+            catalog_index.set_stock(product_id, *stock)
+        return 'paid' if product_id is None or stock is not None else 'paid_no_stock'
+    finally:
+        db.close()
+
+def verify_midtrans_signature(notification: dict, server_key: str = MIDTRANS_SERVER_KEY) -> bool:
+    """signature_key = sha512(order_id + status_code + gross_amount + server_key)."""
+    raw = f"{notification.get('order_id', '')}{notification.get('status_code', '')}{notification.get('gross_amount', '')}{server_key or ''}"
+    expected = hashlib.sha512(raw.encode()).hexdigest().encode()
+    signature = str(notification.get('signature_key') or '').encode()
+    return bool(server_key) and hmac.compare_digest(expected, signature)  # Waktu konstan, tidak bocor lewat timing
+
+def handle_payment_notification(notification: dict):
+    """Proses notifikasi Midtrans (sudah diverifikasi). Return status order baru, atau None kalau diabaikan."""
+    order_ref = str(notification.get('order_id', ''))
+    if not order_ref.startswith('order-') or not order_ref[len('order-'):].isdigit():
+        logging.warning(f"Notifikasi Midtrans untuk order tidak dikenal: {order_ref}")
+        return None
+    order_id = int(order_ref[len('order-'):])
+    transaction_status = notification.get('transaction_status')
+    if transaction_status in PAID_STATUSES or (transaction_status == 'capture' and notification.get('fraud_status', 'accept') == 'accept'):
+        return confirm_payment(order_id)
+    if transaction_status in FAILED_STATUSES:
+        status = 'expired' if transaction_status == 'expire' else 'cancelled'
+        return status if cancel_order(order_id, status) else None
+    return None  # 'pending' dll: reservasi tetap sampai kedaluwarsa
+
+# --- Sweeper di background thread ---
+
+_sweeper_started = False
+_sweeper_lock = threading.Lock()
+
+def prune_stock_changes():
+    """Pangkas changelog stok lama (tiap order menambah baris; catalog_import juga memangkas)."""
+    db = SessionLocal()
+    try:
+        prune_catalog_changes(db)
+        db.commit()
+    finally:
+        db.close()
+
+def _sweep_loop(interval: float):
+    while True:
+        time.sleep(interval)
+        try:
+            release_expired_reservations()
+            prune_stock_changes()
+        except Exception as e:
+            logging.error(f"Sweeper reservasi error: {e}")
+
+def start_reservation_sweeper(interval: float = RESERVATION_SWEEP_INTERVAL):
+    """Jalankan sweeper sekali per proses (aman dijalankan di banyak worker)."""
+    global _sweeper_started
+    if interval <= 0:
+        return
+    with _sweeper_lock:
+        if not _sweeper_started:
+            threading.Thread(target=_sweep_loop, args=(interval,), name="reservation-sweeper", daemon=True).start()
+            _sweeper_started = True
@@ -0,0 +1,220 @@
+import copy
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+from config import (STATE_BACKEND, STATE_DB_PATH, STATE_MAX_USERS, STATE_TTL_SECONDS, RATE_LIMIT_MESSAGES,
+                    RATE_LIMIT_WINDOW_SECONDS, HISTORY_TTL_SECONDS)
+from rate_limiter import TokenBucketLimiter, RATE_BUCKETS_SCHEMA, TAKE_TOKEN_SQL, PRUNE_BUCKETS_SQL
+from history_store import HistoryStore, HISTORY_SCHEMA
+
+# Semua yang dibaca/ditulis satu giliran pelanggan di balik satu interface:
+# preferensi + hitungan follow-up, ringkasan riwayat chat, dan bucket rate limit.
+# Webhook memanggil load_turn sekali di awal dan save_turn sekali di akhir, jadi
+# backend SQLite (WAL) cukup dua transaksi per giliran dan bisa dipakai bersama
+# oleh semua worker uvicorn. Giliran yang balapan untuk nomor yang sama tidak
+# saling menimpa: state yang berubah sejak dimuat digabung, bukan ditimpa.
+
+def default_state() -> dict:
+    return {
+        'preferences': {'name': None, 'favorites': [], 'last_product': None},
+        'follow_ups': {},  # teks follow-up -> jumlah dipakai
+    }
+
+def _with_defaults(state: dict) -> dict:
+    merged = default_state()
+    merged['preferences'].update(state.get('preferences') or {})
+    merged['follow_ups'].update(state.get('follow_ups') or {})
+    return merged
+
+def merge_state(base, ours, theirs):
+    """Gabung 3 arah: yang diubah giliran ini (base -> ours) menang, sisanya dari versi tersimpan terbaru."""
+    if ours == base:
+        return copy.deepcopy(theirs)
+    if theirs == base:
+        return copy.deepcopy(ours)
+    if isinstance(ours, dict) and isinstance(theirs, dict):
+        base = base if isinstance(base, dict) else {}
+        merged = {}
+        for key in list(theirs) + [key for key in ours if key not in theirs]:
+            if key in base and (key not in ours or key not in theirs):
+                continue  # Dihapus salah satu pihak (mis. hitungan follow-up di-reset)
+            if key in ours and key in theirs:
+                merged[key] = merge_state(base.get(key), ours[key], theirs[key])
+            else:
+                merged[key] = copy.deepcopy(ours[key] if key in ours else theirs[key])
+        return merged
+    if isinstance(ours, list) and isinstance(theirs, list):
+        return copy.deepcopy(theirs + [item for item in ours if item not in theirs])
+    return copy.deepcopy(ours)
+
+class Turn:
+    """Satu giliran pelanggan: hasil load_turn, state diubah handler di tempat, lalu disimpan save_turn."""
+    __slots__ = ("user_number", "allowed", "state", "history_summary", "version", "base")
+
+    def __init__(self, user_number: str, state: dict = None, version: int = 0, history_summary: str = "", allowed: bool = True):
+        self.user_number = user_number
+        self.allowed = allowed  # False = kena rate limit, state tidak dimuat
+        self.state = state if state is not None else default_state()
+        self.history_summary = history_summary
+        self.version = version  # Versi state saat dimuat; berbeda saat save = giliran lain sudah menyimpan
+        self.base = copy.deepcopy(self.state)
+
+class StateBackend:
+    """Interface backend state pelanggan. Keduanya memblok: dari event loop panggil lewat asyncio.to_thread."""
+
+    def load_turn(self, user_number: str, now: float = None) -> Turn:
+        """Ambil token rate limit, lalu muat state + ringkasan riwayat (Turn.allowed False kalau kena limit)."""
+        raise NotImplementedError
+
+    def save_turn(self, turn: Turn, user_message: str, response_text: str, now: float = None):
+        """Simpan state giliran (digabung kalau ada giliran lain yang menyimpan duluan) dan tambah riwayat."""
+        raise NotImplementedError
+
+class MemoryStateBackend(StateBackend):
+    """State di memori proses (satu worker); LRU supaya tidak tumbuh tanpa batas."""
+
+    def __init__(self, max_users: int = STATE_MAX_USERS, limiter: TokenBucketLimiter = None, history: HistoryStore = None):
+        self.max_users = max_users
+        self.limiter = TokenBucketLimiter() if limiter is None else limiter
+        self.history = HistoryStore() if history is None else history
+        self._states = OrderedDict()  # user_number -> (state, versi)
+        self._version = 0  # Naik tiap save; tidak pernah dipakai ulang walau user keluar dari LRU
+        self._lock = threading.Lock()
+
+    def load_turn(self, user_number: str, now: float = None) -> Turn:
+        if not self.limiter.allow(user_number, now):
+            return Turn(user_number, allowed=False)
+        with self._lock:
+            state, version = self._states.get(user_number, (None, 0))
+            if state is not None:
+                self._states.move_to_end(user_number)
+                # Salinan: perubahan baru terlihat setelah save, sama seperti backend SQLite
+                state = copy.deepcopy(state)
+        return Turn(user_number, state, version, self.history.summary(user_number))
+
+    def save_turn(self, turn: Turn, user_message: str, response_text: str, now: float = None):
+        with self._lock:
+            current = self._states.get(turn.user_number)
+            state = turn.state
+            if current is not None and current[1] != turn.version:
+                state = merge_state(turn.base, turn.state, current[0])
+            self._version += 1
+            self._states[turn.user_number] = (copy.deepcopy(state), self._version)
+            self._states.move_to_end(turn.user_number)
+            while len(self._states) > self.max_users:
+                self._states.popitem(last=False)
+        self.history.append(turn.user_number, user_message, response_text)
+
+    def __len__(self):
+        return len(self._states)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_state (
+    user_number TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_user_state_updated_at ON user_state (updated_at);
+"""
+
+_UPSERT_SQL = (
+    "INSERT INTO user_state (user_number, data, updated_at, version) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (user_number) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at, version = excluded.version"
+)
+
+class SqliteStateBackend(StateBackend):
+    """State, riwayat dan bucket rate limit di satu file SQLite (WAL): satu transaksi untuk load, satu untuk save."""
+
+    def __init__(self, path: str = STATE_DB_PATH, ttl_seconds: float = STATE_TTL_SECONDS, history: HistoryStore = None,
+                 capacity: int = RATE_LIMIT_MESSAGES, window_seconds: float = RATE_LIMIT_WINDOW_SECONDS,
+                 history_ttl_seconds: float = HISTORY_TTL_SECONDS, prune_interval: float = 60.0):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.history_ttl_seconds = history_ttl_seconds
+        self.history = HistoryStore(path="") if history is None else history  # Enkripsi + cache dekripsi; tabelnya di koneksi ini
+        self.capacity = float(capacity)
+        self.rate = capacity / window_seconds
+        self.idle_seconds = window_seconds
+        self.prune_interval = prune_interval
+        self._last_prune = time.time()
+        self._lock = threading.Lock()
+        # Autocommit: transaksi dibuka sendiri dengan BEGIN IMMEDIATE (_transaction)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        with self._transaction() as conn:
+            for schema in (_SCHEMA, HISTORY_SCHEMA, RATE_BUCKETS_SCHEMA):
+                for statement in filter(str.strip, schema.split(";")):
+                    conn.execute(statement)
+            if "version" not in {row[1] for row in conn.execute("PRAGMA table_info(user_state)")}:
+                conn.execute("ALTER TABLE user_state ADD COLUMN version INTEGER NOT NULL DEFAULT 0")  # DB lama
+
+    @contextmanager
+    def _transaction(self):
+        """BEGIN IMMEDIATE: lock tulis diambil di awal, jadi baca-gabung-tulis tidak disela worker lain."""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def _select_state(self, conn, user_number: str):
+        return conn.execute("SELECT data, version FROM user_state WHERE user_number = ?", (user_number,)).fetchone()
+
+    def load_turn(self, user_number: str, now: float = None) -> Turn:
+        now = time.time() if now is None else now
+        params = {"key": user_number, "capacity": self.capacity, "rate": self.rate, "now": now}
+        with self._transaction() as conn:
+            if conn.execute(TAKE_TOKEN_SQL, params).fetchone() is None:
+                return Turn(user_number, allowed=False)
+            row = self._select_state(conn, user_number)
+            history_rows = self.history.select_recent(conn, user_number)
+        # Parse dan dekripsi di luar transaksi
+        state = _with_defaults(json.loads(row[0])) if row else None
+        return Turn(user_number, state, row[1] if row else 0, self.history.summarize_rows(history_rows))
+
+    def save_turn(self, turn: Turn, user_message: str, response_text: str, now: float = None):
+        now = time.time() if now is None else now
+        encrypted = self.history.encrypt_turn(user_message, response_text, now)
+        with self._transaction() as conn:
+            row = self._select_state(conn, turn.user_number)
+            version = row[1] if row else 0
+            state = turn.state
+            if row and version != turn.version:
+                # Worker lain menyimpan giliran nomor ini sejak load_turn: gabung, jangan timpa
+                state = merge_state(turn.base, turn.state, _with_defaults(json.loads(row[0])))
+            conn.execute(_UPSERT_SQL, (turn.user_number, json.dumps(state, ensure_ascii=False), now, version + 1))
+            self.history.insert_turn(conn, turn.user_number, encrypted, now)
+        if now - self._last_prune > self.prune_interval:
+            self._last_prune = now
+            self.prune(now)
+
+    def prune(self, now: float = None):
+        """Hapus user idle, riwayat lama, dan bucket yang sudah penuh lagi."""
+        now = time.time() if now is None else now
+        with self._transaction() as conn:
+            deleted = conn.execute("DELETE FROM user_state WHERE updated_at < ?", (now - self.ttl_seconds,)).rowcount
+            self.history.prune(conn, now - self.history_ttl_seconds)
+            conn.execute(PRUNE_BUCKETS_SQL, (now - self.idle_seconds,))
+        if deleted:
+            logging.info(f"State pelanggan: {deleted} user idle dihapus.")
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM user_state").fetchone()[0]
+
+def create_state_backend(backend: str = STATE_BACKEND):
+    if backend == 'sqlite':
+        return SqliteStateBackend()
+    return MemoryStateBackend()
+
+user_state = create_state_backend()
@@ -3,6 +3,11 @@ import pytest
 from graph import compiled_graph
 from langchain_core.messages import HumanMessage
 from utils import vary_response, add_emojis_and_formatting, choose_follow_up
+from database import init_db
+
+@pytest.fixture(scope="module", autouse=True)
+def db():
+    init_db()  # Skema dibuat/dimigrasi saat startup, bukan saat models di-import
 
 # FUNGSI PEMBANTU (Sama seperti sebelumnya)
 def get_final_bot_response(user_message: str, user_number: str = "test-user") -> str:
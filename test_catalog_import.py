@@ -0,0 +1,126 @@
+# test_catalog_import.py
+import json
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import catalog_import
+from catalog_import import import_catalog, read_records, main
+from catalog_index import CatalogIndex, sync_catalog_changes, _load_index
+from models import Base, Product, CatalogChange
+
+@pytest.fixture
+def Session(tmp_path, monkeypatch):
+    """DB SQLite sementara dengan satu produk seed tanpa SKU."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'catalog.db'}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = Session()
+    db.add(Product(id=1, name="kemeja flanel", stock=15, colors=["merah", "biru"]))
+    db.commit()
+    db.close()
+    monkeypatch.setattr(catalog_import, "SessionLocal", Session)
+    monkeypatch.setattr(catalog_import, "catalog_index", CatalogIndex())  # Index global tidak disentuh
+    return Session
+
+def write_csv(path, rows):
+    path.write_text("sku,name,stock,colors\n" + "".join(f"{row}\n" for row in rows), encoding="utf-8")
+    return str(path)
+
+def products(Session):
+    db = Session()
+    try:
+        return {p.sku: (p.name, p.stock, p.colors) for p in db.query(Product)}
+    finally:
+        db.close()
+
+def index_for(Session):
+    index = CatalogIndex()
+    db = Session()
+    try:
+        _load_index(index, db)
+    finally:
+        db.close()
+    return index
+
+def test_import_lalu_sync_diff(Session, tmp_path):
+    first = write_csv(tmp_path / "a.csv", ["KF-1,kemeja flanel,10,merah|biru", "SK-1,sepatu kets,5,putih", "CH-1,celana chino,0,hitam;krem"])
+    diff = import_catalog(read_records(first), session_factory=Session)
+    assert diff.added == ["SK-1", "CH-1"] and diff.changed == ["KF-1"] and diff.removed == []
+    assert products(Session)["KF-1"] == ("kemeja flanel", 10, ["merah", "biru"])  # Produk seed diadopsi, id tetap
+    index = index_for(Session)
+    searched = []
+    original_apply = index.apply_changes
+    index.apply_changes = lambda records, removed, **kwargs: (searched.append(index.best_match("sepatu kets")), original_apply(records, removed, **kwargs))
+
+    second = write_csv(tmp_path / "b.csv", ["KF-1,kemeja flanel,10,merah|biru", "SK-1,sepatu kets,3,putih", "JK-1,jaket parasut,7,"])
+    diff = import_catalog(read_records(second), session_factory=Session)
+    assert (diff.added, diff.changed, diff.removed) == (["JK-1"], ["SK-1"], ["CH-1"])
+    assert sync_catalog_changes(index, Session) == 3  # Hanya 3 produk yang dibaca ulang
+    assert searched and searched[0]["stock"] == 5  # Pencarian tetap jalan dengan data lama sebelum diff diterapkan
+    assert index.best_match("jaket parasut")["stock"] == 7 and index.get_by_name("celana chino") is None
+    assert index.get_by_name("sepatu kets")["stock"] == 3 and index.products == index_for(Session).products
+    assert sync_catalog_changes(index, Session) == 0
+
+def test_kolom_kosong_dan_baris_rusak(Session, tmp_path):
+    path = tmp_path / "katalog.jsonl"
+    path.write_text("\n".join([
+        json.dumps({"sku": "KF-1", "name": "kemeja flanel"}),  # Tanpa stock/colors: nilai DB dipertahankan
+        json.dumps({"sku": "", "name": "tanpa sku"}),
+        "{rusak",
+        json.dumps({"sku": "TS-1", "name": "topi  santai", "stock": "4", "colors": ["hitam"]}),
+        json.dumps({"sku": "TS-1", "name": "topi duplikat"}),
+    ]), encoding="utf-8")
+    diff = import_catalog(read_records(str(path)), session_factory=Session)
+    assert diff.skipped == 3 and diff.added == ["TS-1"]
+    assert products(Session) == {"KF-1": ("kemeja flanel", 15, ["merah", "biru"]), "TS-1": ("topi santai", 4, ["hitam"])}
+
+def test_keep_missing_dry_run_dan_gagal_atomik(Session, tmp_path, capsys):
+    import_catalog(read_records(write_csv(tmp_path / "a.csv", ["SK-1,sepatu kets,5,putih"])), session_factory=Session)
+    keep = write_csv(tmp_path / "b.csv", ["TS-1,topi santai,4,hitam"])
+    assert main([keep, "--keep-missing", "--dry-run"]) == 0
+    assert "Dry run selesai" in capsys.readouterr().out and "TS-1" not in products(Session)
+    import_catalog(read_records(keep), remove_missing=False, session_factory=Session)
+    assert set(products(Session)) == {None, "SK-1", "TS-1"}
+
+    # Nama bentrok dengan produk yang tetap ada: seluruh import dibatalkan, tidak ada yang setengah jadi
+    clash = write_csv(tmp_path / "c.csv", ["SK-1,sepatu kets,9,putih", "XX-1,topi santai,1,"])
+    assert main([clash, "--keep-missing"]) == 1
+    assert products(Session)["SK-1"][1] == 5 and "XX-1" not in products(Session)
+    (tmp_path / "d.csv").write_text("kode,name\nA,b\n", encoding="utf-8")
+    assert main([str(tmp_path / "d.csv")]) == 1
+
+def test_changelog_terpangkas_reload_penuh(Session, tmp_path):
+    import_catalog(read_records(write_csv(tmp_path / "a.csv", ["SK-1,sepatu kets,5,putih"])), session_factory=Session, now=0)
+    index = index_for(Session)
+    import_catalog(read_records(write_csv(tmp_path / "b.csv", ["SK-1,sepatu kets,2,putih"])), session_factory=Session, now=10**9)
+    import_catalog(read_records(write_csv(tmp_path / "c.csv", ["SK-2,sandal,1,"])), session_factory=Session, now=2 * 10**9)
+    db = Session()
+    assert db.query(CatalogChange).count() == 2  # Changelog lama dipangkas, id tidak dipakai ulang
+    db.close()
+    index.change_id = 0
+    sync_catalog_changes(index, Session)
+    assert index.get_by_name("sepatu kets") is None and index.get_by_name("sandal")["stock"] == 1
+
+def test_perubahan_stok_disinkron_per_produk(Session):
+    from reservations import reserve_stock, release_stock
+    db = Session()
+    db.add(Product(id=2, name="sepatu kets", stock=5, colors=["putih"]))
+    db.commit()
+    db.close()
+    local, other = index_for(Session), index_for(Session)  # Worker yang menerima order dan worker lain
+
+    db = Session()
+    reserved = reserve_stock(db, 1, 3)
+    db.commit()
+    released = release_stock(db, 1, 1)
+    db.commit()
+    db.close()
+    local.set_stock(1, *released)
+    local.set_stock(1, *reserved)  # Datang terlambat: versi lebih lama tidak menimpa stok yang lebih baru
+    assert local.get_by_name("kemeja flanel")["stock"] == 13
+
+    # Worker lain hanya membaca stok produk yang ada di changelog, tanpa scan/reload katalog
+    assert sync_catalog_changes(other, Session) == 1
+    assert other.get_by_name("kemeja flanel")["stock"] == 13 and other.products == index_for(Session).products
+    other.set_stock(1, 12, version=reserved[1])
+    assert other.get_by_name("kemeja flanel")["stock"] == 13
@@ -0,0 +1,79 @@
+# test_catalog_index.py
+import pytest
+from catalog_index import CatalogIndex, edit_distance, MAX_SCORED_CANDIDATES
+
+def sample_catalog():
+    return CatalogIndex([
+        {"id": 1, "name": "kemeja flanel", "stock": 13, "colors": ["merah", "biru"]},
+        {"id": 2, "name": "celana chino", "stock": 0, "colors": ["hitam", "krem"]},
+        {"id": 3, "name": "sepatu kets", "stock": 5, "colors": ["putih"]},
+        {"id": 4, "name": "kemeja flanel premium", "stock": 2, "colors": ["hijau"]},
+    ])
+
+def test_nama_persis_menang():
+    assert sample_catalog().best_match("kemeja flanel")["id"] == 1
+
+def test_typo_dan_akhiran_santai():
+    catalog = sample_catalog()
+    assert catalog.best_match("kemaja flannel")["id"] == 1
+    assert catalog.best_match("flanelnya")["id"] == 1
+    assert catalog.best_match("chinonya")["id"] == 2
+    assert catalog.best_match("sepato ketz")["id"] == 3
+
+def test_hasil_diranking():
+    results = sample_catalog().search("kemeja")
+    assert [r["id"] for _, r in results] == [1, 4]  # Nama lebih pendek (lebih cocok) di depan
+    assert results[0][0] > results[1][0]
+
+def test_produk_tidak_ada():
+    catalog = sample_catalog()
+    assert catalog.best_match("jaket denim") is None
+    assert catalog.best_match("") is None
+
+def test_index_sinkron_saat_write():
+    catalog = sample_catalog()
+    catalog.set_stock(3, 4)
+    catalog.adjust_stock(3, -1)
+    assert catalog.best_match("sepatu kets")["stock"] == 3
+    catalog.upsert({"id": 3, "name": "sepatu kets putih", "stock": 3, "colors": ["putih"]})
+    assert catalog.get_by_name("sepatu kets") is None
+    assert catalog.best_match("sepatu kets")["name"] == "sepatu kets putih"
+    catalog.remove(3)
+    assert catalog.best_match("sepatu kets") is None
+    assert "kets" not in catalog.token_index
+
+def test_edit_distance_dibatasi():
+    assert edit_distance("flannl", "flanel", 1) == 1
+    assert edit_distance("kemeja", "celana", 1) == 2  # Lewat batas -> batas + 1
+
+_CATEGORIES = ("kemeja", "kaos", "celana", "jaket", "sepatu", "topi", "rok", "hoodie", "sweater", "tas")
+_MATERIALS = ("flanel", "katun", "denim", "linen", "parasut", "kulit", "rajut", "fleece", "kanvas", "satin")
+_STYLES = ("slimfit", "oversize", "basic", "premium", "vintage", "crop", "regular", "cargo", "polos", "motif")
+_COLORS = ("hitam", "putih", "merah", "biru", "hijau", "krem", "abu", "navy", "coklat", "kuning")
+
+@pytest.fixture(scope="module")
+def catalog_50rb():
+    """50rb SKU dengan token umum yang sama ('kemeja', 'flanel', 'hitam' ribuan kali) + dua produk target."""
+    records = [{"id": i, "name": f"{_CATEGORIES[i % 10]} {_MATERIALS[i // 10 % 10]} {_STYLES[i // 100 % 10]} "
+                                 f"{_COLORS[i // 1000 % 10]} seri {i // 10000}", "stock": 1, "colors": []}
+               for i in range(50_000)]
+    records += [{"id": 50_000, "name": "kemeja flanel", "stock": 3, "colors": []},
+                {"id": 50_001, "name": "sepatu kets", "stock": 2, "colors": []}]
+    return CatalogIndex(records)
+
+@pytest.mark.parametrize("query, expected", [
+    ("kemaja flannel", "kemeja flanel"),  # Typo di dua token yang muncul di ribuan nama
+    ("sepato ketz", "sepatu kets"),
+    ("kemeja flanelnya", "kemeja flanel"),
+    ("ketsnya", "sepatu kets"),
+    ("jaket denim vintagee hijau seri 3", "jaket denim vintage hijau seri 3"),
+])
+def test_50rb_sku_typo_dan_akhiran(catalog_50rb, query, expected):
+    assert catalog_50rb.best_match(query)["name"] == expected
+
+def test_50rb_sku_token_umum_kandidat_terbatas(catalog_50rb):
+    results = catalog_50rb.search("kemeja", limit=10_000)  # 5rb+ produk memuat 'kemeja'
+    assert len(results) <= MAX_SCORED_CANDIDATES
+    assert results[0][1]["name"] == "kemeja flanel" and all("kemeja" in r["name"] for _, r in results)
+    assert len(catalog_50rb.search("hitam", limit=10_000)) <= MAX_SCORED_CANDIDATES
+    assert catalog_50rb.best_match("hitam") is None  # Cocok satu token dari enam: di bawah MIN_SCORE
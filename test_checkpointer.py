@@ -0,0 +1,68 @@
+# test_checkpointer.py
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+import graph
+import metrics
+from lazy import Lazy
+from checkpointer import SqliteCheckpointSaver
+
+class FakeChatModel(GenericFakeChatModel):
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+def chat(compiled, text, thread_id="whatsapp:+628123"):
+    return compiled.invoke({"messages": [HumanMessage(content=text)], "user_number": thread_id},
+                           config={"configurable": {"thread_id": thread_id}})
+
+def install_llm(monkeypatch, *replies):
+    model = FakeChatModel(messages=iter([AIMessage(content=r) for r in replies]))
+    monkeypatch.setattr(graph, "llm_with_tools", model)
+    monkeypatch.setattr(graph, "llm", model)
+
+def test_riwayat_bertahan_setelah_restart(tmp_path, monkeypatch):
+    install_llm(monkeypatch, "Halo Kak!", "Siap Kak!")
+    db_path = str(tmp_path / "checkpoints.db")
+
+    chat(graph.build_graph(checkpointer=SqliteCheckpointSaver(db_path)), "halo")
+    # Proses baru (checkpointer baru) tetap melihat riwayat sebelumnya
+    output = chat(graph.build_graph(checkpointer=SqliteCheckpointSaver(db_path)), "makasih")
+
+    assert [m.content for m in output["messages"]] == ["halo", "Halo Kak!", "makasih", "Siap Kak!"]
+
+def test_jumlah_checkpoint_per_thread_dibatasi(tmp_path, monkeypatch):
+    install_llm(monkeypatch, *["ok"] * 5)
+    saver = SqliteCheckpointSaver(str(tmp_path / "checkpoints.db"), max_per_thread=3)
+    compiled = graph.build_graph(checkpointer=saver)
+    for i in range(5):
+        chat(compiled, f"pesan {i}")
+
+    stats = saver.stats()
+    assert stats["threads"] == 1
+    assert stats["checkpoints"] == 3
+    assert stats["db_bytes"] > 0
+
+def test_stats_di_metrics_hanya_dari_graph_yang_sudah_dimuat(tmp_path, monkeypatch):
+    install_llm(monkeypatch, "ok")
+    built = []
+    lazy_graph = Lazy("compiled_graph", lambda: built.append(1))
+    monkeypatch.setattr(graph, "compiled_graph", lazy_graph)
+    metrics.render()
+    assert built == []  # Belum dimuat: collector tidak membangun graph
+
+    compiled = graph.build_graph(checkpointer=SqliteCheckpointSaver(str(tmp_path / "checkpoints.db")))
+    chat(compiled, "halo")
+    lazy_graph.set(compiled)
+    rendered = metrics.render()
+    assert 'graph_checkpointer{stat="threads"} 1' in rendered and 'graph_checkpointer{stat="db_bytes"}' in rendered
+
+def test_thread_idle_dihapus(tmp_path, monkeypatch):
+    install_llm(monkeypatch, "ok", "ok")
+    saver = SqliteCheckpointSaver(str(tmp_path / "checkpoints.db"))
+    compiled = graph.build_graph(checkpointer=saver)
+    chat(compiled, "halo", thread_id="user-lama")
+    chat(compiled, "halo", thread_id="user-baru")
+    saver.conn.execute("UPDATE threads SET updated_at = 0 WHERE thread_id = 'user-lama'")
+
+    assert saver.prune_idle() == 1
+    assert saver.get_tuple({"configurable": {"thread_id": "user-lama"}}) is None
+    assert saver.get_tuple({"configurable": {"thread_id": "user-baru"}}) is not None
@@ -40,4 +40,6 @@ def run_chat_session():
             print(f"Terjadi error: {e}")
 
 if __name__ == "__main__":
+    from database import init_db
+    init_db()  # Sama seperti startup app: buat/migrasi tabel dulu
     run_chat_session()
\ No newline at end of file
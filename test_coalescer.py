@@ -0,0 +1,85 @@
+# test_coalescer.py
+import asyncio
+from coalescer import MessageCoalescer, merge_messages
+
+class RecordingHandler:
+    """Handler palsu: catat giliran dan deteksi run paralel untuk nomor yang sama."""
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.turns = []
+        self.running = set()
+        self.overlaps = 0
+
+    async def __call__(self, user_number, text, media_url=None):
+        if user_number in self.running:
+            self.overlaps += 1
+        self.running.add(user_number)
+        await asyncio.sleep(self.delay)
+        self.running.discard(user_number)
+        self.turns.append((user_number, text) if media_url is None else (user_number, text, media_url))
+
+def test_burst_digabung_jadi_satu_giliran():
+    handler = RecordingHandler()
+
+    async def scenario():
+        coalescer = MessageCoalescer(handler, window_seconds=0.05, max_wait_seconds=1.0)
+        for text in ("halo", "kak", "kemeja flanel", "ada?"):
+            coalescer.add("whatsapp:+621", text)
+            await asyncio.sleep(0.01)
+        coalescer.add("whatsapp:+622", "stok sepatu kets?")
+        await asyncio.sleep(0.15)
+        return coalescer
+
+    coalescer = asyncio.run(scenario())
+    assert sorted(handler.turns) == [("whatsapp:+621", "halo kak kemeja flanel ada?"), ("whatsapp:+622", "stok sepatu kets?")]
+    assert coalescer.received_messages == 5 and coalescer.turns == 2
+
+def test_batas_tunggu_dan_jumlah_pesan():
+    handler = RecordingHandler()
+
+    async def scenario():
+        coalescer = MessageCoalescer(handler, window_seconds=0.05, max_wait_seconds=0.08, max_messages=3)
+        for i in range(6):  # Terus mengetik: tetap diproses setelah max_wait / max_messages
+            coalescer.add("a", f"m{i}")
+            await asyncio.sleep(0.03)
+        await coalescer.drain()
+
+    asyncio.run(scenario())
+    assert [text for _, text in handler.turns] == ["m0 m1 m2", "m3 m4 m5"]
+
+def test_giliran_per_nomor_berurutan():
+    handler = RecordingHandler(delay=0.05)
+
+    async def scenario():
+        coalescer = MessageCoalescer(handler, window_seconds=0.01, max_wait_seconds=0.01)
+        coalescer.add("a", "pertama")
+        await asyncio.sleep(0.02)  # Giliran pertama sedang jalan
+        coalescer.add("a", "kedua")
+        await asyncio.sleep(0.02)
+        await coalescer.drain()
+        return coalescer
+
+    coalescer = asyncio.run(scenario())
+    assert handler.turns == [("a", "pertama"), ("a", "kedua")]
+    assert handler.overlaps == 0 and coalescer._locks == {}
+
+def test_gambar_membawa_teks_yang_ditahan_dan_tetap_berurutan():
+    handler = RecordingHandler(delay=0.05)
+
+    async def scenario():
+        coalescer = MessageCoalescer(handler, window_seconds=0.01, max_wait_seconds=0.01)
+        coalescer.add("a", "pertama")
+        await asyncio.sleep(0.02)  # Giliran pertama sedang jalan
+        coalescer.add("a", "kak")
+        coalescer.add("a", "yang ini ada?", "https://api.twilio.com/media/1")  # Tanpa menunggu jendela debounce
+        coalescer.add("a", "ukuran L")
+        assert coalescer.pending() == 1
+        await coalescer.drain()
+        return coalescer
+
+    coalescer = asyncio.run(scenario())
+    assert handler.turns == [("a", "pertama"), ("a", "kak yang ini ada?", "https://api.twilio.com/media/1"), ("a", "ukuran L")]
+    assert handler.overlaps == 0 and coalescer.turns == 3
+
+def test_merge_lewati_pesan_kosong():
+    assert merge_messages(["halo ", None, "", " kak"]) == "halo kak"
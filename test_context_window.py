@@ -0,0 +1,53 @@
+# test_context_window.py
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from context_window import plan_window, split_turns, build_context, summarize
+
+def make_turn(i, with_tool=False):
+    turn = [HumanMessage(content=f"pertanyaan {i}")]
+    if with_tool:
+        turn.append(AIMessage(content="", tool_calls=[{"name": "get_product_info", "args": {"__arg1": "kemeja flanel stok"}, "id": f"c{i}"}]))
+        turn.append(ToolMessage(content="Stok kemeja flanel ada 13 pcs.", name="get_product_info", tool_call_id=f"c{i}"))
+    turn.append(AIMessage(content=f"jawaban {i}"))
+    return turn
+
+def conversation(n, with_tool=True):
+    return [m for i in range(n) for m in make_turn(i, with_tool)]
+
+def test_percakapan_pendek_dikirim_utuh():
+    messages = conversation(3)
+    upto, kept, to_fold = plan_window(messages, 0, max_turns=6, max_tokens=3000)
+    assert (upto, kept, to_fold) == (0, messages, [])
+
+def test_giliran_lama_dilipat_dan_pasangan_tool_utuh():
+    messages = conversation(8)
+    upto, kept, to_fold = plan_window(messages, 0, max_turns=6, max_tokens=3000, keep_after_fold=3)
+
+    assert len(split_turns(kept)) == 3
+    assert isinstance(kept[0], HumanMessage)  # Jendela tidak pernah mulai dari ToolMessage
+    assert to_fold == messages[:upto]
+    tool_call_ids = {c["id"] for m in kept if isinstance(m, AIMessage) for c in m.tool_calls}
+    assert tool_call_ids == {m.tool_call_id for m in kept if isinstance(m, ToolMessage)}
+
+def test_ringkasan_tidak_dibuat_ulang_tiap_giliran():
+    messages = conversation(8)
+    upto, _, _ = plan_window(messages, 0, max_turns=6, keep_after_fold=3)
+    # Dua giliran berikutnya masih muat di jendela -> tidak ada yang perlu dilipat lagi
+    messages += make_turn(8) + make_turn(9)
+    next_upto, _, to_fold = plan_window(messages, upto, max_turns=6, keep_after_fold=3)
+    assert next_upto == upto and to_fold == []
+
+def test_budget_token_membatasi_jendela():
+    long_turn = [HumanMessage(content="kata " * 2000), AIMessage(content="ok")]
+    messages = long_turn + conversation(2, with_tool=False)
+    upto, kept, _ = plan_window(messages, 0, max_turns=6, max_tokens=500)
+    assert upto == 2 and kept == messages[2:]
+
+def test_ringkasan_fallback_kalau_llm_gagal():
+    class BrokenLLM:
+        def invoke(self, messages):
+            raise RuntimeError("timeout")
+
+    summary = summarize(BrokenLLM(), "Pelanggan bernama Andi.", make_turn(1))
+    assert "Andi" in summary and "pertanyaan 1" in summary
+    context = build_context(summary, make_turn(2))
+    assert isinstance(context[0], SystemMessage)
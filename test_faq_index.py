@@ -0,0 +1,175 @@
+# test_faq_index.py
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+import faq_index
+
+SEP = "\n--------------------------------------\n"
+# Tiap entri dibuat panjang supaya splitter (chunk_size 1000) tidak menggabungkannya
+FAQ_A = "FAQ 1\nP: Cara bayar?\nJ: " + "Transfer bank. " * 50 + SEP + "FAQ 2\nP: Ongkir?\nJ: " + "Gratis ongkir. " * 50
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Embedding palsu yang menghitung berapa kali embed_documents dipanggil."""
+    calls: int = 0
+    embedded_texts: int = 0  # Jumlah teks di panggilan embed_documents terakhir
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.embedded_texts = len(texts)
+        return super().embed_documents(texts)
+
+def test_index_dimuat_dari_cache_kalau_faq_tidak_berubah(tmp_path):
+    faq_file = tmp_path / "faq.txt"
+    faq_file.write_text(FAQ_A, encoding="utf-8")
+    index_dir = str(tmp_path / "index")
+
+    embeddings = CountingEmbeddings(size=16)
+    _, texts = faq_index.load_faq_vectorstore(embeddings, path=str(faq_file), index_dir=index_dir)
+    assert embeddings.calls == 1
+    assert len(texts) == 2
+
+    # Start kedua: tidak ada embed ulang
+    vectorstore, _ = faq_index.load_faq_vectorstore(embeddings, path=str(faq_file), index_dir=index_dir)
+    assert embeddings.calls == 1
+    assert vectorstore.index.ntotal == 2
+
+def test_index_dibuat_ulang_kalau_faq_berubah(tmp_path):
+    faq_file = tmp_path / "faq.txt"
+    faq_file.write_text(FAQ_A, encoding="utf-8")
+    index_dir = tmp_path / "index"
+
+    embeddings = CountingEmbeddings(size=16)
+    faq_index.load_faq_vectorstore(embeddings, path=str(faq_file), index_dir=str(index_dir))
+    faq_file.write_text(FAQ_A + SEP + "FAQ 3\nP: Retur?\nJ: " + "Maksimal 7 hari. " * 50, encoding="utf-8")
+    _, texts = faq_index.load_faq_vectorstore(embeddings, path=str(faq_file), index_dir=str(index_dir))
+
+    assert embeddings.calls == 2
+    assert len(texts) == 3
+    assert embeddings.embedded_texts == 1  # Dua chunk lama diambil dari cache vektor per chunk
+
+def test_index_key_sebelumnya_tetap_disimpan(tmp_path):
+    import os
+    import time
+    faq_file = tmp_path / "faq.txt"
+    index_dir = tmp_path / "index"
+    embeddings = CountingEmbeddings(size=16)
+    keys = []
+    for i, extra in enumerate(("", SEP + "FAQ 3\nP: Retur?\nJ: " + "Maksimal 7 hari. " * 50, SEP + "FAQ 4\nP: COD?\nJ: " + "Bisa COD. " * 50)):
+        faq_file.write_text(FAQ_A + extra, encoding="utf-8")
+        faq_index.load_faq_vectorstore(embeddings, path=str(faq_file), index_dir=str(index_dir))
+        keys.append(faq_index.faq_cache_key(faq_file.read_text(encoding="utf-8"), embeddings))
+        os.utime(index_dir / keys[-1], (time.time() - 100 + i, time.time() - 100 + i))  # Urutan mtime pasti
+
+    # Worker yang belum reload masih memuat key sebelumnya; yang lebih tua dibersihkan, cache per chunk tetap
+    assert sorted(p.name for p in index_dir.iterdir()) == sorted([faq_index.CHUNK_CACHE_DIR] + keys[1:])
+
+def test_reload_hanya_embed_chunk_yang_berubah(tmp_path, monkeypatch):
+    import tools
+    from lazy import Lazy
+    faq_file = tmp_path / "faq.txt"
+    faq_file.write_text(FAQ_A + SEP + "FAQ 3\nP: Retur?\nJ: " + "Maksimal 7 hari. " * 50, encoding="utf-8")
+    monkeypatch.setattr(faq_index, "FAQ_PATH", str(faq_file))
+    monkeypatch.setattr(faq_index, "FAQ_INDEX_DIR", str(tmp_path / "index"))
+    embeddings = faq_index.CachedQueryEmbeddings(CountingEmbeddings(size=16))
+    monkeypatch.setattr(tools, "faq_retriever", Lazy("faq_retriever", lambda: tools._build_faq_retriever(embeddings)))
+    old = tools.faq_retriever.get()
+    assert embeddings.documents_embedded == 3
+
+    faq_file.write_text(FAQ_A.replace("Gratis ongkir. ", "Ongkir Rp10.000. ") + SEP + "FAQ 3\nP: Retur?\nJ: " + "Maksimal 7 hari. " * 50,
+                        encoding="utf-8")
+    report = tools.reload_faq_retriever()
+    assert report["embedded"] == 1 and report["chunks"] == 3 and embeddings.base.calls == 2
+    new = tools.faq_retriever.get()
+    assert new is not old and "Ongkir Rp10.000" in tools.faq_retriever_func("ongkir berapa")
+    assert "Gratis ongkir" in old.search("ongkir berapa")[0]  # Pencarian yang pegang retriever lama tidak terganggu
+
+    faq_file.unlink()
+    with pytest.raises(FileNotFoundError):
+        tools.reload_faq_retriever()
+    assert tools.faq_retriever.get() is new  # Gagal reload: retriever lama tetap dipakai
+
+def test_reload_melaporkan_turun_ke_lexical(tmp_path, monkeypatch):
+    import tools
+    from lazy import Lazy
+
+    class BrokenEmbeddings(CountingEmbeddings):
+        def embed_documents(self, texts):
+            raise RuntimeError("endpoint embedding down")
+
+    faq_file = tmp_path / "faq.txt"
+    faq_file.write_text(FAQ_A, encoding="utf-8")
+    monkeypatch.setattr(faq_index, "FAQ_PATH", str(faq_file))
+    monkeypatch.setattr(faq_index, "FAQ_INDEX_DIR", str(tmp_path / "index"))
+    embeddings = faq_index.CachedQueryEmbeddings(BrokenEmbeddings(size=16))
+    monkeypatch.setattr(tools, "faq_retriever", Lazy("faq_retriever", lambda: tools._build_faq_retriever(embeddings)))
+    tools.faq_retriever.get()
+
+    report = tools.reload_faq_retriever()
+    assert report["mode"] == "lexical" and "endpoint embedding down" in report["vector_error"]
+
+def test_watcher_reload_setelah_mtime_stabil(tmp_path):
+    import os
+    import threading
+    import time
+    from faq_watcher import watch_faq
+    faq_file = tmp_path / "faq.txt"
+    faq_file.write_text(FAQ_A, encoding="utf-8")
+    reloads, stop = [], threading.Event()
+    thread = threading.Thread(target=watch_faq, args=(str(faq_file), 0.02, lambda: reloads.append(1), stop))
+    thread.start()
+    time.sleep(0.05)
+    faq_file.write_text(FAQ_A + "\nbaru", encoding="utf-8")
+    os.utime(faq_file, ns=(time.time_ns(), time.time_ns() + 10**9))
+    time.sleep(0.2)
+    stop.set()
+    thread.join()
+    assert reloads == [1]
+
+def test_cache_key_ikut_model_embedding():
+    a = DeterministicFakeEmbedding(size=16)
+    b = CountingEmbeddings(size=16)
+    assert faq_index.faq_cache_key(FAQ_A, a) != faq_index.faq_cache_key(FAQ_A, b)
+
+# --- Retriever lexical/hybrid ---
+
+class SlowEmbeddings(CountingEmbeddings):
+    """Embedding palsu yang selalu lewat dari timeout."""
+
+    def embed_query(self, text):
+        import time
+        time.sleep(0.5)
+        return super().embed_query(text)
+
+def _faq_chunks():
+    return faq_index.split_faq_text(faq_index.read_faq_text())
+
+def test_stemmer_indonesia():
+    assert faq_index.stem_id("pembayaran") == "bayar"
+    assert faq_index.stem_id("pengiriman") == "kirim"
+    assert faq_index.stem_id("penukaran") == "tukar"
+
+def test_lexical_menemukan_faq_pembayaran_tanpa_embedding():
+    embeddings = CountingEmbeddings(size=16)
+    texts = _faq_chunks()
+    vectorstore = faq_index.FAISS.from_texts(texts, embeddings)
+    retriever = faq_index.HybridFaqRetriever(texts, vectorstore, faq_index.CachedQueryEmbeddings(embeddings))
+
+    results = retriever.search("cara bayar")
+    assert "metode pembayaran" in results[0]
+    assert retriever.embeddings.misses == 0  # BM25 cukup yakin, tidak ada embedding query
+
+def test_query_embedding_di_cache():
+    embeddings = faq_index.CachedQueryEmbeddings(DeterministicFakeEmbedding(size=16), maxsize=2)
+    first = embeddings.embed_query("Cara  Bayar?")
+    assert embeddings.embed_query("cara bayar") == first
+    assert (embeddings.hits, embeddings.misses) == (1, 1)
+    embeddings.embed_query("ongkir")
+    embeddings.embed_query("retur")
+    assert "cara bayar" not in embeddings._cache  # LRU dibatasi maxsize
+
+def test_hybrid_fallback_ke_lexical_kalau_embedding_lambat():
+    texts = _faq_chunks()
+    vectorstore = faq_index.FAISS.from_texts(texts, DeterministicFakeEmbedding(size=16))
+    retriever = faq_index.HybridFaqRetriever(texts, vectorstore, SlowEmbeddings(size=16), vector_timeout=0.05)
+
+    results = retriever.search("ukuran baju")
+    assert results and "ukuran" in results[0].lower()
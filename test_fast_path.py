@@ -0,0 +1,38 @@
+# test_fast_path.py
+import pytest
+from fast_path import match_fast_path
+from catalog_index import CatalogIndex
+from utils import pre_process_message
+
+CATALOG = CatalogIndex([
+    {"id": 1, "name": "kemeja flanel", "stock": 13, "colors": ["merah", "biru"]},
+    {"id": 2, "name": "celana chino", "stock": 0, "colors": ["hitam", "krem"]},
+    {"id": 3, "name": "sepatu kets", "stock": 5, "colors": ["putih"]},
+])
+
+# Pesan yang cukup yakin untuk dijawab tanpa LLM
+fast_scenarios = [
+    ("kemeja flanelnya ada?", "kemeja flanel stok"),
+    ("sepatu kets ada?", "sepatu kets stok"),
+    ("warna sepatu kets apa aja?", "sepatu kets warna"),
+    ("kemaja flannl ada ga?", "kemeja flanel stok"),
+    ("stok celana chino masih ada kak?", "celana chino stok"),
+]
+
+# Pesan yang harus tetap lewat graph
+graph_scenarios = [
+    "mau sepatu kets 1 deh",  # Order
+    "halo kak",  # Sapaan
+    "jual jaket denim?",  # Produk tidak ada di katalog
+    "kemeja flanel ada ukuran xl?",  # Pertanyaan lebih spesifik
+    "cara bayar kemeja flanel gimana?",  # FAQ
+    "kemeja flanel sama sepatu kets ada?",  # Dua produk
+]
+
+@pytest.mark.parametrize("user_input, expected_tool_input", fast_scenarios)
+def test_fast_path_cocok(user_input, expected_tool_input):
+    assert match_fast_path(pre_process_message(user_input), CATALOG) == expected_tool_input
+
+@pytest.mark.parametrize("user_input", graph_scenarios)
+def test_fast_path_serahkan_ke_graph(user_input):
+    assert match_fast_path(pre_process_message(user_input), CATALOG) is None
@@ -0,0 +1,103 @@
+# test_graph.py
+import time
+import asyncio
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+import graph
+
+class ScriptedChatModel(GenericFakeChatModel):
+    """LLM palsu: balas sesuai urutan skrip dan hitung jumlah panggilan."""
+    calls: int = 0
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, *args, **kwargs):
+        self.calls += 1
+        return super()._generate(*args, **kwargs)
+
+class SlowChatModel(ScriptedChatModel):
+    """Panggilan pertama cepat, berikutnya lambat (LLM yang macet di tengah giliran)."""
+    delay: float = 0.0
+
+    def _generate(self, *args, **kwargs):
+        if self.calls:
+            time.sleep(self.delay)
+        return super()._generate(*args, **kwargs)
+
+def tool_call(name, arg):
+    return AIMessage(content="", tool_calls=[{"name": name, "args": {"__arg1": arg}, "id": f"call-{name}"}])
+
+@pytest.fixture
+def scripted_llm(monkeypatch):
+    def install(*responses):
+        model = ScriptedChatModel(messages=iter(responses))
+        monkeypatch.setattr(graph, "llm_with_tools", model)
+        monkeypatch.setattr(graph, "llm", model)
+        return model
+    return install
+
+def run(compiled, text):
+    return compiled.invoke({"messages": [HumanMessage(content=text)], "user_number": "test-user"},
+                           config={"configurable": {"thread_id": "test-graph"}})
+
+def test_tool_deterministik_tidak_direflect(scripted_llm):
+    model = scripted_llm(tool_call("get_product_info", "sepatu kets stok"), AIMessage(content="Stok sepatu kets ada."))
+    output = run(graph.build_graph(reflect_mode="on_error"), "sepatu kets ada?")
+
+    assert model.calls == 2  # agent -> action -> agent, tanpa reflect
+    assert output["messages"][-1].content == "Stok sepatu kets ada."
+
+def test_mode_always_tetap_reflect(scripted_llm):
+    model = scripted_llm(tool_call("get_product_info", "sepatu kets stok"), AIMessage(content="review"), AIMessage(content="final"))
+    output = run(graph.build_graph(reflect_mode="always"), "sepatu kets ada?")
+
+    assert model.calls == 3
+    assert output["messages"][-1].content == "final"
+
+def test_budget_habis_jawab_dari_hasil_tool(scripted_llm):
+    model = scripted_llm(tool_call("get_product_info", "sepatu kets stok"), AIMessage(content="tidak boleh dipanggil"))
+    output = run(graph.build_graph(max_llm_calls=1), "sepatu kets ada?")
+
+    assert model.calls == 1
+    assert isinstance(output["messages"][-2], ToolMessage)
+    assert output["messages"][-1].content == output["messages"][-2].content
+
+def test_budget_habis_tanpa_hasil_tool(scripted_llm):
+    model = scripted_llm(AIMessage(content="ini ambiguous"), AIMessage(content="tidak boleh dipanggil"))
+    output = run(graph.build_graph(max_llm_calls=1), "hmm")
+
+    assert model.calls == 1  # Clarify dilewati karena budget habis
+    assert output["messages"][-1].content == graph.BUDGET_EXHAUSTED_MESSAGE  # Bukan teks mentah agent
+    assert output["is_ambiguous"] is False
+
+def test_tool_error_memicu_reflect():
+    failed = ToolMessage(content="Produk tidak ditemukan.", name="create_order", tool_call_id="1")
+    ok = ToolMessage(content="Stok sepatu kets ada 5 pcs.", name="get_product_info", tool_call_id="2")
+    assert graph.tool_result_failed(failed)
+    assert not graph.tool_result_failed(ok)
+
+def test_reflect_lambat_dipotong_deadline(monkeypatch):
+    model = SlowChatModel(messages=iter([tool_call("get_product_info", "sepatu kets stok"), AIMessage(content="telat")]), delay=1.0)
+    monkeypatch.setattr(graph, "llm_with_tools", model)
+    monkeypatch.setattr(graph, "llm", model)
+    compiled = graph.build_graph(reflect_mode="always", max_seconds=0.3)
+
+    async def turn():
+        started = time.perf_counter()
+        output = await compiled.ainvoke({"messages": [HumanMessage(content="sepatu kets ada?")], "user_number": "test-user"},
+                                        config={"configurable": {"thread_id": "test-graph-slow"}})
+        return output, time.perf_counter() - started
+    output, elapsed = asyncio.run(turn())
+    assert elapsed < 0.8  # Reflect tidak ditunggu sampai selesai
+    assert isinstance(output["messages"][-2], ToolMessage)  # Finalize menjawab dari hasil tool
+    assert output["messages"][-1].content == output["messages"][-2].content
+
+def test_ringkasan_tidak_melewati_jatah_llm(scripted_llm, monkeypatch):
+    monkeypatch.setattr(graph, "plan_window", lambda messages, upto: (1, messages[1:], messages[:1]))  # Selalu ada yang dilipat
+    model = scripted_llm(AIMessage(content="Halo Kak!"), AIMessage(content="tidak boleh dipanggil"))
+    output = run(graph.build_graph(max_llm_calls=1), "halo")
+
+    assert model.calls == 1  # Ringkasan tanpa LLM (potong transkrip), agent tetap satu panggilan
+    assert output["messages"][-1].content == "Halo Kak!" and "Pelanggan: halo" in output["summary"]
@@ -0,0 +1,64 @@
+# test_history_store.py
+import threading
+from cryptography.fernet import Fernet
+from history_store import HistoryStore
+
+def make_store(path="", **kwargs):
+    return HistoryStore(path=path, cipher=Fernet(Fernet.generate_key()), **kwargs)
+
+def test_ringkasan_dari_cache_tanpa_dekripsi_ulang():
+    store = make_store(max_turns=5)
+    for i in range(4):
+        store.append("a", f"tanya {i}", f"jawab {i}")
+    assert store.summary("a") == "Pelanggan: tanya 1 | Respons: jawab 1 Pelanggan: tanya 2 | Respons: jawab 2 Pelanggan: tanya 3 | Respons: jawab 3"
+    decryptions = store.decryptions
+    store.append("a", "tanya 4", "jawab 4")
+    assert store.recent("a")[-1] == ("tanya 4", "jawab 4")
+    assert store.summary("a").startswith("Pelanggan: tanya 2")
+    assert store.decryptions == decryptions  # Cache diperbarui dari teks polos saat append
+
+def test_cache_kedaluwarsa_didekripsi_ulang():
+    store = make_store(summary_ttl=0)
+    store.append("a", "halo", "hai")
+    assert store.recent("a") == [("halo", "hai")]
+    assert store.decryptions == 2
+
+def test_deque_dan_lru_terbatas():
+    store = make_store(max_turns=3, max_users=2)
+    for i in range(10):
+        store.append("a", f"q{i}", f"r{i}")
+    assert [u for u, _ in store.recent("a", 3)] == ["q7", "q8", "q9"]
+    store.append("b", "q", "r")
+    store.append("c", "q", "r")  # 'a' paling lama tidak aktif -> dikeluarkan
+    assert len(store) == 2 and store.recent("a") == []
+
+def test_riwayat_tahan_restart_dan_terenkripsi_di_disk(tmp_path):
+    path, cipher = str(tmp_path / "history.db"), Fernet(Fernet.generate_key())
+    store = HistoryStore(path=path, cipher=cipher, max_turns=3)
+    for i in range(5):
+        store.append("a", f"nomor rahasia {i}", "ok")
+    raw = store.conn.execute("SELECT user_message FROM history").fetchall()
+    assert len(raw) == 3 and all(b"rahasia" not in row[0] for row in raw)
+
+    restarted = HistoryStore(path=path, cipher=cipher, max_turns=3)
+    assert [u for u, _ in restarted.recent("a", 3)] == ["nomor rahasia 2", "nomor rahasia 3", "nomor rahasia 4"]
+
+def test_mode_shared_dibaca_semua_worker(tmp_path):
+    path, cipher = str(tmp_path / "history.db"), Fernet(Fernet.generate_key())
+    worker_a = HistoryStore(path=path, cipher=cipher, shared=True)
+    worker_b = HistoryStore(path=path, cipher=cipher, shared=True)
+    worker_a.append("a", "halo", "hai")
+    worker_b.append("a", "stok flanel?", "ada 13")
+    assert worker_a.recent("a") == [("halo", "hai"), ("stok flanel?", "ada 13")]
+    worker_a.recent("a")
+    assert worker_a.decryptions == 2  # Hanya giliran dari worker lain, sekali saja
+
+def test_tulis_disk_tidak_menahan_pembaca(tmp_path):
+    store = HistoryStore(path=str(tmp_path / "history.db"), cipher=Fernet(Fernet.generate_key()))
+    store.append("a", "halo", "hai")
+    with store._db_lock:  # Disk lambat (fsync/DB terkunci): ringkasan dari memori tetap jalan
+        result = []
+        reader = threading.Thread(target=lambda: result.append(store.summary("a")))
+        reader.start()
+        reader.join(timeout=2)
+        assert result == ["Pelanggan: halo | Respons: hai"]
@@ -0,0 +1,41 @@
+# test_keyword_engine.py
+import random
+import pytest
+from keyword_engine import KeywordMatcher, analyze
+from utils import moderate_content, detect_negative_emotion, pre_process_message
+
+KEYWORDS = ['ada', 'tidak ada', 'stok', 'stoknya', 'nya', 'mau berapa', 'tidak dapat menemukan', 'yuk!']
+
+@pytest.mark.parametrize("text", [
+    "stoknya masih ada, kak",
+    "maaf, stok tidak  ada",  # Spasi ganda: 'tidak ada' tidak cocok, sama seperti `in`
+    "xtidak adanya",  # Frasa boleh menempel di awal/akhir potongan
+    "kakak mau\nberapa? mau berapa pcs",
+    "kami tidak dapat menemukan produk itu, coba yang lain yuk!",
+    "",
+])
+def test_sama_dengan_pencarian_substring(text):
+    assert KeywordMatcher(KEYWORDS).find(text) == {kw for kw in KEYWORDS if kw in text}
+
+def test_acak_sama_dengan_pencarian_substring():
+    rng = random.Random(7)
+    vocab = ["ada", "tidak", "stoknya", "mau", "berapa", "dapat", "menemukan", "yuk!", "padahal", "x"]
+    matcher = KeywordMatcher(KEYWORDS)
+    for _ in range(2000):
+        text = "".join(rng.choice(vocab) + rng.choice([" ", " ", "  ", ", ", ""]) for _ in range(rng.randint(0, 8)))
+        assert matcher.find(text) == {kw for kw in KEYWORDS if kw in text}, text
+
+def test_daftar_moderasi_ribuan_kata():
+    bad = [f"kataterlarang{i}" for i in range(5000)] + [f"kata terlarang {i}" for i in range(500)]
+    matcher = KeywordMatcher(bad)
+    assert matcher.find("halo kak, ada kataterlarang4242 di sini") == {"kataterlarang4", "kataterlarang42", "kataterlarang424", "kataterlarang4242"}
+    assert matcher.find("ini kata terlarang 17 ya") == {"kata terlarang 17", "kata terlarang 1"}
+    assert matcher.find("stok kemeja flanel ada?") == set()
+
+def test_pipeline_utils_memakai_hasil_scan():
+    assert moderate_content("ini BADWORD1 loh")
+    assert detect_negative_emotion("barangnya rusak kak", 'id') and not detect_negative_emotion("barangnya rusak kak", 'en')
+    assert pre_process_message("kemaja flannl nya ada ga sih") == "kemeja flanel nya ada ga"
+    assert pre_process_message("mau sepato ketz 2 dong") == "pesan sepatu kets 2"
+    with pytest.raises(KeyError):
+        analyze("halo").has("keyword-belum-terdaftar")
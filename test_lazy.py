@@ -0,0 +1,41 @@
+# test_lazy.py
+import time
+import threading
+from lazy import Lazy, warm_up, startup_report
+
+def test_dibuat_sekali_walau_diakses_banyak_thread():
+    calls = []
+
+    def factory():
+        calls.append(1)
+        time.sleep(0.05)  # Lebarkan jendela race
+        return {"ok": True}
+
+    component = Lazy("test_sekali", factory)
+    assert not component.loaded and calls == []
+    threads = [threading.Thread(target=component.get) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and component.get() == {"ok": True}
+    assert startup_report()["test_sekali"] >= 50
+
+def test_atribut_diteruskan_ke_objek_asli():
+    class Client:
+        name = "asli"
+        def ping(self):
+            return "pong"
+
+    component = Lazy("test_proxy", Client)
+    assert component.name == "asli" and component.ping() == "pong"
+    component.name = "baru"
+    assert component.get().name == "baru"
+
+def test_warm_up_lanjut_walau_satu_komponen_gagal():
+    def broken():
+        raise RuntimeError("kunci API kosong")
+
+    healthy = Lazy("test_sehat", lambda: "siap")
+    report = warm_up(Lazy("test_rusak", broken), healthy)
+    assert healthy.loaded and "test_sehat" in report
@@ -0,0 +1,67 @@
+# test_media.py
+import io
+import asyncio
+import base64
+import httpx
+import pytest
+from media import prepare_image, fetch_media, MediaCache, MediaTooLarge
+
+Image = pytest.importorskip("PIL.Image")
+
+def make_jpeg(width, height):
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(output, format="JPEG", quality=95)
+    return output.getvalue()
+
+class FakeMediaServer:
+    """Pengganti server media Twilio: hitung request per URL."""
+    def __init__(self, files):
+        self.files = files
+        self.requests = []
+
+    def handler(self, request):
+        self.requests.append(str(request.url))
+        body = self.files.get(request.url.path)
+        if body is None:
+            return httpx.Response(404)
+        return httpx.Response(200, content=body, headers={"content-type": "image/jpeg"})
+
+    def client(self):
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+def test_gambar_besar_diperkecil_dan_dicache_per_url_dan_hash():
+    photo = make_jpeg(4000, 3000)
+    server = FakeMediaServer({"/a.jpg": photo, "/b.jpg": photo})
+    cache = MediaCache()
+
+    async def scenario():
+        async with server.client() as client:
+            first = await prepare_image("https://media.test/a.jpg", client=client, cache=cache)
+            retried = await prepare_image("https://media.test/a.jpg", client=client, cache=cache)
+            same_content = await prepare_image("https://media.test/b.jpg", client=client, cache=cache)
+            return first, retried, same_content
+
+    first, retried, same_content = asyncio.run(scenario())
+    with Image.open(io.BytesIO(base64.b64decode(first["base64"]))) as image:
+        assert max(image.size) == 1024
+    assert first["bytes"] < first["original_bytes"]
+    assert retried is first and same_content is first
+    assert len(server.requests) == 2  # Retry webhook tidak mengunduh ulang; URL baru tetap diunduh sekali
+
+def test_media_melewati_batas_ditolak_saat_streaming():
+    server = FakeMediaServer({"/big.jpg": b"x" * 5000})
+
+    async def scenario():
+        async with server.client() as client:
+            with pytest.raises(MediaTooLarge):
+                await fetch_media("https://media.test/big.jpg", client=client, max_bytes=1000)
+            return await prepare_image("https://media.test/missing.jpg", client=client, cache=MediaCache())
+
+    assert asyncio.run(scenario()) is None
+
+def test_cache_analisis_per_hash():
+    cache = MediaCache(max_entries=1)
+    cache.set_analysis("abc", "ini rusak?", "Jahitannya lepas, Kak.")
+    assert cache.get_analysis("abc", "ini rusak?") == "Jahitannya lepas, Kak."
+    cache.set_analysis("def", "ini rusak?", "Tidak ada masalah.")
+    assert cache.get_analysis("abc", "ini rusak?") is None  # Dibatasi LRU
@@ -0,0 +1,56 @@
+# test_metrics.py
+import pytest
+from sqlalchemy import create_engine, text
+from langchain_core.messages import AIMessage, HumanMessage
+import metrics
+
+def test_histogram_dirender_kumulatif_format_prometheus():
+    histogram = metrics.Histogram("test_latency_seconds", "Latensi test.", ("node",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, node="agent")
+    lines = histogram.render()
+    assert lines[:2] == ["# HELP test_latency_seconds Latensi test.", "# TYPE test_latency_seconds histogram"]
+    assert 'test_latency_seconds_bucket{node="agent",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{node="agent",le="1.0"} 3' in lines
+    assert 'test_latency_seconds_bucket{node="agent",le="+Inf"} 4' in lines
+    assert 'test_latency_seconds_count{node="agent"} 4' in lines
+    assert "test_latency_seconds" in metrics.render()
+
+def test_token_dan_panggilan_llm_per_request():
+    response = AIMessage(content="ok", usage_metadata={"input_tokens": 120, "output_tokens": 30, "total_tokens": 150})
+    before = metrics.llm_tokens_total.value(node="test", type="input")
+    with metrics.track_request() as usage:
+        for _ in range(2):
+            with metrics.llm_call("test") as record:
+                record(response)
+        with pytest.raises(TimeoutError):
+            with metrics.llm_call("test"):
+                raise TimeoutError()
+    assert usage == {"llm_calls": 2, "tokens": 300}
+    assert metrics.llm_tokens_total.value(node="test", type="input") - before == 240
+    assert metrics.llm_calls_total.value(node="test", status="error") >= 1
+
+def test_node_dan_tool_graph_tercatat(monkeypatch):
+    graph = pytest.importorskip("graph")
+    from test_graph import ScriptedChatModel, tool_call
+    model = ScriptedChatModel(messages=iter([tool_call("get_product_info", "sepatu kets stok"), AIMessage(content="Ada.")]))
+    monkeypatch.setattr(graph, "llm_with_tools", model)
+    monkeypatch.setattr(graph, "llm", model)
+    agent_before = metrics.graph_node_seconds.count(node="agent")
+    tool_before = metrics.tool_seconds.count(tool="get_product_info")
+
+    graph.build_graph().invoke({"messages": [HumanMessage(content="sepatu kets ada?")], "user_number": "test-user"},
+                               config={"configurable": {"thread_id": "test-metrics"}})
+    assert metrics.graph_node_seconds.count(node="agent") - agent_before == 2
+    assert metrics.tool_seconds.count(tool="get_product_info") - tool_before == 1
+
+def test_query_sqlalchemy_dicatat_per_jenis_statement():
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine)
+    before = metrics.db_query_seconds.count(operation="SELECT")
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        with pytest.raises(Exception):
+            conn.execute(text("SELECT * FROM tabel_tidak_ada"))
+        conn.execute(text("SELECT 2"))
+    assert metrics.db_query_seconds.count(operation="SELECT") - before == 2
@@ -0,0 +1,49 @@
+# test_notifier.py
+import time
+from notifier import AgentNotifier, format_digests
+
+class FlakySender:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.bodies = []
+
+    def __call__(self, body):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Twilio 503")
+        self.bodies.append(body)
+
+def test_pesan_dalam_satu_jendela_jadi_satu_digest():
+    sender = FlakySender()
+    notifier = AgentNotifier(send=sender, window_seconds=0.2, sleep=lambda s: None)
+    for i in range(5):
+        notifier.enqueue(f"komplain {i}")
+    deadline = time.time() + 3
+    while notifier.stats()["sent_messages"] < 5 and time.time() < deadline:
+        time.sleep(0.02)
+
+    assert len(sender.bodies) == 1
+    assert sender.bodies[0].startswith("Escalation (5 pesan):") and "5. komplain 4" in sender.bodies[0]
+    stats = notifier.stats()
+    assert stats["depth"] == 0 and stats["sent_digests"] == 1 and stats["last_latency_seconds"] >= 0.2
+
+def test_retry_dengan_backoff_lalu_terkirim():
+    sender, delays = FlakySender(failures=2), []
+    notifier = AgentNotifier(send=sender, sleep=delays.append, autostart=False)
+    notifier.enqueue("pelanggan marah")
+    assert notifier.flush() == 1
+    assert sender.bodies == ["Escalation: pelanggan marah"]
+    assert len(delays) == 2 and delays[1] > delays[0]
+
+def test_gagal_permanen_dan_antrian_penuh_tercatat():
+    notifier = AgentNotifier(send=FlakySender(failures=10), max_attempts=3, max_queue=2, sleep=lambda s: None, autostart=False)
+    for message in ("a", "b", "c"):
+        notifier.enqueue(message)
+    assert notifier.flush() == 2
+    stats = notifier.stats()
+    assert stats["dropped_messages"] == 1 and stats["failed_messages"] == 2 and stats["sent_messages"] == 0
+
+def test_digest_panjang_dipecah():
+    digests = format_digests(["x" * 400] * 10, max_chars=1500)
+    assert len(digests) > 1 and all(len(d) <= 1500 for d in digests)
+    assert digests[0].startswith(f"Escalation (10 pesan, bagian 1/{len(digests)}):")
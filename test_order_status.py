@@ -0,0 +1,102 @@
+# test_order_status.py
+import asyncio
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+import database
+import reservations
+import order_status
+from models import Base, Product, PaymentOutbox
+from catalog_index import CatalogIndex
+from order_status import OrderStatusCache, parse_status_query, _orders_statement
+
+USER = "whatsapp:+628111"
+
+@pytest.fixture
+def shop(tmp_path, monkeypatch):
+    """DB SQLite sementara berisi satu produk, dipakai database/reservations/order_status, cache bersih."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'shop.db'}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = Session()
+    db.add(Product(id=1, name="kemeja flanel", stock=100, colors=["merah"]))
+    db.commit()
+    db.close()
+    catalog = CatalogIndex([{"id": 1, "name": "kemeja flanel", "stock": 100, "colors": ["merah"]}])
+    cache = OrderStatusCache(ttl_seconds=60)
+    for module in (database, reservations, order_status):
+        monkeypatch.setattr(module, "SessionLocal", Session)
+    monkeypatch.setattr(database, "get_catalog_index", lambda: catalog)
+    monkeypatch.setattr(reservations, "catalog_index", catalog)
+    for module in (database, reservations, order_status):
+        monkeypatch.setattr(module, "order_status_cache", cache)
+    monkeypatch.setattr(order_status, "ASYNC_DB_ENABLED", False)
+    return engine, cache
+
+def order(quantity, user=USER):
+    order_id, _, error = database._insert_order("kemeja flanel", quantity, user)
+    assert error is None
+    return order_id
+
+@pytest.mark.parametrize("text, expected", [
+    ("", (None, None, None)),
+    ("order-12 sudah lunas?", (12, 'paid', None)),
+    ("yang belum dibayar", (None, 'pending', None)),
+    ("sebelum order-40", (None, None, 40)),
+    ("batal sebelum #7", (None, 'cancelled', 7)),
+])
+def test_parse_input_tool(text, expected):
+    assert parse_status_query(text) == expected
+
+def test_terbaru_dulu_dengan_halaman_keyset(shop):
+    ids = [order(i) for i in range(1, 6)]
+    first = order_status.get_order_status("", USER)
+    assert first.index(f"order-{ids[4]}") < first.index(f"order-{ids[2]}")
+    assert f"order-{ids[1]}" not in first and f"sebelum order-{ids[2]}" in first
+    second = order_status.get_order_status(f"sebelum order-{ids[2]}", USER)
+    assert f"order-{ids[1]}" in second and f"order-{ids[0]}" in second and "Masih ada" not in second
+    assert "Tidak ada pesanan yang lebih lama" in order_status.get_order_status(f"sebelum order-{ids[0]}", USER)
+
+def test_order_nomor_lain_tidak_terlihat(shop):
+    other = order(1, user="whatsapp:+628999")
+    assert "tidak ditemukan" in order_status.get_order_status(f"order-{other}", USER)
+    assert "Belum ada pesanan" in order_status.get_order_status("", USER)
+
+def test_cache_dibuang_saat_order_dan_pembayaran(shop):
+    engine, cache = shop
+    assert "Belum ada pesanan" in order_status.get_order_status("", USER)
+    order_id = order(2)  # create_order menulis -> cache nomor ini dibuang
+    answer = order_status.get_order_status("", USER)
+    assert "menunggu pembayaran" in answer and "Link pembayaran sedang dikirim" in answer
+    assert order_status.get_order_status("", USER) == answer and cache.hits == 1
+
+    reservations.confirm_payment(order_id)
+    assert "lunas" in order_status.get_order_status("", USER)
+    assert "lunas" in asyncio.run(order_status.aget_order_status("", USER))
+
+def test_link_pembayaran_ditampilkan(shop):
+    engine, _ = shop
+    order_id = order(1)
+    with engine.begin() as conn:
+        conn.execute(PaymentOutbox.__table__.update().where(PaymentOutbox.order_id == order_id)
+                     .values(payment_url="https://snap.test/x", status="sent"))
+    order_status.order_status_cache.invalidate(USER)
+    assert "Link pembayaran: https://snap.test/x" in order_status.get_order_status("belum bayar", USER)
+
+def test_jawaban_basi_tidak_disimpan():
+    cache = OrderStatusCache(ttl_seconds=60)
+    version = cache.version()
+    cache.invalidate(USER)  # Order ditulis selagi query berjalan
+    cache.put(USER, (None, None, None), "basi", version)
+    assert cache.get(USER, (None, None, None)) is None
+
+@pytest.mark.parametrize("kwargs, index", [
+    ({}, "ix_orders_user_number_id"),
+    ({"status": "pending", "before_id": 10}, "ix_orders_user_number_status_id"),
+])
+def test_query_pakai_index_tanpa_sort(shop, kwargs, index):
+    engine, _ = shop
+    stmt = _orders_statement(USER, **kwargs).compile(engine, compile_kwargs={"literal_binds": True})
+    with engine.connect() as conn:
+        plan = " ".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {stmt}")))
+    assert index in plan and "TEMP B-TREE" not in plan
@@ -0,0 +1,152 @@
+# test_payment_outbox.py
+import time
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import database
+import reservations
+import payment_outbox
+from models import Base, Product, Order, PaymentOutbox
+from catalog_index import CatalogIndex
+
+class FakeSnap:
+    """Snap palsu: gagal sebanyak `failures` kali dulu, lalu balas redirect_url."""
+    def __init__(self, failures=0, error="Midtrans timeout"):
+        self.failures = failures
+        self.error = error
+        self.order_ids = []
+        self.statuses = {}  # order_id -> respons status transaksi
+        self.transactions = self
+
+    def status(self, order_ref):
+        if order_ref not in self.statuses:
+            raise RuntimeError("404 Transaction doesn't exist.")
+        return self.statuses[order_ref]
+
+    def create_transaction(self, payload):
+        self.order_ids.append(payload['transaction_details']['order_id'])
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError(self.error)
+        return {"redirect_url": f"https://snap.test/{payload['transaction_details']['order_id']}"}
+
+class FakeSender:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.sent = []
+
+    def __call__(self, to, body):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Twilio 503")
+        self.sent.append((to, body))
+
+@pytest.fixture
+def shop(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'shop.db'}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = Session()
+    db.add(Product(id=1, name="kemeja flanel", stock=10, colors=["merah"]))
+    db.commit()
+    db.close()
+    catalog = CatalogIndex([{"id": 1, "name": "kemeja flanel", "stock": 10, "colors": ["merah"]}])
+    for module in (database, reservations, payment_outbox):
+        monkeypatch.setattr(module, "SessionLocal", Session)
+    monkeypatch.setattr(database, "get_catalog_index", lambda: catalog)
+    monkeypatch.setattr(reservations, "catalog_index", catalog)
+    monkeypatch.setattr(payment_outbox, "backoff_seconds", lambda attempts: 0.0)  # Retry langsung jatuh tempo
+    return Session
+
+def outbox_row(Session, order_id):
+    db = Session()
+    try:
+        return db.query(PaymentOutbox).filter_by(order_id=order_id).one()
+    finally:
+        db.close()
+
+def test_order_langsung_dikonfirmasi_tanpa_memanggil_snap(shop):
+    reply = database.create_order("kemeja flanel 2", "whatsapp:+6281")
+    assert "berhasil dicatat (order-1)" in reply and "http" not in reply
+    row = outbox_row(shop, 1)
+    assert row.status == "pending" and row.payload['transaction_details']['order_id'] == "order-1"
+
+def test_nomor_tidak_valid_membatalkan_reservasi(shop):
+    reply = database.create_order("kemeja flanel 2", "whatsapp:6281")
+    assert "nomor telepon tidak valid" in reply
+    db = shop()
+    assert db.get(Product, 1).stock == 10 and db.query(Order).count() == 0 and db.query(PaymentOutbox).count() == 0
+    db.close()
+
+def test_worker_retry_lalu_kirim_link(shop):
+    database.create_order("kemeja flanel 1", "whatsapp:+6281")
+    snap, sender = FakeSnap(failures=2), FakeSender()
+    for _ in range(3):
+        payment_outbox.run_once(snap, sender)
+    assert snap.order_ids == ["order-1"] * 3  # Idempotensi: order_id Snap tetap order-{id}
+    assert sender.sent == [("whatsapp:+6281", payment_outbox.payment_link_message(1, "https://snap.test/order-1"))]
+    row = outbox_row(shop, 1)
+    assert row.status == "sent" and row.attempts == 3
+    assert payment_outbox.run_once(snap, sender) == 0  # Tidak dikirim ulang
+
+def test_kirim_pesan_gagal_tidak_membuat_transaksi_baru(shop):
+    database.create_order("kemeja flanel 1", "whatsapp:+6281")
+    snap, sender = FakeSnap(), FakeSender(failures=1)
+    payment_outbox.run_once(snap, sender)
+    payment_outbox.run_once(snap, sender)
+    assert snap.order_ids == ["order-1"] and len(sender.sent) == 1
+
+def test_gagal_permanen_membatalkan_order(shop):
+    database.create_order("kemeja flanel 4", "whatsapp:+6281")
+    snap, sender = FakeSnap(failures=payment_outbox.PAYMENT_OUTBOX_MAX_ATTEMPTS), FakeSender()
+    for _ in range(payment_outbox.PAYMENT_OUTBOX_MAX_ATTEMPTS):
+        payment_outbox.run_once(snap, sender)
+    assert outbox_row(shop, 1).status == "failed"
+    db = shop()
+    assert db.get(Order, 1).status == "cancelled" and db.get(Product, 1).stock == 10
+    db.close()
+    assert sender.sent == [("whatsapp:+6281", payment_outbox.payment_failed_message(1))]
+
+DUPLICATE = "transaction_details.order_id sudah digunakan"
+
+def test_duplikat_mengirim_link_yang_sudah_ada(shop):
+    database.create_order("kemeja flanel 1", "whatsapp:+6281")
+    stale = payment_outbox.claim_batch(lease_seconds=60)[0]  # Worker lambat, lease-nya lewat
+    snap, sender = FakeSnap(failures=1, error=DUPLICATE), FakeSender()
+    [entry] = payment_outbox.claim_batch(now=time.time() + 61)
+    assert payment_outbox.process_entry(entry, snap, sender) == "pending"  # Link belum tersimpan: tunggu, bukan batal
+
+    # Worker lambat selesai: link tersimpan, tapi hasilnya tidak menimpa baris yang sudah diklaim ulang
+    assert payment_outbox.process_entry(stale, FakeSnap(), sender) == "stale"
+    assert sender.sent == [] and outbox_row(shop, 1).status == "pending"
+    payment_outbox.run_once(FakeSnap(failures=1, error=DUPLICATE), sender)
+    assert sender.sent == [("whatsapp:+6281", payment_outbox.payment_link_message(1, "https://snap.test/order-1"))]
+    assert outbox_row(shop, 1).status == "sent"
+    db = shop()
+    assert db.get(Order, 1).status == "pending" and db.get(Product, 1).stock == 9
+    db.close()
+
+def test_duplikat_tanpa_link_tidak_membatalkan_order(shop):
+    database.create_order("kemeja flanel 1", "whatsapp:+6281")
+    snap, sender = FakeSnap(failures=10, error=DUPLICATE), FakeSender()
+    for _ in range(payment_outbox.PAYMENT_OUTBOX_MAX_ATTEMPTS):
+        payment_outbox.run_once(snap, sender)
+    assert outbox_row(shop, 1).status == "failed"
+    db = shop()
+    assert db.get(Order, 1).status == "pending" and db.get(Product, 1).stock == 9
+    db.close()
+    assert sender.sent == [("whatsapp:+6281", payment_outbox.payment_link_delayed_message(1))]
+
+def test_duplikat_sudah_dibayar(shop):
+    database.create_order("kemeja flanel 1", "whatsapp:+6281")
+    snap, sender = FakeSnap(failures=1, error=DUPLICATE), FakeSender()
+    snap.statuses["order-1"] = {"transaction_status": "settlement"}
+    payment_outbox.run_once(snap, sender)
+    assert outbox_row(shop, 1).status == "sent" and sender.sent == []
+
+def test_lease_kedaluwarsa_diklaim_ulang(shop):
+    database.create_order("kemeja flanel 1", "whatsapp:+6281")
+    assert len(payment_outbox.claim_batch(lease_seconds=60)) == 1
+    assert payment_outbox.claim_batch(lease_seconds=60) == []  # Masih dipegang worker lain
+    reclaimed = payment_outbox.claim_batch(now=time.time() + 61)
+    assert [entry['attempts'] for entry in reclaimed] == [2]
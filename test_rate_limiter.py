@@ -0,0 +1,47 @@
+# test_rate_limiter.py
+import asyncio
+import pytest
+from rate_limiter import TokenBucketLimiter, SqliteRateLimiter
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_limiter(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "sqlite":
+            return SqliteRateLimiter(str(tmp_path / "ratelimit.db"), **kwargs)
+        return TokenBucketLimiter(**kwargs)
+    return make
+
+def test_burst_lalu_isi_ulang_bertahap(make_limiter):
+    limiter = make_limiter(capacity=5, window_seconds=60)
+    assert [limiter.allow("a", now=100.0) for _ in range(6)] == [True] * 5 + [False]
+    assert limiter.allow("b", now=100.0)  # Nomor lain punya bucket sendiri
+    assert not limiter.allow("a", now=111.0)  # Belum genap satu token (12 detik per token)
+    assert limiter.allow("a", now=112.5)
+    assert not limiter.allow("a", now=112.6)
+
+def test_bucket_idle_dihapus_tanpa_mengubah_hasil():
+    limiter = TokenBucketLimiter(capacity=5, window_seconds=60)
+    for i in range(1000):
+        limiter.allow(f"user{i}", now=float(i))
+    # Hanya pengirim dalam 60 detik terakhir yang tersisa
+    assert len(limiter) <= 62
+    assert all(limiter.allow("user0", now=2000.0) for _ in range(5))
+
+def test_batas_ukuran_map():
+    limiter = TokenBucketLimiter(capacity=5, window_seconds=60, max_entries=100)
+    for i in range(1000):
+        limiter.allow(f"user{i}", now=0.0)
+    assert len(limiter) == 100 and limiter.evicted == 900
+
+def test_sqlite_satu_limit_untuk_semua_worker(tmp_path):
+    path = str(tmp_path / "ratelimit.db")
+    worker_a, worker_b = SqliteRateLimiter(path, capacity=5, window_seconds=60), SqliteRateLimiter(path, capacity=5, window_seconds=60)
+    results = [(worker_a if i % 2 else worker_b).allow("a", now=100.0) for i in range(8)]
+    assert results.count(True) == 5
+    assert worker_b.prune(now=161.0) == 1 and len(worker_a) == 0
+
+def test_aallow_memakai_bucket_yang_sama(make_limiter):
+    limiter = make_limiter(capacity=2, window_seconds=60)
+    async def burst():
+        return [await limiter.aallow("a") for _ in range(3)]
+    assert asyncio.run(burst()) == [True, True, False]
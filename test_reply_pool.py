@@ -0,0 +1,75 @@
+# test_reply_pool.py
+import asyncio
+from reply_pool import ReplyWorkerPool
+
+class SlowHandler:
+    """Handler palsu: catat urutan giliran, puncak paralel, dan run paralel per nomor."""
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.turns = []
+        self.active = set()
+        self.peak = 0
+        self.overlaps = 0
+        self.shed = []
+
+    async def __call__(self, user_number, text, media_url=None):
+        if user_number in self.active:
+            self.overlaps += 1
+        self.active.add(user_number)
+        self.peak = max(self.peak, len(self.active))
+        await asyncio.sleep(self.delay)
+        self.active.discard(user_number)
+        self.turns.append((user_number, text))
+
+    async def on_shed(self, user_number):
+        self.shed.append(user_number)
+
+def test_batas_paralel_dan_urutan_per_nomor():
+    handler = SlowHandler()
+
+    async def scenario():
+        pool = ReplyWorkerPool(handler, handler.on_shed, workers=2, max_queue=100)
+        for i in range(3):
+            for user in ("a", "b", "c", "d"):
+                assert pool.submit(user, f"{user}{i}")
+        await pool.drain()
+        return pool
+
+    pool = asyncio.run(scenario())
+    assert handler.peak == 2 and handler.overlaps == 0
+    for user in ("a", "b", "c", "d"):
+        assert [text for u, text in handler.turns if u == user] == [f"{user}0", f"{user}1", f"{user}2"]
+    assert pool.stats() == {"depth": 0, "running": 0, "completed": 12, "failed": 0, "shed": 0}
+
+def test_antrian_penuh_dijawab_sebentar_ya():
+    handler = SlowHandler(delay=0.05)
+
+    async def scenario():
+        pool = ReplyWorkerPool(handler, handler.on_shed, workers=1, max_queue=2)
+        accepted = [pool.submit(user, "halo") for user in ("a", "b", "c")]
+        await pool.drain()
+        return pool, accepted
+
+    pool, accepted = asyncio.run(scenario())
+    assert accepted == [True, True, False]
+    assert handler.shed == ["c"] and [u for u, _ in handler.turns] == ["a", "b"]
+    assert pool.stats()["shed"] == 1
+
+def test_giliran_gagal_tidak_menghentikan_worker():
+    calls = []
+
+    async def flaky(user_number, text, media_url=None):
+        calls.append(text)
+        if text == "rusak":
+            raise RuntimeError("LLM timeout")
+
+    async def scenario():
+        pool = ReplyWorkerPool(flaky, None, workers=1, max_queue=10)
+        pool.submit("a", "rusak")
+        pool.submit("a", "lanjut")
+        await pool.drain()
+        return pool
+
+    pool = asyncio.run(scenario())
+    assert calls == ["rusak", "lanjut"]
+    assert pool.failed == 1 and pool.completed == 1
@@ -0,0 +1,123 @@
+# test_reservations.py
+import time
+import asyncio
+import hashlib
+import threading
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+import database
+import reservations
+from models import Base, Product, Order, migrate_schema, create_async_session_factory
+from lazy import Lazy
+from catalog_index import CatalogIndex
+
+@pytest.fixture
+def shop(tmp_path, monkeypatch):
+    """DB SQLite sementara berisi satu produk (stok 10) + index katalognya."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'shop.db'}", connect_args={"timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = Session()
+    db.add(Product(id=1, name="kemeja flanel", stock=10, colors=["merah"]))
+    db.commit()
+    db.close()
+    catalog = CatalogIndex([{"id": 1, "name": "kemeja flanel", "stock": 10, "colors": ["merah"]}])
+    monkeypatch.setattr(database, "SessionLocal", Session)
+    monkeypatch.setattr(database, "get_catalog_index", lambda: catalog)
+    monkeypatch.setattr(reservations, "SessionLocal", Session)
+    monkeypatch.setattr(reservations, "catalog_index", catalog)
+    return Session, catalog
+
+def stock_of(Session):
+    db = Session()
+    try:
+        return db.get(Product, 1).stock
+    finally:
+        db.close()
+
+def test_checkout_paralel_tidak_oversell(shop):
+    Session, catalog = shop
+    results = []
+    def checkout(i):
+        results.append(database._insert_order("kemeja flanel", 1, f"whatsapp:+62{i}"))
+    threads = [threading.Thread(target=checkout, args=(i,)) for i in range(40)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    succeeded = [r for r in results if r[0] is not None]
+    assert len(succeeded) == 10
+    assert all("hanya 0 pcs" in r[2] for r in results if r[0] is None)
+    assert stock_of(Session) == 0 and catalog.get_by_name("kemeja flanel")["stock"] == 0
+
+def test_checkout_async_paralel_tidak_oversell(shop, tmp_path, monkeypatch):
+    pytest.importorskip("aiosqlite")
+    Session, catalog = shop
+    factory = create_async_session_factory(f"sqlite:///{tmp_path / 'shop.db'}")
+    monkeypatch.setattr(database, "AsyncSessionLocal", Lazy("async_db", lambda: factory))
+
+    async def scenario():
+        try:
+            results = await asyncio.gather(*(database._ainsert_order("kemeja flanel", 1, f"whatsapp:+62{i}") for i in range(30)))
+            async with factory() as db:
+                journal_mode = (await db.execute(text("PRAGMA journal_mode"))).scalar()
+            return results, journal_mode
+        finally:
+            await factory.kw["bind"].dispose()
+
+    results, journal_mode = asyncio.run(scenario())
+    assert journal_mode == "wal"  # Pragma dipasang saat connect
+    assert len([r for r in results if r[0] is not None]) == 10
+    assert all("hanya 0 pcs" in r[2] for r in results if r[0] is None)
+    assert stock_of(Session) == 0 and catalog.get_by_name("kemeja flanel")["stock"] == 0
+
+def test_sweeper_melepas_reservasi_kedaluwarsa_per_batch(shop):
+    Session, catalog = shop
+    order_ids = [database._insert_order("kemeja flanel", 2, "whatsapp:+621")[0] for _ in range(4)]
+    assert stock_of(Session) == 2
+    assert reservations.confirm_payment(order_ids[0]) == "paid"
+
+    assert reservations.release_expired_reservations(now=time.time() - 1) == 0  # Belum kedaluwarsa
+    assert reservations.release_expired_reservations(now=time.time() + 10 ** 6, batch_size=2) == 3
+
+    db = Session()
+    statuses = [db.get(Order, order_id).status for order_id in order_ids]
+    db.close()
+    assert statuses == ["paid", "expired", "expired", "expired"]
+    assert stock_of(Session) == 8 and catalog.get_by_name("kemeja flanel")["stock"] == 8
+
+def test_bayar_setelah_kedaluwarsa_reservasi_ulang(shop):
+    Session, _ = shop
+    order_id, _, _ = database._insert_order("kemeja flanel", 10, "whatsapp:+621")
+    reservations.release_expired_reservations(now=time.time() + 10 ** 6)
+    assert stock_of(Session) == 10
+    assert reservations.confirm_payment(order_id) == "paid"
+    assert stock_of(Session) == 0
+    assert reservations.confirm_payment(order_id) == "paid"  # Notifikasi ganda tidak memotong stok lagi
+    assert stock_of(Session) == 0
+
+def test_notifikasi_midtrans(shop):
+    Session, _ = shop
+    order_id, _, _ = database._insert_order("kemeja flanel", 3, "whatsapp:+621")
+    notification = {"order_id": f"order-{order_id}", "status_code": "202", "gross_amount": "150000.00", "transaction_status": "expire"}
+    raw = notification["order_id"] + notification["status_code"] + notification["gross_amount"] + "server-key"
+    notification["signature_key"] = hashlib.sha512(raw.encode()).hexdigest()
+
+    assert reservations.verify_midtrans_signature(notification, "server-key")
+    assert not reservations.verify_midtrans_signature(dict(notification, gross_amount="1.00"), "server-key")
+    for signature in (None, 12345, "é" * 128):  # Tipe/isi aneh ditolak, tidak error
+        assert not reservations.verify_midtrans_signature(dict(notification, signature_key=signature), "server-key")
+    assert reservations.handle_payment_notification(notification) == "expired"
+    assert stock_of(Session) == 10
+
+def test_migrasi_menambah_kolom_ke_tabel_lama(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE orders (id INTEGER PRIMARY KEY, user_number VARCHAR, product_name VARCHAR, quantity INTEGER, status VARCHAR)")
+        conn.exec_driver_sql("INSERT INTO orders (user_number, product_name, quantity, status) VALUES ('x', 'kemeja flanel', 1, 'pending')")
+    migrate_schema(engine)
+    with engine.connect() as conn:
+        row = conn.exec_driver_sql("SELECT status, product_id, reserved_until FROM orders").one()
+    assert tuple(row) == ("pending", None, None)  # Order lama tidak pernah disapu sweeper
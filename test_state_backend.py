@@ -0,0 +1,89 @@
+# test_state_backend.py
+import pytest
+from cryptography.fernet import Fernet
+from history_store import HistoryStore
+from rate_limiter import TokenBucketLimiter
+from state_backend import MemoryStateBackend, SqliteStateBackend, default_state, merge_state
+from utils import choose_follow_up
+
+CIPHER = Fernet(Fernet.generate_key())
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_backend(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "sqlite":
+            return SqliteStateBackend(str(tmp_path / "state.db"), history=HistoryStore(path="", cipher=CIPHER), **kwargs)
+        limiter = TokenBucketLimiter(capacity=kwargs.get("capacity", 5), window_seconds=60)
+        return MemoryStateBackend(limiter=limiter, history=HistoryStore(path="", cipher=CIPHER))
+    return make
+
+def test_state_baru_berisi_default(make_backend):
+    turn = make_backend().load_turn("whatsapp:+621")
+    assert turn.allowed and turn.state == default_state() and turn.history_summary == ""
+
+def test_state_dan_riwayat_terlihat_setelah_save(make_backend):
+    backend = make_backend()
+    turn = backend.load_turn("a")
+    turn.state['preferences']['name'] = "Andi"
+    turn.state['preferences']['favorites'].append("flanel")
+    assert backend.load_turn("a").state['preferences']['name'] is None
+    backend.save_turn(turn, "nama saya andi", "Halo Kak Andi")
+    loaded = backend.load_turn("a")
+    assert loaded.state['preferences'] == {'name': "Andi", 'favorites': ["flanel"], 'last_product': None}
+    assert loaded.history_summary == "Pelanggan: nama saya andi | Respons: Halo Kak Andi"
+
+def test_rate_limit_diambil_saat_load(make_backend):
+    backend = make_backend(capacity=2)
+    assert [backend.load_turn("a", now=100.0).allowed for _ in range(3)] == [True, True, False]
+    assert backend.load_turn("b", now=100.0).allowed
+
+def test_giliran_balapan_tidak_saling_menimpa(make_backend):
+    backend = make_backend()
+    first, second = backend.load_turn("a"), backend.load_turn("a")  # Dua worker memuat versi yang sama
+    first.state['preferences']['name'] = "Andi"
+    first.state['follow_ups']["Mau lihat warna lain?"] = 1
+    second.state['preferences']['last_product'] = "kemeja flanel"
+    second.state['preferences']['favorites'].append("flanel")
+    backend.save_turn(first, "nama saya andi", "Halo Kak Andi")
+    backend.save_turn(second, "stok flanel?", "Stok kemeja flanel ada 15")
+    state = backend.load_turn("a").state
+    assert state['preferences'] == {'name': "Andi", 'favorites': ["flanel"], 'last_product': "kemeja flanel"}
+    assert state['follow_ups'] == {"Mau lihat warna lain?": 1}
+
+def test_sqlite_dibagi_antar_worker(tmp_path):
+    path = str(tmp_path / "state.db")
+    worker_a = SqliteStateBackend(path, history=HistoryStore(path="", cipher=CIPHER))
+    worker_b = SqliteStateBackend(path, history=HistoryStore(path="", cipher=CIPHER))
+    turn = worker_a.load_turn("a", now=100.0)
+    turn.state['preferences']['name'] = "Budi"
+    worker_a.save_turn(turn, "halo", "hai", now=100.0)
+    loaded = worker_b.load_turn("a", now=100.0)
+    assert loaded.state['preferences']['name'] == "Budi" and loaded.history_summary == "Pelanggan: halo | Respons: hai"
+    assert worker_b.history.decryptions == 2  # Worker lain mendekripsi riwayat sendiri
+    assert sum(worker_b.load_turn("a", now=100.0).allowed for _ in range(5)) == 3  # Bucket yang sama (5 per menit)
+
+def test_sqlite_prune_state_riwayat_dan_bucket(tmp_path):
+    backend = SqliteStateBackend(str(tmp_path / "state.db"), history=HistoryStore(path="", cipher=CIPHER), ttl_seconds=3600,
+                                 history_ttl_seconds=3600)
+    backend.save_turn(backend.load_turn("a", now=100.0), "halo", "hai", now=100.0)
+    backend.prune(now=100.0 + 3601)
+    assert len(backend) == 0
+    assert backend.conn.execute("SELECT COUNT(*) FROM history").fetchone()[0] == 0
+    assert backend.conn.execute("SELECT COUNT(*) FROM rate_buckets").fetchone()[0] == 0
+
+def test_memory_dibatasi_lru():
+    backend = MemoryStateBackend(max_users=2, history=HistoryStore(path="", cipher=CIPHER))
+    for user_number in ("a", "b", "c"):
+        backend.save_turn(backend.load_turn(user_number), "halo", "hai")
+    assert len(backend) == 2
+
+def test_merge_tiga_arah():
+    base = {'preferences': {'name': None, 'favorites': []}, 'follow_ups': {"x": 1, "y": 1}}
+    ours = {'preferences': {'name': "Andi", 'favorites': []}, 'follow_ups': {"z": 1}}  # Hitungan di-reset lalu dipakai lagi
+    theirs = {'preferences': {'name': None, 'favorites': ["chino"]}, 'follow_ups': {"x": 1, "y": 1}}
+    assert merge_state(base, ours, theirs) == {'preferences': {'name': "Andi", 'favorites': ["chino"]}, 'follow_ups': {"z": 1}}
+
+def test_follow_up_memakai_hitungan_dari_state():
+    counts = {}
+    seen = {choose_follow_up('id', "halo", "Halo Kak", "a", counts) for _ in range(3)}
+    assert len(seen) == 3 and sum(counts.values()) == 3  # Tiga template berbeda sebelum diulang